@@ -0,0 +1,77 @@
+"""
+Benchmark utils.bulk_load.copy_dataframe against DataFrame.to_sql.
+Writes synthetic rows with UUID, UUID[], JSONB and TIMESTAMPTZ columns into a
+temporary table (dropped at the end of each transaction) and prints rows/sec.
+
+Usage: python benchmarks/bulk_load_vs_to_sql.py [n_rows ...]
+"""
+import json
+import sys
+import time
+import uuid
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import ARRAY, UUID, text
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from utils.bulk_load import copy_dataframe
+from utils.db import get_engine
+
+DDL_BENCH = """
+CREATE TEMP TABLE bench_bulk_load (
+    load_id UUID PRIMARY KEY,
+    order_ids UUID[] NOT NULL DEFAULT '{}',
+    qty INTEGER,
+    weight_lbs DECIMAL(10,2),
+    payload JSONB,
+    created_at TIMESTAMPTZ,
+    source_event_id BIGINT
+) ON COMMIT DROP
+"""
+
+
+def make_frame(n_rows):
+    rng = np.random.default_rng(0)
+    return pd.DataFrame({
+        "load_id": [str(uuid.uuid4()) for _ in range(n_rows)],
+        "order_ids": [[str(uuid.uuid4()) for _ in range(k)] for k in rng.integers(1, 4, n_rows)],
+        "qty": rng.integers(1, 500, n_rows),
+        "weight_lbs": rng.uniform(10, 40000, n_rows).round(2),
+        "payload": [json.dumps({"route_id": f"R-{i % 50}", "pieces": int(i % 7)}) for i in range(n_rows)],
+        "created_at": pd.Timestamp("2024-01-01", tz="UTC") + pd.to_timedelta(rng.integers(0, 86400 * 365, n_rows), unit="s"),
+        "source_event_id": np.arange(n_rows),
+    })
+
+
+def time_to_sql(engine, df):
+    with engine.begin() as conn:
+        conn.execute(text(DDL_BENCH))
+        start = time.perf_counter()
+        df.to_sql("bench_bulk_load", conn, if_exists="append", index=False,
+                  dtype={"order_ids": ARRAY(UUID(as_uuid=True))})
+        return time.perf_counter() - start
+
+
+def time_copy(engine, df):
+    with engine.begin() as conn:
+        conn.execute(text(DDL_BENCH))
+        start = time.perf_counter()
+        copy_dataframe(conn, df, "bench_bulk_load", json_columns=["payload"])
+        return time.perf_counter() - start
+
+
+def main(sizes):
+    engine = get_engine()
+    print(f"{'rows':>10} {'to_sql rows/s':>15} {'COPY rows/s':>15} {'speedup':>8}")
+    for n_rows in sizes:
+        df = make_frame(n_rows)
+        t_to_sql = time_to_sql(engine, df)
+        t_copy = time_copy(engine, df)
+        print(f"{n_rows:>10} {n_rows / t_to_sql:>15,.0f} {n_rows / t_copy:>15,.0f} {t_to_sql / t_copy:>7.1f}x")
+    engine.dispose()
+
+
+if __name__ == "__main__":
+    main([int(n) for n in sys.argv[1:]] or [10000, 100000])
@@ -0,0 +1,170 @@
+"""
+Benchmark the mart refresh backends on mart_orders_by_customer_month:
+TRUNCATE+INSERT ('full'), shadow table + rename ('swap') and a materialized
+view refreshed CONCURRENTLY ('matview').
+
+Runs in a scratch schema (mart_bench, dropped at the end) placed first on the
+search_path, with synthetic stg_orders / dim_customers. Before each timed
+refresh 1% new orders are appended. A reader thread queries the mart for the
+whole refresh; its slowest read is how long readers were blocked.
+
+Usage: python benchmarks/mart_backends.py [n_orders ...]
+"""
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+
+from sqlalchemy import create_engine, text
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from utils.db import database_url
+from utils.init_marts import (
+    DDL_MART_ORDERS_BY_CUSTOMER_MONTH,
+    DDL_MART_ORDERS_BY_CUSTOMER_MONTH_IX,
+    DDL_MART_ORDERS_BY_CUSTOMER_MONTH_IX2,
+    INSERT_MART_ORDERS_BY_CUSTOMER_MONTH,
+    matview_ddl,
+    matview_unique_index_ddl,
+    rebuild_mart_swap,
+    refresh_matview,
+)
+
+SCHEMA = "mart_bench"
+MART = "mart_orders_by_customer_month"
+N_CUSTOMERS = 1000
+
+DDL_SOURCES = [
+    """
+    CREATE TABLE dim_customers (
+        customer_id VARCHAR(100) PRIMARY KEY,
+        company_name VARCHAR(255),
+        region VARCHAR(100)
+    )
+    """,
+    """
+    CREATE TABLE stg_orders (
+        order_id UUID PRIMARY KEY,
+        customer_id VARCHAR(100),
+        product_id VARCHAR(100),
+        order_date TIMESTAMPTZ,
+        qty INTEGER,
+        unit_price DECIMAL(10,2),
+        line_total DECIMAL(12,2),
+        source_event_id BIGINT
+    )
+    """,
+    f"""
+    INSERT INTO dim_customers
+    SELECT 'C-' || g, 'Customer ' || g, (ARRAY['NA', 'EU', 'APAC'])[1 + g % 3]
+    FROM generate_series(0, {N_CUSTOMERS - 1}) g
+    """,
+]
+
+ADD_ORDERS = f"""
+INSERT INTO stg_orders
+SELECT gen_random_uuid(), 'C-' || (g % {N_CUSTOMERS}), 'P-' || (g % 50),
+       TIMESTAMPTZ '2022-01-01' + (random() * 1095) * INTERVAL '1 day',
+       q, 10.00, q * 10.00, g
+FROM (SELECT g, 1 + (random() * 99)::INTEGER AS q FROM generate_series(:first, :last) g) s
+"""
+
+
+def add_orders(engine, first, n):
+    with engine.begin() as conn:
+        conn.execute(text(ADD_ORDERS), {"first": first, "last": first + n - 1})
+        conn.execute(text("ANALYZE stg_orders"))
+    return first + n
+
+
+def refresh_full(engine):
+    with engine.begin() as conn:
+        conn.execute(text(f"TRUNCATE {MART}"))
+        conn.execute(text(INSERT_MART_ORDERS_BY_CUSTOMER_MONTH))
+
+
+def refresh_swap(engine):
+    rebuild_mart_swap(engine, MART, INSERT_MART_ORDERS_BY_CUSTOMER_MONTH)
+
+
+def refresh_concurrent(engine):
+    with engine.begin() as conn:
+        refresh_matview(conn, MART)
+
+
+def timed_with_reader(engine, refresh):
+    """Run refresh while a reader queries the mart. Returns (refresh seconds,
+    slowest read seconds, reads completed)."""
+    stop = threading.Event()
+    latencies = []
+
+    def reader():
+        with engine.connect() as conn:
+            while not stop.is_set():
+                started = time.perf_counter()
+                conn.execute(text(f"SELECT COUNT(*) FROM {MART} WHERE year = 2023 AND month = 6")).scalar()
+                conn.commit()
+                latencies.append(time.perf_counter() - started)
+
+    thread = threading.Thread(target=reader)
+    thread.start()
+    time.sleep(0.1)
+    started = time.perf_counter()
+    try:
+        refresh(engine)
+    finally:
+        seconds = time.perf_counter() - started
+        stop.set()
+        thread.join()
+    return seconds, max(latencies, default=0.0), len(latencies)
+
+
+def bench_size(engine, n_orders):
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+        conn.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+        for ddl in DDL_SOURCES:
+            conn.execute(text(ddl))
+    next_id = add_orders(engine, 1, n_orders)
+    delta = max(n_orders // 100, 1)
+    results = []
+
+    with engine.begin() as conn:
+        for ddl in (DDL_MART_ORDERS_BY_CUSTOMER_MONTH, DDL_MART_ORDERS_BY_CUSTOMER_MONTH_IX, DDL_MART_ORDERS_BY_CUSTOMER_MONTH_IX2):
+            conn.execute(text(ddl))
+        conn.execute(text(INSERT_MART_ORDERS_BY_CUSTOMER_MONTH))
+    for backend, refresh in (("full", refresh_full), ("swap", refresh_swap)):
+        next_id = add_orders(engine, next_id, delta)
+        results.append((backend, *timed_with_reader(engine, refresh)))
+
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP TABLE {MART}"))
+        conn.execute(text(matview_ddl(MART, INSERT_MART_ORDERS_BY_CUSTOMER_MONTH)))
+        for ddl in (matview_unique_index_ddl(MART), DDL_MART_ORDERS_BY_CUSTOMER_MONTH_IX, DDL_MART_ORDERS_BY_CUSTOMER_MONTH_IX2):
+            conn.execute(text(ddl))
+        refresh_matview(conn, MART)
+    next_id = add_orders(engine, next_id, delta)
+    results.append(("matview", *timed_with_reader(engine, refresh_concurrent)))
+    return results
+
+
+def main(sizes):
+    # Own engine rather than the shared one: every connection needs the scratch search_path
+    engine = create_engine(
+        database_url(),
+        connect_args={"sslmode": os.getenv("DB_SSL", "require"), "options": f"-csearch_path={SCHEMA},public"},
+    )
+    print(f"{'orders':>10} {'backend':>8} {'refresh s':>10} {'max read ms':>12} {'reads':>7}")
+    try:
+        for n_orders in sizes:
+            for backend, seconds, slowest, reads in bench_size(engine, n_orders):
+                print(f"{n_orders:>10} {backend:>8} {seconds:>10.2f} {slowest * 1000:>12.1f} {reads:>7}")
+    finally:
+        with engine.begin() as conn:
+            conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main([int(n) for n in sys.argv[1:]] or [100000, 1000000])
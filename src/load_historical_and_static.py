@@ -1,14 +1,19 @@
-import os
+import sys
 import json
 import pandas as pd
-from sqlalchemy import create_engine
+from pathlib import Path
 from dotenv import load_dotenv
-from urllib.parse import quote_plus
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from utils.db import get_engine
+from utils.event_stream import (
+    DEFAULT_BATCH_SIZE, PARSE_WORKERS, columns_to_frame, copy_events, iter_parsed_ranges,
+    iter_tail_batches, split_byte_ranges,
+)
+from utils.partitions import ensure_partitions_for
+from utils.unpack_ledger import lock_fact_events_loads, note_loaded
 
 load_dotenv()
-encoded_password = quote_plus(os.getenv('DB_PASSWORD'))
-db_string = f"postgresql://{os.getenv('DB_USER')}:{encoded_password}@{os.getenv('DB_HOST')}:{os.getenv('DB_PORT')}/{os.getenv('DB_NAME')}?sslmode={os.getenv('DB_SSL')}"
-engine = create_engine(db_string)
 
 with open('../data/raw/inventory.json') as f:
     inventory_data = json.load(f)
@@ -17,12 +22,12 @@ df_inventory = pd.DataFrame.from_dict(inventory_data, orient='index').reset_inde
 def load_suppliers():
     df_suppliers = pd.read_json('../data/raw/suppliers.json')
     df_suppliers = df_suppliers.rename(columns={'id': 'supplier_id'})
-    df_suppliers.to_sql('dim_suppliers', engine, if_exists='append', index=False)
+    df_suppliers.to_sql('dim_suppliers', get_engine(), if_exists='append', index=False)
     return None
 
 def load_customers():
     df_customers = pd.read_json('../data/raw/customers.json')
-    df_customers.to_sql('dim_customers', engine, if_exists='append', index=False)
+    df_customers.to_sql('dim_customers', get_engine(), if_exists='append', index=False)
     return None
 
 def load_parts():
@@ -30,17 +35,17 @@ def load_parts():
     df_parts = df_parts.merge(df_inventory[['part_id', 'reorder_point', 'safety_stock']], on='part_id', how='left')
     df_parts[['reorder_point', 'safety_stock']] = df_parts[['reorder_point', 'safety_stock']].fillna(0)
     df_parts = df_parts.drop(columns='valid_supplier_ids')
-    df_parts.to_sql('dim_parts', engine, if_exists='append', index=False)
+    df_parts.to_sql('dim_parts', get_engine(), if_exists='append', index=False)
     return None
 
 def load_facilities():
     df_facilities = pd.read_json('../data/raw/facilities.json')
-    df_facilities.to_sql('dim_facilities', engine, if_exists='append', index=False)
+    df_facilities.to_sql('dim_facilities', get_engine(), if_exists='append', index=False)
     return None
 
 def load_products():
     df_products = pd.read_json('../data/raw/products.json')
-    df_products.to_sql('dim_products', engine, if_exists='append', index=False)
+    df_products.to_sql('dim_products', get_engine(), if_exists='append', index=False)
     return None
 
 def load_routes():
@@ -57,28 +62,30 @@ def load_routes():
         all_routes.append(route)
     
     df_routes = pd.DataFrame(all_routes)
-    df_routes.to_sql('dim_routes', engine, if_exists='append', index=False)
+    df_routes.to_sql('dim_routes', get_engine(), if_exists='append', index=False)
     return None
 
-def load_events():
-    valid_records = []
-
-    with open('../data/raw/events/history.jsonl', 'r') as f:
-        for line_no, line in enumerate(f, 1):
-            line = line.strip()
-            if not line:
-                continue
-            try:
-                rec = json.loads(line)
-                valid_records.append(rec)
-            except json.JSONDecodeError:
-                pass     
-
-    df_events = pd.DataFrame(valid_records)
-    df_events["payload"] = df_events["payload"].apply(
-        lambda x: json.dumps(x) if x is not None and isinstance(x, (dict, list)) else x
-    )
-    df_events.to_sql("fact_events", engine, if_exists="append", index=False)
+def load_events(batch_size=DEFAULT_BATCH_SIZE, workers=PARSE_WORKERS):
+    history_path = '../data/raw/events/history.jsonl'
+    n_loaded = 0
+    with get_engine().begin() as conn:
+        lock_fact_events_loads(conn)
+        if workers > 1:
+            tasks = [(history_path, start, end, True) for start, end in split_byte_ranges(history_path)]
+            batches = iter_parsed_ranges(tasks, workers)
+        else:
+            batches = iter_tail_batches(history_path, 0, None, batch_size, allow_partial_last=True)
+        min_ts = None
+        for columns, _, _ in batches:
+            df_events = columns_to_frame(columns)
+            timestamps = pd.to_datetime(df_events['timestamp'], utc=True, errors='coerce', format='ISO8601')
+            ensure_partitions_for(conn, timestamps)
+            if timestamps.notna().any():
+                min_ts = timestamps.min() if min_ts is None else min(min_ts, timestamps.min())
+            n_loaded += copy_events(conn, df_events)
+        if min_ts is not None:
+            note_loaded(conn, min_ts)
+    print(f"Loaded {n_loaded} historical events")
     return None
 
 
@@ -1,113 +1,151 @@
-import os
-import json
-import pandas as pd
-import paramiko
-import re
+import sys
 from datetime import datetime
 from pathlib import Path
-from sqlalchemy import create_engine
 from sqlalchemy import text
 from dotenv import load_dotenv
-from urllib.parse import quote_plus
 
-load_dotenv()
-encoded_password = quote_plus(os.getenv('DB_PASSWORD'))
-db_string = f"postgresql://{os.getenv('DB_USER')}:{encoded_password}@{os.getenv('DB_HOST')}:{os.getenv('DB_PORT')}/{os.getenv('DB_NAME')}?sslmode={os.getenv('DB_SSL')}"
-engine = create_engine(db_string)
-
-key_path = os.path.expanduser(os.getenv('SSH_KEY_PATH'))
-pkey = paramiko.RSAKey.from_private_key_file(key_path)
-client = paramiko.SSHClient()
-client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-client.connect(
-    hostname=os.getenv('REMOTE_HOST'),
-    username=os.getenv('REMOTE_USER'),
-    pkey=pkey,
-)
-
-sftp = client.open_sftp()
-remote_files = sftp.listdir('/home/azureuser/supply-chain-simulator/data/events')
-jsonl_files = [f for f in remote_files if f.endswith('.jsonl') and len(f) == 16]
-
-with engine.connect() as conn:
-    result = conn.execute(text("SELECT MAX(timestamp) FROM fact_events"))
-    max_ts = result.scalar()
-
-remote_events_path = '/home/azureuser/supply-chain-simulator/data/events'
-min_date = max_ts.date() if max_ts else None
-
-for f in jsonl_files:
-    file_date_str = f.replace('.jsonl', '')
-    try:
-        file_date = datetime.strptime(file_date_str, '%Y-%m-%d').date()
-    except ValueError:
-        continue
-    if min_date is not None and file_date < min_date:
-        continue
-    remote_path = f"{remote_events_path}/{f}"
-    local_path = f"data/raw/events/{f}"
-    sftp.get(remote_path, str(local_path))
-
-sftp.close()
-client.close()
-
-DATE_PATTERN = re.compile(r"^\d{4}-\d{2}-\d{2}\.jsonl$")
-file_paths = sorted(
-    p for p in Path('data/raw/events').glob('*.jsonl')
-    if DATE_PATTERN.match(p.name)
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from utils.db import get_engine
+from utils.event_stream import (
+    DEFAULT_BATCH_SIZE, EVENT_COLUMNS, PARSE_WORKERS, columns_to_frame, copy_events, iter_parsed_ranges,
+    iter_tail_batches, split_byte_ranges,
 )
+from utils.ingest_manifest import load_manifest, mtime_to_datetime, save_manifest_entry
+from utils.partitions import ensure_partitions_for
+from utils.sftp_fetch import SFTPPool, fetch_all, legacy_host_from_env, remote_hosts_from_env
+from utils.unpack_ledger import lock_fact_events_loads, note_loaded
 
-if not file_paths:
-    print("No new events files found")
-    exit(0)
+load_dotenv()
 
-def load_new_events(file_paths, max_ts=None):
-    valid_records = []
+local_events_path = Path('data/raw/events')
 
-    for path in file_paths:
-        with open(path, 'r') as f:
-            for line in f:
-                line = line.strip()
-                if not line:
+def bootstrap_watermark(conn):
+    """MAX(fact_events.timestamp) on the first run against a pre-manifest warehouse
+    (ingest_manifest empty), else None. Decided once per run, before any host loads."""
+    if conn.execute(text("SELECT EXISTS (SELECT 1 FROM ingest_manifest)")).scalar():
+        return None
+    return conn.execute(text("SELECT MAX(timestamp) FROM fact_events")).scalar()
+
+def plan_pending(conn, host, fetched, bootstrap_ts=None):
+    """Turn fetch results for one host into manifest entries with unread bytes.
+    With bootstrap_ts, files dated before it are recorded as already ingested."""
+    manifest = load_manifest(conn, host)
+    pending = []
+    for attr, local_path, status, n_bytes in fetched:
+        entry = dict(manifest.get(attr.filename, {'file_name': attr.filename, 'byte_offset': 0, 'line_count': 0}))
+        entry['remote_size'] = attr.st_size
+        entry['remote_mtime'] = mtime_to_datetime(attr.st_mtime)
+        entry['local_path'] = local_path
+        if attr.st_size < entry['byte_offset']:
+            print(f"Skipping {host}:{attr.filename}: remote size {attr.st_size} is below ingested offset {entry['byte_offset']}")
+            continue
+        if attr.filename in manifest and attr.st_size == entry['byte_offset']:
+            continue
+        if bootstrap_ts is not None:
+            file_date = datetime.strptime(attr.filename.replace('.jsonl', ''), '%Y-%m-%d').date()
+            if file_date < bootstrap_ts.date():
+                # Already loaded by the timestamp watermark; record it as fully ingested
+                entry['byte_offset'] = attr.st_size
+                entry['local_path'] = None
+        pending.append(entry)
+    return pending
+
+def iter_pending_batches(pending, batch_size=DEFAULT_BATCH_SIZE, workers=PARSE_WORKERS):
+    """Yield (entry, columnar batch, next_offset, n_lines) for the
+    unread bytes of every pending entry, in file order."""
+    readable = [e for e in pending if e['local_path'] is not None and e['byte_offset'] < e['remote_size']]
+    if workers > 1:
+        tasks, owners = [], []
+        for entry in readable:
+            for start, end in split_byte_ranges(entry['local_path'], entry['byte_offset'], entry['remote_size']):
+                tasks.append((entry['local_path'], start, end))
+                owners.append(entry)
+        for entry, (columns, next_offset, n_lines) in zip(owners, iter_parsed_ranges(tasks, workers)):
+            yield entry, columns, next_offset, n_lines
+        return
+    for entry in readable:
+        batches = iter_tail_batches(entry['local_path'], entry['byte_offset'], entry['remote_size'], batch_size)
+        for columns, next_offset, n_lines in batches:
+            yield entry, columns, next_offset, n_lines
+
+def load_new_events(pending, source_host, max_ts=None, batch_size=DEFAULT_BATCH_SIZE, workers=PARSE_WORKERS):
+    n_loaded = 0
+    n_parsed = 0
+    min_ts = None
+
+    with get_engine().connect() as conn:
+        trans = conn.begin()
+        try:
+            lock_fact_events_loads(conn)
+            for entry, columns, next_offset, n_lines in iter_pending_batches(pending, batch_size, workers):
+                entry['byte_offset'] = next_offset
+                entry['line_count'] += n_lines
+                if not columns['payload']:
                     continue
-                try:
-                    rec = json.loads(line)
-                    valid_records.append(rec)
-                except json.JSONDecodeError:
-                    pass
+                n_parsed += len(columns['payload'])
+                df_events = columns_to_frame(columns, parse_timestamps=True)
+                if max_ts is not None:
+                    df_events = df_events[df_events["timestamp"] > max_ts]
+                if df_events.empty:
+                    continue
+                ensure_partitions_for(conn, df_events["timestamp"])
+                batch_min_ts = df_events["timestamp"].min()
+                min_ts = batch_min_ts if min_ts is None else min(min_ts, batch_min_ts)
+                n_loaded += copy_events(conn, df_events, columns=EVENT_COLUMNS)
+            if min_ts is not None:
+                note_loaded(conn, min_ts)
+            for entry in pending:
+                save_manifest_entry(conn, source_host, entry)
+            trans.commit()
+        except Exception:
+            trans.rollback()
+            raise
 
-    if not valid_records:
+    if not n_parsed:
         print("No new events found")
         return None
-
-    df_events = pd.DataFrame(valid_records)
-    df_events["timestamp"] = pd.to_datetime(df_events["timestamp"], utc=True, errors='coerce')
-    df_events = df_events[~df_events["timestamp"].isna()]
-
-
-    if max_ts is not None:
-        df_events = df_events[df_events["timestamp"] > max_ts]
-    if df_events.empty:
+    if not n_loaded:
         print("No new events after filtering by timestamp")
         return None
 
-    df_events["payload"] = df_events["payload"].apply(
-        lambda x: json.dumps(x) if x is not None and isinstance(x, (dict, list)) else x
-    )
+    return n_loaded
 
-    cols = ['timestamp', 'event_type', 'payload']
-    with engine.connect() as conn:
-        trans = conn.begin()
-        try:
-            df_events[cols].to_sql("fact_events", conn, if_exists='append', index=False)
-            trans.commit()
-        except Exception:
-            trans.rollback()
-            raise
+def main():
+    hosts = remote_hosts_from_env()
+    if not hosts:
+        print("No remote hosts configured (set REMOTE_HOSTS or REMOTE_HOST)")
+        return
+
+    with get_engine().connect() as conn:
+        min_offsets = {h['host']: {f: e['byte_offset'] for f, e in load_manifest(conn, h['host']).items()} for h in hosts}
+        # Only the legacy REMOTE_HOST was loaded by the old timestamp watermark; hosts
+        # added with REMOTE_HOSTS start from offset 0
+        bootstrap_ts = bootstrap_watermark(conn)
+    legacy_host = legacy_host_from_env()
 
-    return len(df_events)
+    pools = [SFTPPool(h) for h in hosts]
+    try:
+        fetched = fetch_all(pools, local_events_path, min_offsets)
+    finally:
+        for pool in pools:
+            pool.close()
+
+    # The legacy host commits first, so a failure elsewhere cannot leave a non-empty
+    # manifest that makes the next run skip its bootstrap
+    for host, results in sorted(fetched.items(), key=lambda item: item[0] != legacy_host):
+        n_bytes = sum(r[3] for r in results)
+        n_skipped = sum(1 for r in results if r[2] == 'skipped')
+        print(f"{host}: fetched {n_bytes} bytes, {n_skipped}/{len(results)} files unchanged")
+
+        host_bootstrap_ts = bootstrap_ts if host == legacy_host else None
+        with get_engine().connect() as conn:
+            pending = plan_pending(conn, host, results, host_bootstrap_ts)
+        if not pending:
+            print(f"{host}: no new events files found")
+            continue
+        n = load_new_events(pending, host, max_ts=host_bootstrap_ts)
+        if n is not None:
+            print(f"{host}: loaded {n} new events")
 
 if __name__ == "__main__":
-    n = load_new_events(file_paths, max_ts=max_ts)
-    if n is not None:
-        print(f"Loaded {n} new events")
+    main()
@@ -1,231 +1,192 @@
 import os
-import json
+import sys
 import pandas as pd
-from sqlalchemy import ARRAY, UUID
-from sqlalchemy import create_engine
+from pathlib import Path
 from sqlalchemy import text
 from dotenv import load_dotenv
-from urllib.parse import quote_plus
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from utils.db import get_engine
+from utils.event_registry import EVENT_TYPES, STAGING_TABLES, partition_events
+from utils.key_cache import KeyCache
+from utils.server_unpack import unpack_in_database
+from utils.staging_writer import write_staging
+from utils.unpack_ledger import (
+    clear_pending, clear_retries, get_pending, get_watermark, load_retry_ids, set_watermark,
+)
 
 load_dotenv()
-encoded_password = quote_plus(os.getenv('DB_PASSWORD'))
-db_string = f"postgresql://{os.getenv('DB_USER')}:{encoded_password}@{os.getenv('DB_HOST')}:{os.getenv('DB_PORT')}/{os.getenv('DB_NAME')}?sslmode={os.getenv('DB_SSL')}"
-engine = create_engine(db_string)
 
-dtype_mapping = {
-    'order_ids': ARRAY(UUID(as_uuid=True))
-}
+# 'pandas' unpacks in this process; 'sql' runs the projections inside Postgres
+UNPACK_ENGINE = os.getenv('UNPACK_ENGINE', 'pandas')
+# Events per chunk read through a server-side cursor; 0 reads the whole backlog at once
+UNPACK_CHUNK_ROWS = int(os.getenv('UNPACK_CHUNK_ROWS', '100000'))
+
+event_types_sql = ",\n            ".join(f"'{t}'" for t in EVENT_TYPES)
+not_staged_sql = "\n        AND ".join(
+    f"NOT EXISTS (SELECT 1 FROM {t} s WHERE s.source_event_id = e.event_id)" for t in STAGING_TABLES
+)
 
-query = """
+# New events above the ledger watermark plus the small set parked for retry;
+# min_ts bounds the new events' timestamps so a partitioned fact_events is pruned
+query = f"""
         SELECT e.event_id, e.timestamp, e.event_type, e.payload
         FROM fact_events e
-        WHERE NOT EXISTS (SELECT 1 FROM stg_orders o WHERE o.source_event_id = e.event_id)
-        AND NOT EXISTS (SELECT 1 FROM stg_backorders b WHERE b.source_event_id = e.event_id)
-        AND NOT EXISTS (SELECT 1 FROM stg_loads l WHERE l.source_event_id = e.event_id)
-        AND NOT EXISTS (SELECT 1 FROM stg_delivery_events d WHERE d.source_event_id = e.event_id)
-        AND NOT EXISTS (SELECT 1 FROM stg_invoices i WHERE i.source_event_id = e.event_id)
-        AND NOT EXISTS (SELECT 1 FROM stg_demand_forecasts df WHERE df.source_event_id = e.event_id)
-        AND NOT EXISTS (SELECT 1 FROM stg_production_jobs pj WHERE pj.source_event_id = e.event_id)
-        AND NOT EXISTS (SELECT 1 FROM stg_purchase_orders po WHERE po.source_event_id = e.event_id)
-        AND NOT EXISTS (SELECT 1 FROM stg_po_receipts pr WHERE pr.source_event_id = e.event_id)
-        AND NOT EXISTS (SELECT 1 FROM stg_backorder_fulfillments bf WHERE bf.source_event_id = e.event_id)
-        AND NOT EXISTS (SELECT 1 FROM stg_shipments s WHERE s.source_event_id = e.event_id)
-        AND NOT EXISTS (SELECT 1 FROM stg_material_requirements mr WHERE mr.source_event_id = e.event_id)
-        AND NOT EXISTS (SELECT 1 FROM stg_production_starts ps WHERE ps.source_event_id = e.event_id)
-        AND NOT EXISTS (SELECT 1 FROM stg_production_completions pc WHERE pc.source_event_id = e.event_id)
-        AND NOT EXISTS (SELECT 1 FROM stg_sop_snapshots ss WHERE ss.source_event_id = e.event_id)
-        AND NOT EXISTS (SELECT 1 FROM stg_payments p WHERE p.source_event_id = e.event_id)
-        AND NOT EXISTS (SELECT 1 FROM stg_reorders r WHERE r.source_event_id = e.event_id)
+        WHERE e.event_id > :watermark
+        AND e.event_id <= :upper
+        AND e.timestamp >= :min_ts
         AND e.event_type IN (
-            'SalesOrderCreated',
-            'BackorderCreated',
-            'LoadCreated',
-            'DeliveryEvent',
-            'InvoiceCreated',
-            'DemandForecastCreated',
-            'ProductionJobCreated',
-            'PurchaseOrderCreated',
-            'PurchaseOrderReceived',
-            'BackorderFulfilled',
-            'ShipmentCreated',
-            'MaterialRequirementsCreated',
-            'ProductionStarted',
-            'ProductionCompleted',
-            'SOPSnapshotCreated',
-            'PaymentReceived',
-            'ReorderTriggered'
+            {event_types_sql}
         )
+        UNION ALL
+        SELECT e.event_id, e.timestamp, e.event_type, e.payload
+        FROM fact_events e
+        JOIN unpack_retry r ON r.event_id = e.event_id
+        WHERE e.event_id <= :watermark
+        ORDER BY event_id
+        """
+
+# Only used once, to seed the ledger on a warehouse staged before it existed
+bootstrap_query = f"""
+        SELECT e.event_id, e.timestamp, e.event_type, e.payload
+        FROM fact_events e
+        WHERE {not_staged_sql}
+        AND e.event_id <= :upper
+        AND e.event_type IN (
+            {event_types_sql}
+        )
+        ORDER BY e.event_id
+        """
+
+def selection(conn):
+    """Return (sql, params, upper) selecting unstaged events up to upper, the new watermark.
+    upper is MAX(event_id), which is safe because loaders are serialised by
+    lock_fact_events_loads: no event_id below it can still commit."""
+    upper = conn.execute(text("SELECT COALESCE(MAX(event_id), 0) FROM fact_events")).scalar()
+    watermark = get_watermark(conn)
+    if watermark is None:
+        return bootstrap_query, {'upper': upper}, upper
+    min_ts, _ = get_pending(conn)
+    return query, {'watermark': watermark, 'upper': upper, 'min_ts': min_ts or '-infinity'}, upper
+
+def read_new_events(conn):
+    """Return (df_events, upper): unstaged events up to upper, the new watermark."""
+    sql, params, upper = selection(conn)
+    return pd.read_sql(text(sql), conn, params=params), upper
+
+def iter_new_events(conn, chunk_rows):
+    """Return (chunks, upper): unstaged events in event_id order as frames of at
+    most chunk_rows, fetched lazily through a named server-side cursor."""
+    sql, params, upper = selection(conn)
+    stream = conn.execution_options(stream_results=True, max_row_buffer=chunk_rows)
+    return pd.read_sql(text(sql), stream, params=params, chunksize=chunk_rows), upper
+
+# Events parked earlier in the same run, re-read once the backlog is staged
+replay_query = """
+        SELECT e.event_id, e.timestamp, e.event_type, e.payload
+        FROM fact_events e
+        JOIN unpack_retry r ON r.event_id = e.event_id
+        WHERE e.event_id = ANY(:event_ids)
         ORDER BY e.event_id
         """
 
-with engine.connect() as conn:
-    df_events = pd.read_sql(text(query), conn)
-
-if df_events.empty:
-    print("No new events to unpack")
-    exit(0)
-
-df_sales = df_events[df_events['event_type'] == 'SalesOrderCreated'].reset_index(drop=True)
-df_backorder = df_events[df_events['event_type'] == 'BackorderCreated'].reset_index(drop=True)
-df_load = df_events[df_events['event_type'] == 'LoadCreated'].reset_index(drop=True)
-df_delivery_events = df_events[df_events['event_type'] == 'DeliveryEvent'].reset_index(drop=True)
-df_invoices = df_events[df_events['event_type'] == 'InvoiceCreated'].reset_index(drop=True)
-df_demand_forecasts = df_events[df_events['event_type'] == 'DemandForecastCreated'].reset_index(drop=True)
-df_production_jobs = df_events[df_events['event_type'] == 'ProductionJobCreated'].reset_index(drop=True)
-df_purchase_orders = df_events[df_events['event_type'] == 'PurchaseOrderCreated'].reset_index(drop=True)
-df_po_receipts = df_events[df_events['event_type'] == 'PurchaseOrderReceived'].reset_index(drop=True)
-df_backorder_fulfillments = df_events[df_events['event_type'] == 'BackorderFulfilled'].reset_index(drop=True)
-df_shipments = df_events[df_events['event_type'] == 'ShipmentCreated'].reset_index(drop=True)
-df_material_requirements = df_events[df_events['event_type'] == 'MaterialRequirementsCreated'].reset_index(drop=True)
-df_production_starts = df_events[df_events['event_type'] == 'ProductionStarted'].reset_index(drop=True)
-df_production_completions = df_events[df_events['event_type'] == 'ProductionCompleted'].reset_index(drop=True)
-df_sop_snapshots = df_events[df_events['event_type'] == 'SOPSnapshotCreated'].reset_index(drop=True)
-df_payments = df_events[df_events['event_type'] == 'PaymentReceived'].reset_index(drop=True)
-df_reorders = df_events[df_events['event_type'] == 'ReorderTriggered'].reset_index(drop=True)
-
-df_stg_orders = pd.DataFrame(df_sales['payload'].tolist())
-df_stg_orders['source_event_id'] = df_sales['event_id'].values
-df_stg_orders['order_date'] = df_sales['timestamp'].values
-
-df_stg_backorders = pd.DataFrame(df_backorder['payload'].tolist())
-df_stg_backorders['source_event_id'] = df_backorder['event_id'].values
-df_stg_backorders['backorder_timestamp'] = df_backorder['timestamp'].values
-
-df_stg_loads = pd.DataFrame(df_load['payload'].tolist())
-df_stg_loads['source_event_id'] = df_load['event_id'].values
-
-df_stg_delivery_events = pd.DataFrame(df_delivery_events['payload'].tolist())
-if not df_stg_delivery_events.empty:
-    df_stg_delivery_events['event_type'] = df_stg_delivery_events['event_type'].map({'Pickup': 'P', 'Delivery': 'D'})
-else:
-    df_stg_delivery_events['event_type'] = pd.Series(dtype=object)
-df_stg_delivery_events['source_event_id'] = df_delivery_events['event_id'].values
-df_stg_delivery_events['event_timestamp'] = df_delivery_events['timestamp'].values
-
-df_stg_invoices = pd.DataFrame(df_invoices['payload'].tolist())
-df_stg_invoices['source_event_id'] = df_invoices['event_id'].values
-df_stg_invoices['invoice_timestamp'] = df_invoices['timestamp'].values
-df_stg_invoices = df_stg_invoices.drop(columns=['timestamp'], errors='ignore')
-
-df_stg_demand_forecasts = pd.DataFrame(df_demand_forecasts['payload'].tolist())
-df_stg_demand_forecasts['source_event_id'] = df_demand_forecasts['event_id'].values
-df_stg_demand_forecasts['event_timestamp'] = df_demand_forecasts['timestamp'].values
-
-df_stg_production_jobs = pd.DataFrame(df_production_jobs['payload'].tolist())
-df_stg_production_jobs['source_event_id'] = df_production_jobs['event_id'].values
-df_stg_production_jobs['event_timestamp'] = df_production_jobs['timestamp'].values
-
-df_stg_purchase_orders = pd.DataFrame(df_purchase_orders['payload'].tolist())
-df_stg_purchase_orders['source_event_id'] = df_purchase_orders['event_id'].values
-df_stg_purchase_orders['event_timestamp'] = df_purchase_orders['timestamp'].values
-df_stg_purchase_orders = df_stg_purchase_orders.drop(columns=[
-    'cost_variance_pct',
-    'supplier_reliability',
-    'effective_reliability',
-    'seasonal_lead_time_mult',
-    'seasonal_reliability_mult'
-], errors='ignore')
-
-df_stg_po_receipts = pd.DataFrame(df_po_receipts['payload'].tolist())
-df_stg_po_receipts['source_event_id'] = df_po_receipts['event_id'].values
-df_stg_po_receipts['received_timestamp'] = df_po_receipts['timestamp'].values
-
-df_stg_backorder_fulfillments = pd.DataFrame(df_backorder_fulfillments['payload'].tolist())
-df_stg_backorder_fulfillments['source_event_id'] = df_backorder_fulfillments['event_id'].values
-df_stg_backorder_fulfillments['event_timestamp'] = df_backorder_fulfillments['timestamp'].values
-
-df_stg_shipments = pd.DataFrame(df_shipments['payload'].tolist())
-df_stg_shipments['source_event_id'] = df_shipments['event_id'].values
-df_stg_shipments['event_timestamp'] = df_shipments['timestamp'].values
-
-df_stg_material_requirements = pd.DataFrame(df_material_requirements['payload'].tolist())
-df_stg_material_requirements['source_event_id'] = df_material_requirements['event_id'].values
-df_stg_material_requirements['event_timestamp'] = df_material_requirements['timestamp'].values
-if not df_stg_material_requirements.empty:
-    df_stg_material_requirements['requirements'] = df_stg_material_requirements['requirements'].apply(
-        lambda x: json.dumps(x) if isinstance(x, (list, dict)) else x
-    )
-else:
-    df_stg_material_requirements['requirements'] = pd.Series(dtype=object)
-
-df_stg_production_starts = pd.DataFrame(df_production_starts['payload'].tolist())
-df_stg_production_starts['source_event_id'] = df_production_starts['event_id'].values
-df_stg_production_starts['event_timestamp'] = df_production_starts['timestamp'].values
-
-df_stg_production_completions = pd.DataFrame(df_production_completions['payload'].tolist())
-df_stg_production_completions['source_event_id'] = df_production_completions['event_id'].values
-df_stg_production_completions['event_timestamp'] = df_production_completions['timestamp'].values
-
-df_stg_sop_snapshots = pd.DataFrame(df_sop_snapshots['payload'].tolist())
-df_stg_sop_snapshots['source_event_id'] = df_sop_snapshots['event_id'].values
-df_stg_sop_snapshots['event_timestamp'] = df_sop_snapshots['timestamp'].values
-
-df_stg_payments = pd.DataFrame(df_payments['payload'].tolist())
-df_stg_payments['source_event_id'] = df_payments['event_id'].values
-df_stg_payments['event_timestamp'] = df_payments['timestamp'].values
-
-df_stg_reorders = pd.DataFrame(df_reorders['payload'].tolist())
-df_stg_reorders['source_event_id'] = df_reorders['event_id'].values
-df_stg_reorders['event_timestamp'] = df_reorders['timestamp'].values
-
-with engine.connect() as conn:
-    trans = conn.begin()
-    try:
-        dfs = [
-            df_stg_orders,
-            df_stg_backorders,
-            df_stg_loads,
-            df_stg_delivery_events,
-            df_stg_invoices,
-            df_stg_demand_forecasts,
-            df_stg_production_jobs,
-            df_stg_purchase_orders,
-            df_stg_po_receipts,
-            df_stg_backorder_fulfillments,
-            df_stg_shipments,
-            df_stg_material_requirements,
-            df_stg_production_starts,
-            df_stg_production_completions,
-            df_stg_sop_snapshots,
-            df_stg_payments,
-            df_stg_reorders
-        ]
-        tables = [
-            'stg_orders',
-            'stg_backorders',
-            'stg_loads',
-            'stg_delivery_events',
-            'stg_invoices',
-            'stg_demand_forecasts',
-            'stg_production_jobs',
-            'stg_purchase_orders',
-            'stg_po_receipts',
-            'stg_backorder_fulfillments',
-            'stg_shipments',
-            'stg_material_requirements',
-            'stg_production_starts',
-            'stg_production_completions',
-            'stg_sop_snapshots',
-            'stg_payments',
-            'stg_reorders'
-        ]
-        for i, (df, table) in enumerate(zip(dfs, tables)):
-            if table == 'stg_sop_snapshots' and not df.empty and 'product_id' in df.columns:
-                df = df[~df['product_id'].str.startswith('P-')]
-                print(f"Filtered {len(df)} parts from {table}")
-                dfs[i] = df
-            if table == 'stg_payments' and not df.empty and 'invoice_id' in df.columns:
-                valid_invoice_ids = pd.read_sql(text("SELECT invoice_id FROM stg_invoices"), conn)["invoice_id"].astype(str)
-                n_before = len(df)
-                df = df[df["invoice_id"].astype(str).isin(valid_invoice_ids)]
-                n_dropped = n_before - len(df)
-                if n_dropped:
-                    print(f"Dropped {n_dropped} payment row(s) with invoice_id not in stg_invoices")
-                dfs[i] = df
-            df.to_sql(table, conn, if_exists='append', index=False, dtype=dtype_mapping)
-        trans.commit()
-        for df, table in zip(dfs, tables):
-            print(f'Inserted {len(df)} rows into {table}')
-    except Exception:
-        trans.rollback()
-        raise
+def stage_chunk(df_events, watermark, retry_ids, upper, results, key_cache):
+    """Stage one frame of events and advance the ledger to upper.
+    Per-table (rows, parked ids, seconds) are accumulated into results."""
+    chunk_results = {}
+    if len(df_events):
+        chunk_results = write_staging(get_engine(), partition_events(df_events), watermark, retry_ids, key_cache)
+    with get_engine().connect() as conn:
+        trans = conn.begin()
+        try:
+            # Retried events that no table kept (e.g. filtered out) are done with
+            parked_ids = {event_id for _, parked, _ in chunk_results.values() for event_id in parked}
+            clear_retries(conn, retry_ids.intersection(df_events['event_id']) - parked_ids)
+            set_watermark(conn, upper)
+            trans.commit()
+        except Exception:
+            trans.rollback()
+            raise
+    for table, (n_inserted, parked, seconds) in chunk_results.items():
+        total_inserted, total_parked, total_seconds = results.get(table, (0, [], 0.0))
+        results[table] = (total_inserted + n_inserted, total_parked + parked, total_seconds + seconds)
+
+def replay_parked(results, watermark, key_cache):
+    """Retry events parked by this run whose parent arrived in a later chunk."""
+    parked_ids = [int(event_id) for _, parked, _ in results.values() for event_id in parked]
+    if not parked_ids:
+        return
+    with get_engine().connect() as conn:
+        df_events = pd.read_sql(text(replay_query), conn, params={'event_ids': parked_ids})
+    for table, (n_inserted, parked, seconds) in results.items():
+        results[table] = (n_inserted, [], seconds)
+    stage_chunk(df_events, watermark, set(parked_ids), watermark, results, key_cache)
+
+def main_sql():
+    with get_engine().connect() as conn:
+        trans = conn.begin()
+        try:
+            _, load_seq = get_pending(conn)
+            sql, params, upper = selection(conn)
+            inserted, n_events, n_parked = unpack_in_database(conn, sql, params)
+            set_watermark(conn, upper)
+            clear_pending(conn, load_seq)
+            trans.commit()
+        except Exception:
+            trans.rollback()
+            raise
+    if not n_events:
+        print("No new events to unpack")
+        return
+    if n_parked:
+        print(f"Parked {n_parked} event(s) with a missing parent row for retry")
+    for table, n in inserted.items():
+        print(f'Inserted {n} rows into {table}')
+
+def main(engine_name=UNPACK_ENGINE):
+    if engine_name == 'sql':
+        return main_sql()
+    if engine_name != 'pandas':
+        raise ValueError(f"Unknown UNPACK_ENGINE {engine_name!r}; expected 'pandas' or 'sql'")
+
+    # Staging tables are written concurrently in their own bounded transactions;
+    # the watermark moves after each chunk, once all of its tables have succeeded
+    with get_engine().connect() as conn:
+        _, load_seq = get_pending(conn)
+        watermark = get_watermark(conn) or 0
+        retry_ids = load_retry_ids(conn)
+    key_cache = KeyCache()
+    results = {}
+    n_events = 0
+    if UNPACK_CHUNK_ROWS > 0:
+        with get_engine().connect() as conn:
+            chunks, upper = iter_new_events(conn, UNPACK_CHUNK_ROWS)
+            for df_events in chunks:
+                chunk_upper = int(df_events['event_id'].max())
+                stage_chunk(df_events, watermark, retry_ids, chunk_upper, results, key_cache)
+                watermark = max(watermark, chunk_upper)
+                n_events += len(df_events)
+                print(f"Staged {n_events} event(s) through event_id {chunk_upper}")
+        stage_chunk(pd.DataFrame(columns=['event_id']), watermark, retry_ids, upper, results, key_cache)
+    else:
+        with get_engine().connect() as conn:
+            df_events, upper = read_new_events(conn)
+        stage_chunk(df_events, watermark, retry_ids, upper, results, key_cache)
+        n_events = len(df_events)
+    # Parents that arrived later in the run let parked events through now
+    replay_parked(results, max(watermark, upper), key_cache)
+    # Everything loaded before load_seq was read is staged now
+    with get_engine().begin() as conn:
+        clear_pending(conn, load_seq)
+
+    if not n_events:
+        print("No new events to unpack")
+        return
+    for table in STAGING_TABLES:
+        n_inserted, parked, seconds = results.get(table, (0, [], 0.0))
+        if parked:
+            print(f"Parked {len(parked)} {table} row(s) with a missing parent row for retry")
+        print(f'Inserted {n_inserted} rows into {table} ({seconds:.1f}s)')
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,32 @@
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+@pytest.fixture
+def pg_conn():
+    """Connection to TEST_DATABASE_URL inside a scratch schema holding the
+    init_db tables, rolled back afterwards. Skips when no database is set."""
+    url = os.getenv("TEST_DATABASE_URL")
+    if not url:
+        pytest.skip("TEST_DATABASE_URL not set")
+    from sqlalchemy import create_engine, text
+
+    from utils.init_db import table_ddl
+
+    engine = create_engine(url)
+    with engine.connect() as conn:
+        trans = conn.begin()
+        conn.execute(text("CREATE SCHEMA pytest_scratch"))
+        conn.execute(text("SET LOCAL search_path = pytest_scratch"))
+        for ddl in table_ddl(partitioned=False):
+            conn.execute(text(ddl))
+        try:
+            yield conn
+        finally:
+            trans.rollback()
+    engine.dispose()
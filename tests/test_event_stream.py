@@ -0,0 +1,29 @@
+import pandas as pd
+
+from utils.event_stream import EVENT_COLUMNS, reparse_payloads, split_event_line
+
+
+def _line(payload):
+    return b'{"timestamp": "2024-01-01T00:00:00Z", "event_type": "X", "payload": ' + payload + b"}"
+
+
+def test_raw_payload_is_passed_through_unparsed():
+    assert split_event_line(_line(b'{"a": [1, 2]}')) == ("2024-01-01T00:00:00Z", "X", '{"a": [1, 2]}')
+
+
+def test_reparse_matches_the_json_loads_path():
+    lines = [
+        _line(b'{"a": 1}, "extra": {"b": 2}'),  # keys after the payload
+        _line(b'{"a": [1, 2}'),  # truncated
+        _line(b'{"a": [1, 2]}'),
+        _line(b"null"),
+    ]
+    df = pd.DataFrame([split_event_line(line) for line in lines], columns=EVENT_COLUMNS)
+
+    reparsed = reparse_payloads(df)
+
+    expected = [split_event_line(line, raw_payload=False) for line in lines]
+    assert expected[1] is None
+    assert list(reparsed.index) == [0, 2, 3]
+    assert reparsed["payload"].tolist()[:2] == [expected[0][2], expected[2][2]]
+    assert pd.isna(reparsed["payload"].iloc[2])
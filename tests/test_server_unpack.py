@@ -0,0 +1,51 @@
+import json
+
+from sqlalchemy import text
+
+from utils.event_registry import EVENT_REGISTRY
+from utils.server_unpack import build_insert_sql, build_parked_sql, unpack_in_database
+
+DELIVERY = EVENT_REGISTRY["DeliveryEvent"]
+
+
+def test_parked_sql_applies_value_maps_before_the_row_type():
+    sql = build_parked_sql("DeliveryEvent", DELIVERY)
+    # stg_delivery_events.event_type is CHAR(1): the raw 'Pickup' must be mapped first
+    assert "jsonb_populate_record(NULL::stg_delivery_events, e.payload)" not in sql
+    assert "WHEN 'Pickup' THEN 'P'" in sql
+
+
+def test_parked_and_insert_build_the_same_record():
+    parked = build_parked_sql("DeliveryEvent", DELIVERY)
+    insert = build_insert_sql("DeliveryEvent", DELIVERY, [("load_id", None)])
+    doc = parked.split("jsonb_populate_record(NULL::stg_delivery_events, ", 1)[1].rsplit(") r", 1)[0]
+    assert f"(SELECT {doc} AS doc)" in insert
+
+
+def test_delivery_events_unpack_in_database(pg_conn):
+    pg_conn.execute(text("INSERT INTO dim_facilities (facility_id) VALUES ('F-1')"))
+    events = [
+        {"event_id": "00000000-0000-0000-0000-000000000001", "event_type": "Pickup", "facility_id": "F-1"},
+        # load not staged: parked for retry rather than failing the batch
+        {
+            "event_id": "00000000-0000-0000-0000-000000000002",
+            "event_type": "Delivery",
+            "facility_id": "F-1",
+            "load_id": "00000000-0000-0000-0000-0000000000aa",
+        },
+    ]
+    for payload in events:
+        pg_conn.execute(
+            text(
+                "INSERT INTO fact_events (timestamp, event_type, payload) "
+                "VALUES (now(), 'DeliveryEvent', CAST(:payload AS jsonb))"
+            ),
+            {"payload": json.dumps(payload)},
+        )
+    selection = "SELECT event_id, timestamp, event_type, payload FROM fact_events"
+
+    inserted, n_events, n_parked = unpack_in_database(pg_conn, selection, {})
+
+    assert (n_events, n_parked, inserted["stg_delivery_events"]) == (2, 1, 1)
+    staged = pg_conn.execute(text("SELECT event_type, facility_id FROM stg_delivery_events")).fetchall()
+    assert staged == [("P", "F-1")]
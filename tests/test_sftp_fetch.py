@@ -0,0 +1,147 @@
+import hashlib
+import io
+import os
+
+import pytest
+
+from utils.sftp_fetch import fetch_all
+
+EVENTS_DIR = "/events"
+
+
+class FakeAttr:
+    def __init__(self, filename, data, mtime):
+        self.filename = filename
+        self.st_size = len(data)
+        self.st_mtime = mtime
+
+
+class FakeRemoteFile(io.BytesIO):
+    def prefetch(self, file_size=None):
+        pass
+
+
+class FakeSFTP:
+    def __init__(self, pool):
+        self.pool = pool
+
+    def open(self, path, mode="r"):
+        self.pool.opened.append(path)
+        data = self.pool.files[os.path.basename(path)]
+        if self.pool.corrupt_reads > 0:
+            self.pool.corrupt_reads -= 1
+            data = data[:-1] + bytes([data[-1] ^ 0xFF])
+        return FakeRemoteFile(data)
+
+
+class FakePool:
+    """Stands in for SFTPPool: serves files from memory and hashes them like sha256sum would."""
+
+    def __init__(self, host, files, mtime=1_700_000_000, corrupt_reads=0):
+        self.cfg = {"host": host, "events_dir": EVENTS_DIR}
+        self.files = files
+        self.mtime = mtime
+        self.corrupt_reads = corrupt_reads
+        self.opened = []
+
+    def acquire(self):
+        return FakeSFTP(self)
+
+    def release(self, sftp):
+        pass
+
+    def listdir_attr(self):
+        return [FakeAttr(name, data, self.mtime) for name, data in self.files.items()]
+
+    def remote_sha256(self, remote_path, start, end):
+        return hashlib.sha256(self.files[os.path.basename(remote_path)][start:end]).hexdigest()
+
+
+def _lines(n):
+    return b"".join(b'{"timestamp": "2024-01-01T00:00:%02dZ", "event_type": "X", "payload": {}}\n' % i for i in range(n))
+
+
+def _only(results, host):
+    [(attr, local_path, status, n_bytes)] = results[host]
+    return local_path, status, n_bytes
+
+
+def test_downloads_new_file_and_sets_mtime(tmp_path):
+    data = _lines(20)
+    pool = FakePool("h1", {"2024-01-01.jsonl": data})
+
+    local_path, status, n_bytes = _only(fetch_all([pool], tmp_path, workers=2), "h1")
+
+    assert (status, n_bytes) == ("downloaded", len(data))
+    assert local_path == tmp_path / "h1" / "2024-01-01.jsonl"
+    assert local_path.read_bytes() == data
+    assert int(local_path.stat().st_mtime) == pool.mtime
+
+
+def test_resumes_partial_file_from_local_size(tmp_path):
+    data = _lines(20)
+    local = tmp_path / "h1" / "2024-01-01.jsonl"
+    local.parent.mkdir(parents=True)
+    local.write_bytes(data[:300])
+    pool = FakePool("h1", {"2024-01-01.jsonl": data})
+
+    local_path, status, n_bytes = _only(fetch_all([pool], tmp_path), "h1")
+
+    assert (status, n_bytes) == ("resumed", len(data) - 300)
+    assert local_path.read_bytes() == data
+
+
+def test_skips_file_whose_size_and_mtime_match(tmp_path):
+    data = _lines(5)
+    pool = FakePool("h1", {"2024-01-01.jsonl": data})
+    fetch_all([pool], tmp_path)
+    pool.opened.clear()
+
+    _, status, n_bytes = _only(fetch_all([pool], tmp_path), "h1")
+
+    assert (status, n_bytes) == ("skipped", 0)
+    assert pool.opened == []
+
+
+def test_min_offsets_skip_ingested_bytes(tmp_path):
+    data = _lines(20)
+    pool = FakePool("h1", {"2024-01-01.jsonl": data, "notes.txt": b"ignored"})
+
+    local_path, status, n_bytes = _only(fetch_all([pool], tmp_path, {"h1": {"2024-01-01.jsonl": 500}}), "h1")
+
+    assert (status, n_bytes) == ("resumed", len(data) - 500)
+    written = local_path.read_bytes()
+    assert len(written) == len(data)
+    # Only the unread tail is fetched; the ingested prefix is left as a sparse hole
+    assert written[:500] == b"\0" * 500
+    assert written[500:] == data[500:]
+
+
+def test_checksum_mismatch_is_retried(tmp_path):
+    data = _lines(10)
+    pool = FakePool("h1", {"2024-01-01.jsonl": data}, corrupt_reads=1)
+
+    local_path, status, _ = _only(fetch_all([pool], tmp_path), "h1")
+
+    assert status == "downloaded"
+    assert local_path.read_bytes() == data
+    assert len(pool.opened) == 2
+
+
+def test_repeated_checksum_mismatch_raises(tmp_path):
+    pool = FakePool("h1", {"2024-01-01.jsonl": _lines(10)}, corrupt_reads=2)
+
+    with pytest.raises(RuntimeError, match="Checksum mismatch"):
+        fetch_all([pool], tmp_path)
+    assert len(pool.opened) == 2
+
+
+def test_fetches_every_host(tmp_path):
+    pools = [FakePool("h1", {"2024-01-01.jsonl": _lines(3)}), FakePool("h2", {"2024-01-02.jsonl": _lines(4)})]
+
+    results = fetch_all(pools, tmp_path)
+
+    assert {host: [r[0].filename for r in rows] for host, rows in results.items()} == {
+        "h1": ["2024-01-01.jsonl"],
+        "h2": ["2024-01-02.jsonl"],
+    }
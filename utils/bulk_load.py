@@ -0,0 +1,146 @@
+"""
+Bulk writer that streams DataFrames into PostgreSQL with COPY ... FROM STDIN.
+Rows are encoded in PostgreSQL text format chunk by chunk, so only one chunk of
+encoded text is held in memory at a time. Lists become array literals (UUID[]),
+dicts and json_columns become JSON text (JSONB) and datetimes are sent as ISO
+strings with their UTC offset (TIMESTAMPTZ).
+"""
+import io
+import json
+import math
+import uuid
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+
+COPY_CHUNK_ROWS = 10000
+
+_NULL = "\\N"
+
+
+def _escape_text(value):
+    return value.replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+
+
+def _is_null(value):
+    if value is None or value is pd.NA or value is pd.NaT:
+        return True
+    return isinstance(value, float) and math.isnan(value)
+
+
+def _array_literal(values):
+    elements = []
+    for v in values:
+        if _is_null(v):
+            elements.append("NULL")
+        elif isinstance(v, (list, tuple, np.ndarray)):
+            elements.append(_array_literal(v))
+        else:
+            v = str(v).replace("\\", "\\\\").replace('"', '\\"')
+            elements.append(f'"{v}"')
+    return "{" + ",".join(elements) + "}"
+
+
+def _encode_value(value, as_json=False):
+    if isinstance(value, np.ndarray):
+        value = value.tolist()
+    if _is_null(value):
+        return None
+    if as_json:
+        return value if isinstance(value, str) else json.dumps(value, default=str)
+    if isinstance(value, bool) or isinstance(value, np.bool_):
+        return "t" if value else "f"
+    if isinstance(value, (list, tuple)):
+        return _array_literal(value)
+    if isinstance(value, dict):
+        return json.dumps(value, default=str)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    return str(value)
+
+
+def _encode_column(series, as_json=False):
+    """Encode one column to a list of COPY text fields (escaped, NULL as \\N)."""
+    if not as_json and pd.api.types.is_bool_dtype(series) and not series.isna().any():
+        return np.where(series.to_numpy(dtype=bool), "t", "f").tolist()
+    if not as_json and pd.api.types.is_integer_dtype(series):
+        nulls = series.isna().to_numpy()
+        encoded = series.astype(str).to_numpy(dtype=object)
+        encoded[nulls] = _NULL
+        return encoded.tolist()
+    if not as_json and pd.api.types.is_float_dtype(series):
+        values = series.to_numpy(dtype=float, na_value=np.nan)
+        nulls = np.isnan(values)
+        finite = values[~nulls]
+        # Integral floats come from NaN-holed integer columns; INTEGER rejects "3.0" in COPY
+        if finite.size and np.all(np.isfinite(finite)) and np.all(finite == np.floor(finite)):
+            encoded = np.where(nulls, 0, values).astype(np.int64).astype(str).astype(object)
+        else:
+            encoded = values.astype(str).astype(object)
+        encoded[nulls] = _NULL
+        return encoded.tolist()
+    if not as_json and pd.api.types.is_datetime64_any_dtype(series):
+        fmt = "%Y-%m-%d %H:%M:%S.%f%z" if isinstance(series.dtype, pd.DatetimeTZDtype) else "%Y-%m-%d %H:%M:%S.%f"
+        nulls = series.isna().to_numpy()
+        encoded = series.dt.strftime(fmt).to_numpy(dtype=object)
+        encoded[nulls] = _NULL
+        return encoded.tolist()
+    encoded = []
+    for value in series.tolist():
+        field = _encode_value(value, as_json)
+        encoded.append(_NULL if field is None else _escape_text(field))
+    return encoded
+
+
+def iter_copy_chunks(df, json_columns=(), chunk_rows=COPY_CHUNK_ROWS):
+    """Yield COPY text-format blocks of at most chunk_rows rows."""
+    json_columns = set(json_columns)
+    for start in range(0, len(df), chunk_rows):
+        chunk = df.iloc[start:start + chunk_rows]
+        columns = [_encode_column(chunk[col], col in json_columns) for col in chunk.columns]
+        yield "".join("\t".join(row) + "\n" for row in zip(*columns))
+
+
+class _ChunkReader:
+    """Minimal file-like object that feeds generator output to cursor.copy_expert."""
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._current = io.StringIO()
+
+    def read(self, size=-1):
+        parts = []
+        remaining = size
+        while size < 0 or remaining > 0:
+            data = self._current.read(remaining if size >= 0 else -1)
+            if data:
+                parts.append(data)
+                remaining -= len(data)
+                continue
+            try:
+                self._current = io.StringIO(next(self._chunks))
+            except StopIteration:
+                break
+        return "".join(parts)
+
+
+def copy_dataframe(conn, df, table, columns=None, json_columns=(), chunk_rows=COPY_CHUNK_ROWS):
+    """Append df to table with COPY FROM STDIN on an open SQLAlchemy connection.
+    Runs inside the connection's current transaction. Returns the number of rows sent.
+    """
+    if columns is not None:
+        df = df[list(columns)]
+    if df.empty:
+        return 0
+    column_sql = ", ".join(f'"{col}"' for col in df.columns)
+    copy_sql = f"COPY {table} ({column_sql}) FROM STDIN"
+    reader = _ChunkReader(iter_copy_chunks(df, json_columns, chunk_rows))
+    cursor = conn.connection.cursor()
+    try:
+        cursor.copy_expert(copy_sql, reader)
+    finally:
+        cursor.close()
+    return len(df)
@@ -0,0 +1,183 @@
+"""
+Bulk reader that streams query results out of PostgreSQL with COPY (query) TO
+STDOUT and parses them with Arrow's CSV reader into Arrow-backed DataFrames.
+
+The result's column types are read first (the query planned with LIMIT 0) and
+mapped to Arrow types, so values are parsed straight into typed columns with no
+Python objects per row: integers and floats, decimal128 for numeric columns
+with a declared precision (unconstrained numeric becomes float64), UTC
+timestamps, dates and booleans. UUID, text, JSON and array columns stay Arrow
+strings, the same representation utils.schema uses for UUIDs. The COPY stream
+is written by a background thread into a pipe that Arrow reads incrementally,
+so iter_arrow_frames never holds more than one chunk of the result.
+
+Requires pyarrow.
+"""
+import io
+import os
+import threading
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+from sqlalchemy import text
+
+from utils.db import get_engine
+
+BULK_READ_CHUNK_ROWS = int(os.getenv("BULK_READ_CHUNK_ROWS", "500000"))
+# Bytes of CSV Arrow parses per block when streaming
+BULK_READ_BLOCK_BYTES = 8 * 2**20
+
+# Postgres type OID -> Arrow type; anything else is read as a string
+_ARROW_TYPES = {
+    16: pa.bool_(),
+    20: pa.int64(),
+    21: pa.int16(),
+    23: pa.int32(),
+    26: pa.int64(),
+    700: pa.float32(),
+    701: pa.float64(),
+    1082: pa.date32(),
+    1114: pa.timestamp("us"),
+    1184: pa.timestamp("us", tz="UTC"),
+}
+_NUMERIC_OID = 1700
+
+
+def _arrow_type(column):
+    if column.type_code == _NUMERIC_OID:
+        if column.precision is None or column.scale is None:
+            return pa.float64()
+        if column.precision > 38:
+            return pa.decimal256(column.precision, column.scale)
+        return pa.decimal128(column.precision, column.scale)
+    return _ARROW_TYPES.get(column.type_code, pa.string())
+
+
+def _inline_params(cursor, dialect, sql, params):
+    """Bind params into sql client-side (COPY takes no bind parameters)."""
+    compiled = text(sql).compile(dialect=dialect)
+    values = compiled.construct_params(params or {})
+    return cursor.mogrify(str(compiled), values).decode()
+
+
+def _prepare(raw_conn, dialect, sql, params):
+    """Return (COPY statement, Arrow schema) for sql on a raw DBAPI connection."""
+    with raw_conn.cursor() as cursor:
+        # Timestamps leave COPY in the session time zone; pin it so they parse as UTC
+        cursor.execute("SET LOCAL TIME ZONE 'UTC'")
+        query = _inline_params(cursor, dialect, sql, params).strip().rstrip(";")
+        cursor.execute(f"SELECT * FROM ({query}) q LIMIT 0")
+        schema = pa.schema([(column.name, _arrow_type(column)) for column in cursor.description])
+    return f"COPY ({query}) TO STDOUT WITH (FORMAT csv)", schema
+
+
+def _csv_options(schema):
+    read_options = pa_csv.ReadOptions(column_names=schema.names, block_size=BULK_READ_BLOCK_BYTES)
+    # COPY csv writes NULL unquoted and an empty string as "", so only the former is null
+    convert_options = pa_csv.ConvertOptions(
+        column_types=schema,
+        true_values=["t"],
+        false_values=["f"],
+        null_values=[""],
+        strings_can_be_null=True,
+        quoted_strings_can_be_null=False,
+    )
+    return read_options, convert_options
+
+
+def _to_frame(table):
+    return table.to_pandas(types_mapper=pd.ArrowDtype)
+
+
+def read_arrow_table(sql, params=None, engine=None):
+    """Run sql through COPY and return the whole result as a pyarrow.Table."""
+    engine = engine or get_engine()
+    raw_conn = engine.raw_connection()
+    try:
+        copy_sql, schema = _prepare(raw_conn, engine.dialect, sql, params)
+        buffer = io.BytesIO()
+        with raw_conn.cursor() as cursor:
+            cursor.copy_expert(copy_sql, buffer)
+        raw_conn.commit()
+    except Exception:
+        raw_conn.rollback()
+        raise
+    finally:
+        raw_conn.close()
+    buffer.seek(0)
+    read_options, convert_options = _csv_options(schema)
+    if not buffer.getbuffer().nbytes:
+        return schema.empty_table()
+    return pa_csv.read_csv(buffer, read_options=read_options, convert_options=convert_options)
+
+
+def read_arrow_frame(sql, params=None, engine=None):
+    """Run sql through COPY and return an Arrow-backed DataFrame."""
+    return _to_frame(read_arrow_table(sql, params, engine))
+
+
+def iter_arrow_frames(sql, params=None, chunk_rows=BULK_READ_CHUNK_ROWS, engine=None):
+    """Yield the result of sql as Arrow-backed DataFrames of about chunk_rows rows,
+    parsing the COPY stream as it arrives. Closing the generator early aborts
+    the COPY."""
+    engine = engine or get_engine()
+    raw_conn = engine.raw_connection()
+    reader_file = writer = None
+    errors = []
+    try:
+        copy_sql, schema = _prepare(raw_conn, engine.dialect, sql, params)
+        read_fd, write_fd = os.pipe()
+        reader_file = os.fdopen(read_fd, "rb")
+        writer_file = os.fdopen(write_fd, "wb")
+
+        def copy_out():
+            try:
+                with raw_conn.cursor() as cursor:
+                    cursor.copy_expert(copy_sql, writer_file)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                try:
+                    writer_file.close()
+                except OSError:
+                    pass
+
+        writer = threading.Thread(target=copy_out, daemon=True)
+        writer.start()
+
+        read_options, convert_options = _csv_options(schema)
+        try:
+            stream = pa_csv.open_csv(reader_file, read_options=read_options, convert_options=convert_options)
+        except pa.ArrowInvalid as e:
+            if "Empty CSV file" not in str(e):
+                raise
+            stream = iter(())
+        batches, n_rows = [], 0
+        for batch in stream:
+            batches.append(batch)
+            n_rows += batch.num_rows
+            if n_rows >= chunk_rows:
+                yield _to_frame(pa.Table.from_batches(batches, schema))
+                batches, n_rows = [], 0
+        writer.join()
+        if errors:
+            raise errors[0]
+        if batches:
+            yield _to_frame(pa.Table.from_batches(batches, schema))
+        raw_conn.commit()
+    except BaseException as e:
+        if reader_file is not None:
+            # Unblocks the writer (broken pipe) so the COPY ends before the connection is dropped
+            reader_file.close()
+        if writer is not None:
+            writer.join()
+        raw_conn.invalidate()
+        if errors and errors[0] is not e and not isinstance(e, GeneratorExit):
+            # A failed COPY shows up in Arrow as a truncated stream; report the server's error
+            raise errors[0] from e
+        raise
+    finally:
+        if reader_file is not None:
+            reader_file.close()
+        raw_conn.close()
@@ -0,0 +1,80 @@
+"""
+Shared database engine for every script and notebook helper.
+
+get_engine() builds one SQLAlchemy engine per database on first call and
+returns the same engine afterwards, so importing a module never touches the
+database and repeated queries reuse pooled connections instead of opening a
+new TLS session each time. The pool is pre-pinged, so connections dropped by
+the server or a load balancer are replaced transparently, and recycled before
+idle timeouts. With DB_PGBOUNCER=1 the client-side pool is disabled (NullPool)
+and PgBouncer does the pooling; keep its pool_mode at transaction or session,
+since the loaders hold server-side cursors and temp tables within a transaction.
+"""
+import os
+import threading
+from urllib.parse import quote_plus
+
+from dotenv import load_dotenv
+from sqlalchemy import create_engine
+from sqlalchemy.pool import NullPool
+
+load_dotenv()
+
+# Persistent connections kept per engine, and extra ones opened under load
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+# Seconds to wait for a free connection, and age after which one is replaced
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_PGBOUNCER = os.getenv("DB_PGBOUNCER", "0") == "1"
+
+_engines = {}
+_lock = threading.Lock()
+
+
+def database_url(database=None):
+    password = quote_plus(os.getenv("DB_PASSWORD"))
+    return (
+        f"postgresql+psycopg2://{os.getenv('DB_USER')}:{password}@"
+        f"{os.getenv('DB_HOST')}:{os.getenv('DB_PORT')}/{database or os.getenv('DB_NAME')}"
+    )
+
+
+def _new_engine(database):
+    connect_args = {
+        "sslmode": os.getenv("DB_SSL", "require"),
+        "application_name": os.getenv("DB_APPLICATION_NAME", "supply-chain-pipeline"),
+        "keepalives": 1,
+        "keepalives_idle": 30,
+    }
+    if DB_PGBOUNCER:
+        return create_engine(database_url(database), connect_args=connect_args, poolclass=NullPool)
+    return create_engine(
+        database_url(database),
+        connect_args=connect_args,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=True,
+        pool_use_lifo=True,
+    )
+
+
+def get_engine(database=None):
+    """Return the shared engine for database (DB_NAME by default), creating it
+    on first use. No connection is opened until the engine is used."""
+    database = database or os.getenv("DB_NAME")
+    with _lock:
+        engine = _engines.get(database)
+        if engine is None:
+            engine = _engines[database] = _new_engine(database)
+    return engine
+
+
+def dispose_engines():
+    """Close every pooled connection, e.g. before forking or at shutdown."""
+    with _lock:
+        for engine in _engines.values():
+            engine.dispose()
+        _engines.clear()
@@ -1,25 +1,58 @@
-import os
+import sys
 import pandas as pd
 from datetime import datetime
-from sqlalchemy import create_engine
+from pathlib import Path
 from sqlalchemy import text
 from dotenv import load_dotenv
-from urllib.parse import quote_plus
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from utils.db import get_engine
+from utils.query_cache import QUERY_CACHE_ENABLED, QueryCache, cache_key, cacheable, referenced_marts, refresh_token
+
+try:
+    from utils.bulk_read import BULK_READ_CHUNK_ROWS, iter_arrow_frames, read_arrow_frame
+except ImportError:  # pyarrow not installed: bulk reads unavailable
+    BULK_READ_CHUNK_ROWS, iter_arrow_frames, read_arrow_frame = None, None, None
 
 load_dotenv()
 
-def get_engine():
-    encoded_password = quote_plus(os.getenv('DB_PASSWORD'))
-    db_string = f"postgresql://{os.getenv('DB_USER')}:{encoded_password}@{os.getenv('DB_HOST')}:{os.getenv('DB_PORT')}/{os.getenv('DB_NAME')}?sslmode={os.getenv('DB_SSL')}"
-    engine = create_engine(db_string)
-    return engine
+QUERY_CACHE = QueryCache()
+
+def _read(sql, params, conn, bulk):
+    if bulk:
+        return read_arrow_frame(sql, params)
+    return pd.read_sql(text(sql), conn, params=params)
 
-def run_query(sql, params=None):
-    engine = get_engine()
-    with engine.connect() as conn:
-        df = pd.read_sql(text(sql), conn, params=params)
+def _require_bulk():
+    if read_arrow_frame is None:
+        raise ImportError("bulk reads need pyarrow (pip install pyarrow)")
+
+def run_query(sql, params=None, cache=QUERY_CACHE_ENABLED, bulk=False):
+    """Run sql and return a DataFrame. Queries over mart_* tables only are
+    served from QUERY_CACHE until their TTL expires or one of those marts is
+    refreshed; anything else always reads the database.
+    bulk=True streams the result with COPY into Arrow-backed columns
+    (utils.bulk_read), much faster than read_sql for large results."""
+    if bulk:
+        _require_bulk()
+    if not cache or not cacheable(sql):
+        with get_engine().connect() as conn:
+            return _read(sql, params, conn, bulk)
+    key = cache_key(sql, params, variant="arrow" if bulk else "")
+    with get_engine().connect() as conn:
+        token = refresh_token(conn, referenced_marts(sql))
+        df = QUERY_CACHE.get(key, token)
+        if df is None:
+            df = _read(sql, params, conn, bulk)
+            QUERY_CACHE.put(key, token, df)
     return df
 
+def iter_query(sql, params=None, chunk_rows=None):
+    """Yield the result of sql in Arrow-backed DataFrames of about chunk_rows
+    rows, for results too large to hold in memory at once. Not cached."""
+    _require_bulk()
+    yield from iter_arrow_frames(sql, params, chunk_rows or BULK_READ_CHUNK_ROWS)
+
 def date_range(start, end=None):
     if end:
         return {
@@ -0,0 +1,186 @@
+"""
+Declarative registry of the event types unpacked into staging.
+
+Each entry maps an event_type to its stg_* table and the transforms applied on
+the way in. Entries are listed in foreign-key order (parents before children),
+which is the order staging tables are written. Both unpack engines (pandas and
+server-side SQL) are driven from this registry, so adding an event type means
+adding one entry here.
+
+Entry keys:
+    table             target staging table
+    timestamp_column  column that receives fact_events.timestamp (None: not stored)
+    drop_columns      payload keys that are not stored
+    value_maps        {column: {payload value: stored value}}
+    json_columns      columns written as JSONB
+    exclude_prefixes  {column: prefix}; rows whose value starts with prefix are skipped
+    parents           {column: (parent table, parent column)} for every foreign key;
+                      rows whose parent is not loaded yet are parked for retry
+                      instead of inserted, and staging parents are written first
+                      when tables are loaded concurrently
+"""
+import json
+
+import pandas as pd
+
+CUSTOMER = ("dim_customers", "customer_id")
+PRODUCT = ("dim_products", "product_id")
+PART = ("dim_parts", "part_id")
+ORDER = ("stg_orders", "order_id")
+JOB = ("stg_production_jobs", "job_id")
+
+EVENT_REGISTRY = {
+    "SalesOrderCreated": {
+        "table": "stg_orders",
+        "timestamp_column": "order_date",
+        "parents": {"customer_id": CUSTOMER, "product_id": PRODUCT},
+    },
+    "BackorderCreated": {
+        "table": "stg_backorders",
+        "timestamp_column": "backorder_timestamp",
+        "parents": {"order_id": ORDER, "customer_id": CUSTOMER, "product_id": PRODUCT},
+    },
+    "LoadCreated": {
+        "table": "stg_loads",
+        "timestamp_column": None,
+        "parents": {
+            "order_id": ORDER,
+            "customer_id": CUSTOMER,
+            "route_id": ("dim_routes", "route_id"),
+            "product_id": PRODUCT,
+        },
+    },
+    "DeliveryEvent": {
+        "table": "stg_delivery_events",
+        "timestamp_column": "event_timestamp",
+        "value_maps": {"event_type": {"Pickup": "P", "Delivery": "D"}},
+        "parents": {"load_id": ("stg_loads", "load_id"), "facility_id": ("dim_facilities", "facility_id")},
+    },
+    "InvoiceCreated": {
+        "table": "stg_invoices",
+        "timestamp_column": "invoice_timestamp",
+        "drop_columns": ["timestamp"],
+        "parents": {"order_id": ORDER, "customer_id": CUSTOMER, "product_id": PRODUCT},
+    },
+    "DemandForecastCreated": {
+        "table": "stg_demand_forecasts",
+        "timestamp_column": "event_timestamp",
+        "parents": {"product_id": PRODUCT},
+    },
+    "ProductionJobCreated": {
+        "table": "stg_production_jobs",
+        "timestamp_column": "event_timestamp",
+        "parents": {"product_id": PRODUCT},
+    },
+    "PurchaseOrderCreated": {
+        "table": "stg_purchase_orders",
+        "timestamp_column": "event_timestamp",
+        "drop_columns": [
+            "cost_variance_pct",
+            "supplier_reliability",
+            "effective_reliability",
+            "seasonal_lead_time_mult",
+            "seasonal_reliability_mult",
+        ],
+        "parents": {"part_id": PART, "supplier_id": ("dim_suppliers", "supplier_id")},
+    },
+    "PurchaseOrderReceived": {
+        "table": "stg_po_receipts",
+        "timestamp_column": "received_timestamp",
+        "parents": {"purchase_order_id": ("stg_purchase_orders", "purchase_order_id"), "part_id": PART},
+    },
+    "BackorderFulfilled": {
+        "table": "stg_backorder_fulfillments",
+        "timestamp_column": "event_timestamp",
+        "parents": {
+            "order_id": ORDER,
+            "customer_id": CUSTOMER,
+            "product_id": PRODUCT,
+            "allocated_from_production_job_id": JOB,
+        },
+    },
+    "ShipmentCreated": {
+        "table": "stg_shipments",
+        "timestamp_column": "event_timestamp",
+        "parents": {
+            "order_id": ORDER,
+            "customer_id": CUSTOMER,
+            "product_id": PRODUCT,
+            "allocated_from_production_job_id": JOB,
+        },
+    },
+    "MaterialRequirementsCreated": {
+        "table": "stg_material_requirements",
+        "timestamp_column": "event_timestamp",
+        "json_columns": ["requirements"],
+        "parents": {"order_id": ORDER, "product_id": PRODUCT},
+    },
+    "ProductionStarted": {
+        "table": "stg_production_starts",
+        "timestamp_column": "event_timestamp",
+        "parents": {"job_id": JOB, "product_id": PRODUCT},
+    },
+    "ProductionCompleted": {
+        "table": "stg_production_completions",
+        "timestamp_column": "event_timestamp",
+        "parents": {"job_id": JOB, "product_id": PRODUCT},
+    },
+    "SOPSnapshotCreated": {
+        "table": "stg_sop_snapshots",
+        "timestamp_column": "event_timestamp",
+        "exclude_prefixes": {"product_id": "P-"},
+        "parents": {"product_id": PRODUCT},
+    },
+    "PaymentReceived": {
+        "table": "stg_payments",
+        "timestamp_column": "event_timestamp",
+        "parents": {"invoice_id": ("stg_invoices", "invoice_id"), "order_id": ORDER},
+    },
+    "ReorderTriggered": {
+        "table": "stg_reorders",
+        "timestamp_column": "event_timestamp",
+        "parents": {"part_id": PART},
+    },
+}
+
+EVENT_TYPES = list(EVENT_REGISTRY)
+STAGING_TABLES = [spec["table"] for spec in EVENT_REGISTRY.values()]
+TABLE_EVENT_TYPES = {spec["table"]: event_type for event_type, spec in EVENT_REGISTRY.items()}
+
+
+def staging_parents(spec):
+    """Staging tables spec['table'] has foreign keys to."""
+    return sorted({table for table, _ in spec.get("parents", {}).values() if table in TABLE_EVENT_TYPES} - {spec["table"]})
+
+
+def unpack_group(spec, group):
+    """Flatten the payloads of one event type into a staging frame.
+    group holds event_id, timestamp and payload for events of that type.
+    """
+    df = pd.DataFrame(group["payload"].tolist())
+    df["source_event_id"] = group["event_id"].values
+    if spec.get("timestamp_column"):
+        df[spec["timestamp_column"]] = group["timestamp"].array
+    if spec.get("drop_columns"):
+        df = df.drop(columns=spec["drop_columns"], errors="ignore")
+    for col, mapping in spec.get("value_maps", {}).items():
+        df[col] = df[col].map(mapping) if col in df.columns else pd.Series(dtype=object)
+    for col in spec.get("json_columns", []):
+        if col in df.columns:
+            df[col] = df[col].apply(lambda x: json.dumps(x) if isinstance(x, (list, dict)) else x)
+    for col, prefix in spec.get("exclude_prefixes", {}).items():
+        if col in df.columns:
+            df = df[~df[col].astype(str).str.startswith(prefix)]
+    return df
+
+
+def partition_events(df_events):
+    """Route events to staging frames in one grouped pass over df_events.
+    Returns {table: frame} for every registered table that has events.
+    """
+    frames = {}
+    for event_type, group in df_events.groupby("event_type", sort=False):
+        spec = EVENT_REGISTRY.get(event_type)
+        if spec is not None:
+            frames[spec["table"]] = unpack_group(spec, group)
+    return frames
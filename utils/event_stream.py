@@ -0,0 +1,225 @@
+"""
+Streaming readers for event JSONL files.
+Lines are parsed into fixed-size columnar batches (one list per fact_events
+column) so callers can validate and write each batch before the next one is
+read, keeping memory flat.
+
+With more than one parse worker, files are cut into newline-aligned byte ranges
+that a process pool parses in parallel; each worker returns a columnar batch
+rather than a list of dicts.
+
+Payloads are passed through as the raw JSON text of the line: only timestamp and
+event_type are pulled out, and Postgres parses the payload once on its way into
+JSONB. Lines that do not have the simulator's layout fall back to json.loads.
+The payload text is not validated on the way (that would cost a full parse per
+line); copy_events sends each batch under a savepoint and, if Postgres rejects
+it (a truncated payload, keys after the payload), re-parses that batch's
+payloads in Python and skips the bad lines, as the json.loads path does.
+"""
+import json
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+import psycopg2
+
+from utils.bulk_load import copy_dataframe
+
+DEFAULT_BATCH_SIZE = int(os.getenv("EVENT_BATCH_SIZE", "50000"))
+PARSE_WORKERS = int(os.getenv("EVENT_PARSE_WORKERS", "1"))
+RANGE_BYTES = int(os.getenv("EVENT_RANGE_BYTES", str(32 * 1024 * 1024)))
+RAW_PAYLOAD = os.getenv("EVENT_RAW_PAYLOAD", "1") != "0"
+
+EVENT_COLUMNS = ["timestamp", "event_type", "payload"]
+
+# {"timestamp": "...", "event_type": "...", "payload": ...} with payload as the last key,
+# scalar fields free of escapes. The payload group runs to the object's closing brace.
+_LINE_TS_FIRST = re.compile(
+    rb'\{\s*"timestamp"\s*:\s*"([^"\\]*)"\s*,\s*"event_type"\s*:\s*"([^"\\]*)"\s*,\s*"payload"\s*:\s*(.*)\}',
+    re.S,
+)
+_LINE_TYPE_FIRST = re.compile(
+    rb'\{\s*"event_type"\s*:\s*"([^"\\]*)"\s*,\s*"timestamp"\s*:\s*"([^"\\]*)"\s*,\s*"payload"\s*:\s*(.*)\}',
+    re.S,
+)
+def split_event_line(line, raw_payload=RAW_PAYLOAD):
+    """Return (timestamp, event_type, payload JSON text) for a stripped line, or
+    None when the line is not a valid event."""
+    if raw_payload:
+        m = _LINE_TS_FIRST.fullmatch(line)
+        if m is not None:
+            timestamp, event_type, payload = m.group(1), m.group(2), m.group(3).rstrip()
+        else:
+            m = _LINE_TYPE_FIRST.fullmatch(line)
+            if m is not None:
+                event_type, timestamp, payload = m.group(1), m.group(2), m.group(3).rstrip()
+        if m is not None and payload[:1] in (b"{", b"[") and payload[-1:] in (b"}", b"]"):
+            try:
+                return timestamp.decode(), event_type.decode(), payload.decode()
+            except UnicodeDecodeError:
+                return None
+        if m is not None and payload == b"null":
+            return timestamp.decode(), event_type.decode(), None
+    try:
+        rec = json.loads(line)
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        return None
+    if not isinstance(rec, dict):
+        return None
+    payload = rec.get("payload")
+    return (
+        rec.get("timestamp"),
+        rec.get("event_type"),
+        json.dumps(payload) if isinstance(payload, (dict, list)) else payload,
+    )
+
+
+def _empty_columns():
+    return {col: [] for col in EVENT_COLUMNS}
+
+
+def _iter_lines(f, start, end, allow_partial_last):
+    """Yield (stripped line, next_offset) for whole lines of f in [start, end)."""
+    offset = start
+    f.seek(start)
+    for line in f:
+        if end is not None and offset + len(line) > end:
+            break
+        if not line.endswith(b"\n") and not allow_partial_last:
+            break
+        offset += len(line)
+        yield line.strip(), offset
+
+
+def iter_tail_batches(path, start_offset=0, end_offset=None, batch_size=DEFAULT_BATCH_SIZE, allow_partial_last=False):
+    """Yield (columns, next_offset, n_lines) for the lines of path in
+    [start_offset, end_offset), batch_size events at a time. A trailing line
+    without a newline is left for the next run unless allow_partial_last is set,
+    so next_offset always points at the start of an unread line.
+    """
+    columns = _empty_columns()
+    n_lines = 0
+    offset = start_offset
+    with open(path, "rb") as f:
+        for line, offset in _iter_lines(f, start_offset, end_offset, allow_partial_last):
+            n_lines += 1
+            event = split_event_line(line) if line else None
+            if event is not None:
+                for col, value in zip(EVENT_COLUMNS, event):
+                    columns[col].append(value)
+            if len(columns["payload"]) >= batch_size:
+                yield columns, offset, n_lines
+                columns = _empty_columns()
+                n_lines = 0
+    if columns["payload"] or n_lines:
+        yield columns, offset, n_lines
+
+
+def split_byte_ranges(path, start=0, end=None, range_bytes=RANGE_BYTES):
+    """Cut [start, end) of path into ranges of roughly range_bytes that each begin
+    at the start of a line."""
+    if end is None:
+        end = os.path.getsize(path)
+    ranges = []
+    with open(path, "rb") as f:
+        range_start = start
+        while range_start < end:
+            boundary = range_start + range_bytes
+            if boundary >= end:
+                ranges.append((range_start, end))
+                break
+            f.seek(boundary)
+            f.readline()
+            boundary = f.tell()
+            ranges.append((range_start, min(boundary, end)))
+            range_start = boundary
+    return ranges
+
+
+def parse_range(path, start, end, allow_partial_last=False):
+    """Parse the lines of path in [start, end) into one columnar batch.
+    Returns (columns, next_offset, n_lines) like iter_tail_batches.
+    """
+    columns = _empty_columns()
+    timestamps, event_types, payloads = columns["timestamp"], columns["event_type"], columns["payload"]
+    n_lines = 0
+    offset = start
+    with open(path, "rb") as f:
+        for line, offset in _iter_lines(f, start, end, allow_partial_last):
+            n_lines += 1
+            event = split_event_line(line) if line else None
+            if event is not None:
+                timestamps.append(event[0])
+                event_types.append(event[1])
+                payloads.append(event[2])
+    return columns, offset, n_lines
+
+
+def _parse_task(task):
+    return parse_range(*task)
+
+
+def iter_parsed_ranges(tasks, workers=PARSE_WORKERS):
+    """Yield parse_range results for tasks of (path, start, end[, allow_partial_last])
+    in task order. With workers > 1 a process pool parses up to 2 * workers ranges
+    ahead of the consumer, so memory stays bounded by range size.
+    """
+    if workers <= 1:
+        for task in tasks:
+            yield _parse_task(task)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        in_flight = []
+        for task in tasks:
+            in_flight.append(executor.submit(_parse_task, task))
+            if len(in_flight) >= 2 * workers:
+                yield in_flight.pop(0).result()
+        for future in in_flight:
+            yield future.result()
+
+
+def reparse_payloads(df_events):
+    """Re-derive payloads the way the json.loads path would, dropping events whose
+    payload is not valid JSON. The raw fast path captures everything after
+    "payload": up to the line's closing brace, so wrapping it back in an object
+    also recovers lines with keys after the payload."""
+    payloads, keep = [], []
+    for text in df_events["payload"]:
+        if not isinstance(text, str):
+            payloads.append(text)
+            keep.append(True)
+            continue
+        try:
+            payload = json.loads('{"payload": ' + text + "}")["payload"]
+        except json.JSONDecodeError:
+            payloads.append(None)
+            keep.append(False)
+            continue
+        payloads.append(json.dumps(payload) if isinstance(payload, (dict, list)) else payload)
+        keep.append(True)
+    df_events = df_events.assign(payload=payloads)
+    return df_events[keep]
+
+
+def copy_events(conn, df_events, columns=None):
+    """COPY a fact_events frame under a savepoint. If Postgres rejects a payload,
+    the batch is re-parsed with reparse_payloads and sent again. Returns the
+    number of rows sent."""
+    try:
+        with conn.begin_nested():
+            return copy_dataframe(conn, df_events, "fact_events", columns=columns, json_columns=["payload"])
+    except psycopg2.DataError:
+        df_events = reparse_payloads(df_events)
+    return copy_dataframe(conn, df_events, "fact_events", columns=columns, json_columns=["payload"])
+
+
+def columns_to_frame(columns, parse_timestamps=False):
+    """Build a fact_events frame from a columnar batch.
+    With parse_timestamps, rows whose timestamp cannot be parsed are dropped.
+    """
+    df_events = pd.DataFrame(columns, columns=EVENT_COLUMNS)
+    if parse_timestamps:
+        df_events["timestamp"] = pd.to_datetime(df_events["timestamp"], utc=True, errors="coerce", format="ISO8601")
+        df_events = df_events[~df_events["timestamp"].isna()]
+    return df_events
@@ -0,0 +1,48 @@
+"""
+Persisted ingest manifest: one row per remote event file with its size, mtime,
+the byte offset up to which it has been loaded into fact_events and the number
+of lines consumed. Loaders read and update it in the same transaction as the
+fact_events insert, so a file's tail is loaded exactly once.
+"""
+from datetime import datetime, timezone
+
+from sqlalchemy import text
+
+MANIFEST_COLUMNS = ["file_name", "remote_size", "remote_mtime", "byte_offset", "line_count"]
+
+
+def load_manifest(conn, source_host):
+    """Return {file_name: entry dict} for every file recorded for source_host."""
+    rows = conn.execute(
+        text(
+            "SELECT file_name, remote_size, remote_mtime, byte_offset, line_count "
+            "FROM ingest_manifest WHERE source_host = :source_host"
+        ),
+        {"source_host": source_host},
+    ).mappings()
+    return {row["file_name"]: dict(row) for row in rows}
+
+
+def save_manifest_entry(conn, source_host, entry):
+    """Insert or update one manifest row. entry holds the MANIFEST_COLUMNS keys."""
+    conn.execute(
+        text(
+            """
+            INSERT INTO ingest_manifest (
+                source_host, file_name, remote_size, remote_mtime, byte_offset, line_count, updated_at
+            )
+            VALUES (:source_host, :file_name, :remote_size, :remote_mtime, :byte_offset, :line_count, now())
+            ON CONFLICT (source_host, file_name) DO UPDATE SET
+                remote_size = EXCLUDED.remote_size,
+                remote_mtime = EXCLUDED.remote_mtime,
+                byte_offset = EXCLUDED.byte_offset,
+                line_count = EXCLUDED.line_count,
+                updated_at = now()
+            """
+        ),
+        {"source_host": source_host, **{col: entry[col] for col in MANIFEST_COLUMNS}},
+    )
+
+
+def mtime_to_datetime(st_mtime):
+    return datetime.fromtimestamp(st_mtime, tz=timezone.utc) if st_mtime is not None else None
@@ -1,10 +1,14 @@
 import pandas as pd
 import psycopg2
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
 from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
 from dotenv import load_dotenv
 import os
-import urllib.parse
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from utils.db import get_engine
 
 load_dotenv()
 
@@ -16,14 +20,8 @@ DB_CONFIG = {
     "database": os.getenv("DB_NAME"),
 }
 
-encoded_password = urllib.parse.quote_plus(DB_CONFIG["password"])
-
-SSL_ARGS = {"sslmode": "require"}
-
-def get_engine(db_name):
-    conn_str = f"postgresql://{DB_CONFIG['user']}:{encoded_password}@{DB_CONFIG['host']}:{DB_CONFIG['port']}/{db_name}"
-    engine = create_engine(conn_str, connect_args=SSL_ARGS)
-    return engine
+# Create fact_events range-partitioned by month (see utils/partitions.py)
+FACT_EVENTS_PARTITIONED = os.getenv("FACT_EVENTS_PARTITIONED", "0") == "1"
 
 def init_schema():
     engine = get_engine("postgres")
@@ -33,363 +31,559 @@ def init_schema():
 
     engine.dispose()
 
+# Table definitions, also parsed by utils.schema to type staging frames
+DDL_STATEMENTS = [
+    # DIM
+    """
+        CREATE TABLE IF NOT EXISTS dim_suppliers (
+        supplier_id VARCHAR(100) PRIMARY KEY,
+        name VARCHAR(255),
+        country VARCHAR(100),
+        reliability_score DECIMAL(3,2),
+        risk_factor VARCHAR(50),
+        price_multiplier DECIMAL(4,2)
+    );
+    """,
+    """
+        CREATE TABLE IF NOT EXISTS dim_customers (
+        customer_id VARCHAR(100) PRIMARY KEY,
+        company_name VARCHAR(255),
+        segment VARCHAR(100),
+        region VARCHAR(100),
+        country VARCHAR(100),
+        street VARCHAR(255),
+        city VARCHAR(100),
+        state VARCHAR(100),
+        postal_code VARCHAR(50),
+        destination_facility_id VARCHAR(100),
+        delivery_location_code VARCHAR(100),
+        contract_priority VARCHAR(50)
+    );
+    """,
+    """
+        CREATE TABLE IF NOT EXISTS dim_parts (
+        part_id VARCHAR(50) PRIMARY KEY,
+        name VARCHAR(255),
+        category VARCHAR(100),
+        standard_cost DECIMAL(10,2),
+        unit_of_measure VARCHAR(50),
+        reorder_point INTEGER DEFAULT 0,
+        safety_stock INTEGER DEFAULT 0
+    );
+    """,
+    """
+        CREATE TABLE IF NOT EXISTS dim_facilities (
+        facility_id VARCHAR(100) PRIMARY KEY,
+        facility_name VARCHAR(255),
+        city VARCHAR(100),
+        state VARCHAR(100),
+        country VARCHAR(100),
+        facility_type VARCHAR(100),
+        region VARCHAR(100),
+        location_code VARCHAR(100)
+    );
+    """,
+    """
+        CREATE TABLE IF NOT EXISTS dim_routes (
+        route_id VARCHAR(100) PRIMARY KEY,
+        origin_facility_id VARCHAR(100) REFERENCES dim_facilities(facility_id),
+        origin_location_code VARCHAR(100),
+        destination_country VARCHAR(100),
+        typical_distance_miles INTEGER,
+        typical_transit_days INTEGER,
+        base_rate_per_mile DECIMAL(10,2),
+        direction VARCHAR(50),
+        destination_facility_id VARCHAR(100) REFERENCES dim_facilities(facility_id),
+        destination_location_code VARCHAR(100)
+    );
+    """,
+    """
+        CREATE TABLE IF NOT EXISTS dim_products (
+        product_id VARCHAR(100) PRIMARY KEY,
+        name VARCHAR(255),
+        type VARCHAR(100),
+        key_features TEXT
+    );
+    """,
+    # FACT
+    """
+        CREATE TABLE IF NOT EXISTS fact_events (
+        event_id BIGSERIAL PRIMARY KEY,
+        timestamp TIMESTAMPTZ NOT NULL,
+        event_type VARCHAR(100) NOT NULL,
+        payload JSONB
+    );
+    """,
+    """
+        CREATE TABLE IF NOT EXISTS fact_inventory_snapshots (
+        snapshot_id BIGSERIAL PRIMARY KEY,
+        timestamp TIMESTAMPTZ NOT NULL,
+        part_id VARCHAR(50) REFERENCES dim_parts(part_id),
+        qty_on_hand INTEGER
+    );
+    """,
+    """
+        CREATE TABLE IF NOT EXISTS fact_orders (
+        order_id VARCHAR(100) PRIMARY KEY,
+        customer_id VARCHAR(100) REFERENCES dim_customers(customer_id),
+        order_date TIMESTAMPTZ,
+        total_amount DECIMAL(12,2),
+        status VARCHAR(50)
+    );
+    """,
+    # STAGING
+    """
+        CREATE TABLE IF NOT EXISTS stg_orders (
+        order_id UUID PRIMARY KEY,
+        customer_id VARCHAR(100) REFERENCES dim_customers(customer_id),
+        product_id VARCHAR(100) REFERENCES dim_products(product_id),
+        order_date TIMESTAMPTZ,
+        qty INTEGER,
+        unit_price DECIMAL(10,2),
+        line_total DECIMAL(12,2),
+        promo_id UUID,
+        source_event_id BIGINT REFERENCES fact_events(event_id)
+    );
+    """,
+    """
+        CREATE TABLE IF NOT EXISTS stg_loads (
+        load_id UUID PRIMARY KEY,
+        order_id UUID REFERENCES stg_orders(order_id),
+        order_ids UUID[] NOT NULL DEFAULT '{}',
+        customer_id VARCHAR(100) REFERENCES dim_customers(customer_id),
+        route_id VARCHAR(100) REFERENCES dim_routes(route_id),
+        product_id VARCHAR(100) REFERENCES dim_products(product_id),
+        qty INTEGER,
+        weight_lbs DECIMAL(10,2),
+        pieces INTEGER,
+        load_status VARCHAR(50),
+        scheduled_pickup TIMESTAMPTZ,
+        scheduled_delivery TIMESTAMPTZ,
+        actual_delivery TIMESTAMPTZ,
+        created_at TIMESTAMPTZ,
+        distance_miles INTEGER,
+        source_event_id BIGINT REFERENCES fact_events(event_id)
+    );    
+    """,
+    """
+        CREATE TABLE IF NOT EXISTS stg_backorders (
+        order_id UUID PRIMARY KEY REFERENCES stg_orders(order_id),
+        customer_id VARCHAR(100) REFERENCES dim_customers(customer_id),
+        product_id VARCHAR(100) REFERENCES dim_products(product_id),
+        backorder_timestamp TIMESTAMPTZ,
+        qty_backordered INTEGER,
+        original_order_qty INTEGER,
+        reason VARCHAR(100),
+        source_event_id BIGINT REFERENCES fact_events(event_id)
+    );
+    """,
+    """
+        CREATE TABLE IF NOT EXISTS stg_delivery_events (
+        event_id UUID PRIMARY KEY,
+        load_id UUID REFERENCES stg_loads(load_id),
+        event_type CHAR(1) NOT NULL,
+        facility_id VARCHAR(100) REFERENCES dim_facilities(facility_id),
+        event_timestamp TIMESTAMPTZ,
+        scheduled_datetime TIMESTAMPTZ,
+        actual_datetime TIMESTAMPTZ,
+        detention_minutes INTEGER,
+        on_time_flag BOOLEAN,
+        source_event_id BIGINT REFERENCES fact_events(event_id)
+    );    
+    """,
+    """
+        CREATE TABLE IF NOT EXISTS stg_invoices (
+        invoice_id UUID PRIMARY KEY,
+        order_id UUID REFERENCES stg_orders(order_id),
+        customer_id VARCHAR(100) REFERENCES dim_customers(customer_id),
+        product_id VARCHAR(100) REFERENCES dim_products(product_id),
+        qty INTEGER,
+        amount DECIMAL(12,2),
+        currency VARCHAR(10),
+        due_date TIMESTAMPTZ,
+        invoice_timestamp TIMESTAMPTZ,
+        source_event_id BIGINT REFERENCES fact_events(event_id)
+    );    
+    """,
+    """
+        CREATE TABLE IF NOT EXISTS stg_demand_forecasts (
+        snapshot_date DATE NOT NULL,
+        product_id VARCHAR(100) REFERENCES dim_products(product_id),
+        forecast_qty DECIMAL(12,2),
+        horizon_days INTEGER,
+        forecast_date DATE NOT NULL,
+        source_event_id BIGINT REFERENCES fact_events(event_id),
+        event_timestamp TIMESTAMPTZ NOT NULL,
+        PRIMARY KEY (source_event_id)
+    );    
+    """,
+    """
+        CREATE TABLE IF NOT EXISTS stg_production_jobs (
+        job_id UUID PRIMARY KEY,
+        product_id VARCHAR(100) REFERENCES dim_products(product_id),
+        status VARCHAR(50),
+        production_duration_hours INTEGER,
+        qty_per_job INTEGER,
+        source_event_id BIGINT REFERENCES fact_events(event_id),
+        event_timestamp TIMESTAMPTZ NOT NULL
+    );    
+    """,
+    """
+        CREATE TABLE IF NOT EXISTS stg_purchase_orders (
+        purchase_order_id UUID PRIMARY KEY,
+        part_id VARCHAR(50) REFERENCES dim_parts(part_id),
+        qty INTEGER,
+        supplier_id VARCHAR(100) REFERENCES dim_suppliers(supplier_id),
+        supplier_country VARCHAR(100),
+        lead_time_hours INTEGER,
+        eta TIMESTAMPTZ,
+        is_reorder BOOLEAN,
+        unit_cost DECIMAL(12,2),
+        total_cost DECIMAL(14,2),
+        base_cost DECIMAL(12,2),
+        source_event_id BIGINT REFERENCES fact_events(event_id),
+        event_timestamp TIMESTAMPTZ NOT NULL
+    );    
+    """,
+    """
+        CREATE TABLE IF NOT EXISTS stg_po_receipts (
+        purchase_order_id UUID NOT NULL REFERENCES stg_purchase_orders(purchase_order_id),
+        part_id VARCHAR(50) NOT NULL REFERENCES dim_parts(part_id),
+        qty_ordered INTEGER NOT NULL,
+        qty_received INTEGER NOT NULL,
+        qty_rejected INTEGER NOT NULL DEFAULT 0,
+        supplier_id VARCHAR(100) NOT NULL,
+        was_partial_shipment BOOLEAN NOT NULL DEFAULT false,
+        new_qty_on_hand INTEGER NOT NULL,
+        projected_eta TIMESTAMPTZ,
+        actual_receipt_time TIMESTAMPTZ,
+        received_timestamp TIMESTAMPTZ NOT NULL,
+        source_event_id BIGINT NOT NULL REFERENCES fact_events(event_id),
+        PRIMARY KEY (source_event_id)
+    );
+    """,
+    """
+        CREATE TABLE IF NOT EXISTS stg_backorder_fulfillments (
+        order_id UUID REFERENCES stg_orders(order_id),
+        customer_id VARCHAR(100) REFERENCES dim_customers(customer_id),
+        product_id VARCHAR(100) REFERENCES dim_products(product_id),
+        qty_shipped INTEGER,
+        qty_still_pending INTEGER,
+        original_order_qty INTEGER,
+        remaining_stock INTEGER,
+        allocation_source VARCHAR(100),
+        unit_price DECIMAL(12,2),
+        amount DECIMAL(12,2),
+        allocated_from_production_job_id UUID REFERENCES stg_production_jobs(job_id),
+        source_event_id BIGINT NOT NULL REFERENCES fact_events(event_id),
+        event_timestamp TIMESTAMPTZ NOT NULL,
+        PRIMARY KEY (source_event_id)
+    );
+    """,
+    """
+        CREATE TABLE IF NOT EXISTS stg_shipments (
+        order_id UUID REFERENCES stg_orders(order_id),
+        customer_id VARCHAR(100) REFERENCES dim_customers(customer_id),
+        product_id VARCHAR(100) REFERENCES dim_products(product_id),
+        qty INTEGER,
+        qty_ordered INTEGER,
+        fulfillment_type VARCHAR(100),
+        remaining_stock INTEGER,
+        allocation_source VARCHAR(100),
+        unit_price DECIMAL(12,2),
+        amount DECIMAL(12,2),
+        allocated_from_production_job_id UUID REFERENCES stg_production_jobs(job_id),
+        source_event_id BIGINT NOT NULL REFERENCES fact_events(event_id),
+        event_timestamp TIMESTAMPTZ NOT NULL,
+        PRIMARY KEY (source_event_id)
+    );
+    """,
+    """
+        CREATE TABLE IF NOT EXISTS stg_material_requirements (
+        order_id UUID REFERENCES stg_orders(order_id),
+        product_id VARCHAR(100) REFERENCES dim_products(product_id),
+        source VARCHAR(100),
+        required_by_date DATE,
+        requirements JSONB,
+        source_event_id BIGINT NOT NULL REFERENCES fact_events(event_id),
+        event_timestamp TIMESTAMPTZ NOT NULL,
+        PRIMARY KEY (source_event_id)
+    );
+    """,
+    """
+        CREATE TABLE IF NOT EXISTS stg_production_starts (
+        job_id UUID REFERENCES stg_production_jobs(job_id),
+        product_id VARCHAR(100) REFERENCES dim_products(product_id),
+        status VARCHAR(50),
+        expected_completion TIMESTAMPTZ,
+        event_timestamp TIMESTAMPTZ NOT NULL,
+        source_event_id BIGINT NOT NULL REFERENCES fact_events(event_id),
+        PRIMARY KEY (source_event_id)
+    );
+    """,
+    """
+        CREATE TABLE IF NOT EXISTS stg_production_completions (
+        job_id UUID REFERENCES stg_production_jobs(job_id),
+        product_id VARCHAR(100) REFERENCES dim_products(product_id),
+        status VARCHAR(50),
+        qty_produced INTEGER,
+        new_qty_on_hand INTEGER,
+        event_timestamp TIMESTAMPTZ NOT NULL,
+        source_event_id BIGINT NOT NULL REFERENCES fact_events(event_id),
+        PRIMARY KEY (source_event_id)
+    );
+    """,
+    """
+        CREATE TABLE IF NOT EXISTS stg_sop_snapshots (
+        plan_date DATE NOT NULL,
+        scenario VARCHAR(100),
+        product_id VARCHAR(100) REFERENCES dim_products(product_id),
+        demand_forecast_qty DECIMAL(12,2),
+        supply_plan_qty DECIMAL(12,2),
+        inventory_plan_qty DECIMAL(12,2),
+        event_timestamp TIMESTAMPTZ NOT NULL,
+        source_event_id BIGINT NOT NULL REFERENCES fact_events(event_id),
+        PRIMARY KEY (source_event_id)
+    );
+    """,
+    """
+        CREATE TABLE IF NOT EXISTS stg_payments (
+        invoice_id UUID NOT NULL REFERENCES stg_invoices(invoice_id),
+        order_id UUID REFERENCES stg_orders(order_id),
+        amount DECIMAL(12,2),
+        paid_at TIMESTAMPTZ,
+        on_time BOOLEAN,
+        source_event_id BIGINT NOT NULL REFERENCES fact_events(event_id),
+        event_timestamp TIMESTAMPTZ NOT NULL,
+        PRIMARY KEY (source_event_id)
+    );
+    """,
+    """
+        CREATE TABLE IF NOT EXISTS stg_reorders (
+        part_id VARCHAR(50) NOT NULL REFERENCES dim_parts(part_id),
+        qty_on_hand INTEGER NOT NULL,
+        reorder_point INTEGER NOT NULL,
+        net_position INTEGER NOT NULL,
+        order_qty INTEGER NOT NULL,
+        source_event_id BIGINT NOT NULL REFERENCES fact_events(event_id),
+        event_timestamp TIMESTAMPTZ NOT NULL,
+        PRIMARY KEY (source_event_id)
+    );
+    """,
+    # ROLLUP: one row per load, maintained as stg_delivery_events batches commit (see utils/rollups.py)
+    """
+        CREATE TABLE IF NOT EXISTS rollup_delivery_outcomes (
+        load_id UUID PRIMARY KEY,
+        pickup_at TIMESTAMPTZ,
+        delivered_at TIMESTAMPTZ,
+        pickup_facility_id VARCHAR(100),
+        delivery_facility_id VARCHAR(100),
+        detention_minutes INTEGER NOT NULL DEFAULT 0,
+        on_time_flag BOOLEAN,
+        event_count INTEGER NOT NULL DEFAULT 0,
+        last_source_event_id BIGINT,
+        updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+    );
+    """,
+    # STATE
+    """
+        CREATE TABLE IF NOT EXISTS system_state (
+        id INTEGER PRIMARY KEY DEFAULT 1,
+        current_simulation_time TIMESTAMPTZ,
+        tick_count BIGINT DEFAULT 0,
+        status VARCHAR(20) DEFAULT 'stopped',
+        CONSTRAINT single_row_const CHECK (id = 1)
+    );
+    """,
+    """
+        CREATE TABLE IF NOT EXISTS ingest_manifest (
+        source_host VARCHAR(255) NOT NULL,
+        file_name VARCHAR(255) NOT NULL,
+        remote_size BIGINT NOT NULL DEFAULT 0,
+        remote_mtime TIMESTAMPTZ,
+        byte_offset BIGINT NOT NULL DEFAULT 0,
+        line_count BIGINT NOT NULL DEFAULT 0,
+        updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+        PRIMARY KEY (source_host, file_name)
+    );
+    """,
+    """
+        CREATE TABLE IF NOT EXISTS unpack_state (
+        id INTEGER PRIMARY KEY DEFAULT 1,
+        last_event_id BIGINT NOT NULL DEFAULT 0,
+        last_replay_seq BIGINT NOT NULL DEFAULT 0,
+        updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+        CONSTRAINT unpack_state_single_row CHECK (id = 1)
+    );
+    """,
+    """
+        ALTER TABLE unpack_state ADD COLUMN IF NOT EXISTS last_replay_seq BIGINT NOT NULL DEFAULT 0;
+    """,
+    """
+        CREATE TABLE IF NOT EXISTS unpack_retry (
+        event_id BIGINT PRIMARY KEY,
+        event_type VARCHAR(100) NOT NULL,
+        reason TEXT,
+        attempts INTEGER NOT NULL DEFAULT 1,
+        first_failed_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+        last_failed_at TIMESTAMPTZ NOT NULL DEFAULT now()
+    );
+    """,
+    """
+        CREATE TABLE IF NOT EXISTS unpack_replayed (
+        seq BIGSERIAL PRIMARY KEY,
+        event_id BIGINT NOT NULL,
+        staged_at TIMESTAMPTZ NOT NULL DEFAULT now()
+    );
+    """,
+    """
+        CREATE TABLE IF NOT EXISTS unpack_pending (
+        id INTEGER PRIMARY KEY DEFAULT 1,
+        min_timestamp TIMESTAMPTZ,
+        load_seq BIGINT NOT NULL DEFAULT 0,
+        CONSTRAINT unpack_pending_single_row CHECK (id = 1)
+    );
+    """,
+    """
+        CREATE TABLE IF NOT EXISTS unpack_table_progress (
+        table_name VARCHAR(100) PRIMARY KEY,
+        last_event_id BIGINT NOT NULL DEFAULT 0,
+        updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+    );
+    """
+]
+
+# Secondary indexes, applied by apply_indexes() with CREATE INDEX CONCURRENTLY.
+# BRIN suits timestamps of append-only tables: rows arrive in time order, so a
+# block-range summary is tiny and still skips most of the table.
+INDEX_CATALOG = [
+    # FACT
+    {"table": "fact_events", "columns": ["timestamp"], "using": "brin"},
+    {"table": "fact_events", "columns": ["event_type", "event_id"]},
+    # STAGING: source_event_id where it is not already the primary key
+    {"table": "stg_orders", "columns": ["source_event_id"]},
+    {"table": "stg_loads", "columns": ["source_event_id"]},
+    {"table": "stg_backorders", "columns": ["source_event_id"]},
+    {"table": "stg_delivery_events", "columns": ["source_event_id"]},
+    {"table": "stg_invoices", "columns": ["source_event_id"]},
+    {"table": "stg_production_jobs", "columns": ["source_event_id"]},
+    {"table": "stg_purchase_orders", "columns": ["source_event_id"]},
+    # STAGING: foreign keys the marts join and aggregate on
+    {"table": "stg_orders", "columns": ["customer_id", "order_date"]},
+    {"table": "stg_orders", "columns": ["product_id"]},
+    {"table": "stg_orders", "columns": ["order_date"], "using": "brin"},
+    {"table": "stg_loads", "columns": ["order_id"]},
+    {"table": "stg_delivery_events", "columns": ["load_id", "event_type"]},
+    {"table": "stg_invoices", "columns": ["order_id"]},
+    {"table": "stg_payments", "columns": ["invoice_id"]},
+    {"table": "stg_shipments", "columns": ["order_id"]},
+    {"table": "stg_backorder_fulfillments", "columns": ["order_id"]},
+    {"table": "stg_po_receipts", "columns": ["purchase_order_id"]},
+    {"table": "stg_production_starts", "columns": ["job_id"]},
+    {"table": "stg_production_completions", "columns": ["job_id"]},
+    {"table": "stg_material_requirements", "columns": ["order_id"]},
+    {"table": "stg_demand_forecasts", "columns": ["product_id", "forecast_date"]},
+    {"table": "stg_sop_snapshots", "columns": ["product_id"]},
+    {"table": "fact_inventory_snapshots", "columns": ["part_id", "timestamp"]},
+]
+
+def index_name(spec):
+    return spec.get("name") or f"ix_{spec['table']}_{'_'.join(spec['columns'])}"
+
+def index_ddl(spec, concurrently=True):
+    using = spec.get("using", "btree")
+    columns = ", ".join(f'"{c}"' for c in spec["columns"])
+    concurrent = "CONCURRENTLY " if concurrently else ""
+    return f"CREATE INDEX {concurrent}IF NOT EXISTS {index_name(spec)} ON {spec['table']} USING {using} ({columns})"
+
+def apply_indexes(engine, catalog=INDEX_CATALOG):
+    """Create missing catalog indexes without blocking writers. Runs in
+    autocommit since CONCURRENTLY cannot run in a transaction; an index left
+    INVALID by an interrupted build is dropped and rebuilt. Partitioned tables
+    do not support CONCURRENTLY, so their indexes are built with a plain
+    CREATE INDEX that cascades to every partition. Raises ValueError if two
+    catalog entries name the same index."""
+    names = [index_name(spec) for spec in catalog]
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if duplicates:
+        raise ValueError(f"Duplicate index catalog entries: {', '.join(duplicates)}")
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        partitioned = {row[0] for row in conn.execute(text(
+            "SELECT c.relname FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid"
+        ))}
+        invalid = {row[0] for row in conn.execute(text(
+            "SELECT c.relname FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid WHERE NOT i.indisvalid"
+        ))}
+        for spec in catalog:
+            name = index_name(spec)
+            if name in invalid:
+                print(f"Rebuilding invalid index {name}")
+                conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+            conn.execute(text(index_ddl(spec, concurrently=spec["table"] not in partitioned)))
+        print(f"SUCCESS: {len(catalog)} catalog indexes present")
+
+
+def index_report(engine, catalog=INDEX_CATALOG):
+    """Return {"unused", "missing", "seq_scans"} DataFrames: non-unique indexes
+    never scanned since stats were reset, catalog indexes absent from the
+    database, and tables read mostly by sequential scans."""
+    with engine.connect() as conn:
+        unused = pd.read_sql(text(
+            """
+            SELECT s.relname AS table_name, s.indexrelname AS index_name, s.idx_scan,
+                   pg_size_pretty(pg_relation_size(s.indexrelid)) AS index_size
+            FROM pg_stat_user_indexes s
+            JOIN pg_index i ON i.indexrelid = s.indexrelid
+            WHERE s.idx_scan = 0 AND NOT i.indisunique AND NOT i.indisprimary
+            ORDER BY pg_relation_size(s.indexrelid) DESC
+            """
+        ), conn)
+        existing = set(pd.read_sql(text("SELECT indexname FROM pg_indexes"), conn)["indexname"])
+        seq_scans = pd.read_sql(text(
+            """
+            SELECT relname AS table_name, seq_scan, seq_tup_read, COALESCE(idx_scan, 0) AS idx_scan, n_live_tup
+            FROM pg_stat_user_tables
+            WHERE seq_scan > COALESCE(idx_scan, 0) AND n_live_tup > 10000
+            ORDER BY seq_tup_read DESC
+            """
+        ), conn)
+    missing = pd.DataFrame(
+        [{"table_name": spec["table"], "index_name": index_name(spec), "ddl": index_ddl(spec)}
+         for spec in catalog if index_name(spec) not in existing],
+        columns=["table_name", "index_name", "ddl"],
+    )
+    return {"unused": unused, "missing": missing, "seq_scans": seq_scans}
+
+# Partitioned fact_events: the primary key must include the partition key, so
+# staging tables keep source_event_id without a foreign key to it
+FACT_EVENTS_PARTITIONED_DDL = """
+        CREATE TABLE IF NOT EXISTS fact_events (
+        event_id BIGSERIAL,
+        timestamp TIMESTAMPTZ NOT NULL,
+        event_type VARCHAR(100) NOT NULL,
+        payload JSONB,
+        PRIMARY KEY (event_id, timestamp)
+    ) PARTITION BY RANGE (timestamp);
+    """
+
+def table_ddl(partitioned=FACT_EVENTS_PARTITIONED):
+    if not partitioned:
+        return DDL_STATEMENTS
+    statements = []
+    for sql in DDL_STATEMENTS:
+        if "CREATE TABLE IF NOT EXISTS fact_events (" in sql:
+            statements.append(FACT_EVENTS_PARTITIONED_DDL)
+        else:
+            statements.append(sql.replace(" REFERENCES fact_events(event_id)", ""))
+    return statements
+
 def init_tables():
     engine = get_engine(DB_CONFIG['database'])
 
-    ddl_statements = [
-        # DIM
-        """
-            CREATE TABLE IF NOT EXISTS dim_suppliers (
-            supplier_id VARCHAR(100) PRIMARY KEY,
-            name VARCHAR(255),
-            country VARCHAR(100),
-            reliability_score DECIMAL(3,2),
-            risk_factor VARCHAR(50),
-            price_multiplier DECIMAL(4,2)
-        );
-        """,
-        """
-            CREATE TABLE IF NOT EXISTS dim_customers (
-            customer_id VARCHAR(100) PRIMARY KEY,
-            company_name VARCHAR(255),
-            segment VARCHAR(100),
-            region VARCHAR(100),
-            country VARCHAR(100),
-            street VARCHAR(255),
-            city VARCHAR(100),
-            state VARCHAR(100),
-            postal_code VARCHAR(50),
-            destination_facility_id VARCHAR(100),
-            delivery_location_code VARCHAR(100),
-            contract_priority VARCHAR(50)
-        );
-        """,
-        """
-            CREATE TABLE IF NOT EXISTS dim_parts (
-            part_id VARCHAR(50) PRIMARY KEY,
-            name VARCHAR(255),
-            category VARCHAR(100),
-            standard_cost DECIMAL(10,2),
-            unit_of_measure VARCHAR(50),
-            reorder_point INTEGER DEFAULT 0,
-            safety_stock INTEGER DEFAULT 0
-        );
-        """,
-        """
-            CREATE TABLE IF NOT EXISTS dim_facilities (
-            facility_id VARCHAR(100) PRIMARY KEY,
-            facility_name VARCHAR(255),
-            city VARCHAR(100),
-            state VARCHAR(100),
-            country VARCHAR(100),
-            facility_type VARCHAR(100),
-            region VARCHAR(100),
-            location_code VARCHAR(100)
-        );
-        """,
-        """
-            CREATE TABLE IF NOT EXISTS dim_routes (
-            route_id VARCHAR(100) PRIMARY KEY,
-            origin_facility_id VARCHAR(100) REFERENCES dim_facilities(facility_id),
-            origin_location_code VARCHAR(100),
-            destination_country VARCHAR(100),
-            typical_distance_miles INTEGER,
-            typical_transit_days INTEGER,
-            base_rate_per_mile DECIMAL(10,2),
-            direction VARCHAR(50),
-            destination_facility_id VARCHAR(100) REFERENCES dim_facilities(facility_id),
-            destination_location_code VARCHAR(100)
-        );
-        """,
-        """
-            CREATE TABLE IF NOT EXISTS dim_products (
-            product_id VARCHAR(100) PRIMARY KEY,
-            name VARCHAR(255),
-            type VARCHAR(100),
-            key_features TEXT
-        );
-        """,
-        # FACT
-        """
-            CREATE TABLE IF NOT EXISTS fact_events (
-            event_id BIGSERIAL PRIMARY KEY,
-            timestamp TIMESTAMPTZ NOT NULL,
-            event_type VARCHAR(100) NOT NULL,
-            payload JSONB
-        );
-        """,
-        """
-            CREATE TABLE IF NOT EXISTS fact_inventory_snapshots (
-            snapshot_id BIGSERIAL PRIMARY KEY,
-            timestamp TIMESTAMPTZ NOT NULL,
-            part_id VARCHAR(50) REFERENCES dim_parts(part_id),
-            qty_on_hand INTEGER
-        );
-        """,
-        """
-            CREATE TABLE IF NOT EXISTS fact_orders (
-            order_id VARCHAR(100) PRIMARY KEY,
-            customer_id VARCHAR(100) REFERENCES dim_customers(customer_id),
-            order_date TIMESTAMPTZ,
-            total_amount DECIMAL(12,2),
-            status VARCHAR(50)
-        );
-        """,
-        # STAGING
-        """
-            CREATE TABLE IF NOT EXISTS stg_orders (
-            order_id UUID PRIMARY KEY,
-            customer_id VARCHAR(100) REFERENCES dim_customers(customer_id),
-            product_id VARCHAR(100) REFERENCES dim_products(product_id),
-            order_date TIMESTAMPTZ,
-            qty INTEGER,
-            unit_price DECIMAL(10,2),
-            line_total DECIMAL(12,2),
-            promo_id UUID,
-            source_event_id BIGINT REFERENCES fact_events(event_id)
-        );
-        """,
-        """
-            CREATE TABLE IF NOT EXISTS stg_loads (
-            load_id UUID PRIMARY KEY,
-            order_id UUID REFERENCES stg_orders(order_id),
-            order_ids UUID[] NOT NULL DEFAULT '{}',
-            customer_id VARCHAR(100) REFERENCES dim_customers(customer_id),
-            route_id VARCHAR(100) REFERENCES dim_routes(route_id),
-            product_id VARCHAR(100) REFERENCES dim_products(product_id),
-            qty INTEGER,
-            weight_lbs DECIMAL(10,2),
-            pieces INTEGER,
-            load_status VARCHAR(50),
-            scheduled_pickup TIMESTAMPTZ,
-            scheduled_delivery TIMESTAMPTZ,
-            actual_delivery TIMESTAMPTZ,
-            created_at TIMESTAMPTZ,
-            distance_miles INTEGER,
-            source_event_id BIGINT REFERENCES fact_events(event_id)
-        );    
-        """,
-        """
-            CREATE TABLE IF NOT EXISTS stg_backorders (
-            order_id UUID PRIMARY KEY REFERENCES stg_orders(order_id),
-            customer_id VARCHAR(100) REFERENCES dim_customers(customer_id),
-            product_id VARCHAR(100) REFERENCES dim_products(product_id),
-            backorder_timestamp TIMESTAMPTZ,
-            qty_backordered INTEGER,
-            original_order_qty INTEGER,
-            reason VARCHAR(100),
-            source_event_id BIGINT REFERENCES fact_events(event_id)
-        );
-        """,
-        """
-            CREATE TABLE IF NOT EXISTS stg_delivery_events (
-            event_id UUID PRIMARY KEY,
-            load_id UUID REFERENCES stg_loads(load_id),
-            event_type CHAR(1) NOT NULL,
-            facility_id VARCHAR(100) REFERENCES dim_facilities(facility_id),
-            event_timestamp TIMESTAMPTZ,
-            scheduled_datetime TIMESTAMPTZ,
-            actual_datetime TIMESTAMPTZ,
-            detention_minutes INTEGER,
-            on_time_flag BOOLEAN,
-            source_event_id BIGINT REFERENCES fact_events(event_id)
-        );    
-        """,
-        """
-            CREATE TABLE IF NOT EXISTS stg_invoices (
-            invoice_id UUID PRIMARY KEY,
-            order_id UUID REFERENCES stg_orders(order_id),
-            customer_id VARCHAR(100) REFERENCES dim_customers(customer_id),
-            product_id VARCHAR(100) REFERENCES dim_products(product_id),
-            qty INTEGER,
-            amount DECIMAL(12,2),
-            currency VARCHAR(10),
-            due_date TIMESTAMPTZ,
-            invoice_timestamp TIMESTAMPTZ,
-            source_event_id BIGINT REFERENCES fact_events(event_id)
-        );    
-        """,
-        """
-            CREATE TABLE IF NOT EXISTS stg_demand_forecasts (
-            snapshot_date DATE NOT NULL,
-            product_id VARCHAR(100) REFERENCES dim_products(product_id),
-            forecast_qty DECIMAL(12,2),
-            horizon_days INTEGER,
-            forecast_date DATE NOT NULL,
-            source_event_id BIGINT REFERENCES fact_events(event_id),
-            event_timestamp TIMESTAMPTZ NOT NULL,
-            PRIMARY KEY (source_event_id)
-        );    
-        """,
-        """
-            CREATE TABLE IF NOT EXISTS stg_production_jobs (
-            job_id UUID PRIMARY KEY,
-            product_id VARCHAR(100) REFERENCES dim_products(product_id),
-            status VARCHAR(50),
-            production_duration_hours INTEGER,
-            qty_per_job INTEGER,
-            source_event_id BIGINT REFERENCES fact_events(event_id),
-            event_timestamp TIMESTAMPTZ NOT NULL
-        );    
-        """,
-        """
-            CREATE TABLE IF NOT EXISTS stg_purchase_orders (
-            purchase_order_id UUID PRIMARY KEY,
-            part_id VARCHAR(50) REFERENCES dim_parts(part_id),
-            qty INTEGER,
-            supplier_id VARCHAR(100) REFERENCES dim_suppliers(supplier_id),
-            supplier_country VARCHAR(100),
-            lead_time_hours INTEGER,
-            eta TIMESTAMPTZ,
-            is_reorder BOOLEAN,
-            unit_cost DECIMAL(12,2),
-            total_cost DECIMAL(14,2),
-            base_cost DECIMAL(12,2),
-            source_event_id BIGINT REFERENCES fact_events(event_id),
-            event_timestamp TIMESTAMPTZ NOT NULL
-        );    
-        """,
-        """
-            CREATE TABLE IF NOT EXISTS stg_po_receipts (
-            purchase_order_id UUID NOT NULL REFERENCES stg_purchase_orders(purchase_order_id),
-            part_id VARCHAR(50) NOT NULL REFERENCES dim_parts(part_id),
-            qty_ordered INTEGER NOT NULL,
-            qty_received INTEGER NOT NULL,
-            qty_rejected INTEGER NOT NULL DEFAULT 0,
-            supplier_id VARCHAR(100) NOT NULL,
-            was_partial_shipment BOOLEAN NOT NULL DEFAULT false,
-            new_qty_on_hand INTEGER NOT NULL,
-            projected_eta TIMESTAMPTZ,
-            actual_receipt_time TIMESTAMPTZ,
-            received_timestamp TIMESTAMPTZ NOT NULL,
-            source_event_id BIGINT NOT NULL REFERENCES fact_events(event_id),
-            PRIMARY KEY (source_event_id)
-        );
-        """,
-        """
-            CREATE TABLE IF NOT EXISTS stg_backorder_fulfillments (
-            order_id UUID REFERENCES stg_orders(order_id),
-            customer_id VARCHAR(100) REFERENCES dim_customers(customer_id),
-            product_id VARCHAR(100) REFERENCES dim_products(product_id),
-            qty_shipped INTEGER,
-            qty_still_pending INTEGER,
-            original_order_qty INTEGER,
-            remaining_stock INTEGER,
-            allocation_source VARCHAR(100),
-            unit_price DECIMAL(12,2),
-            amount DECIMAL(12,2),
-            allocated_from_production_job_id UUID REFERENCES stg_production_jobs(job_id),
-            source_event_id BIGINT NOT NULL REFERENCES fact_events(event_id),
-            event_timestamp TIMESTAMPTZ NOT NULL,
-            PRIMARY KEY (source_event_id)
-        );
-        """,
-        """
-            CREATE TABLE IF NOT EXISTS stg_shipments (
-            order_id UUID REFERENCES stg_orders(order_id),
-            customer_id VARCHAR(100) REFERENCES dim_customers(customer_id),
-            product_id VARCHAR(100) REFERENCES dim_products(product_id),
-            qty INTEGER,
-            qty_ordered INTEGER,
-            fulfillment_type VARCHAR(100),
-            remaining_stock INTEGER,
-            allocation_source VARCHAR(100),
-            unit_price DECIMAL(12,2),
-            amount DECIMAL(12,2),
-            allocated_from_production_job_id UUID REFERENCES stg_production_jobs(job_id),
-            source_event_id BIGINT NOT NULL REFERENCES fact_events(event_id),
-            event_timestamp TIMESTAMPTZ NOT NULL,
-            PRIMARY KEY (source_event_id)
-        );
-        """,
-        """
-            CREATE TABLE IF NOT EXISTS stg_material_requirements (
-            order_id UUID REFERENCES stg_orders(order_id),
-            product_id VARCHAR(100) REFERENCES dim_products(product_id),
-            source VARCHAR(100),
-            required_by_date DATE,
-            requirements JSONB,
-            source_event_id BIGINT NOT NULL REFERENCES fact_events(event_id),
-            event_timestamp TIMESTAMPTZ NOT NULL,
-            PRIMARY KEY (source_event_id)
-        );
-        """,
-        """
-            CREATE TABLE IF NOT EXISTS stg_production_starts (
-            job_id UUID REFERENCES stg_production_jobs(job_id),
-            product_id VARCHAR(100) REFERENCES dim_products(product_id),
-            status VARCHAR(50),
-            expected_completion TIMESTAMPTZ,
-            event_timestamp TIMESTAMPTZ NOT NULL,
-            source_event_id BIGINT NOT NULL REFERENCES fact_events(event_id),
-            PRIMARY KEY (source_event_id)
-        );
-        """,
-        """
-            CREATE TABLE IF NOT EXISTS stg_production_completions (
-            job_id UUID REFERENCES stg_production_jobs(job_id),
-            product_id VARCHAR(100) REFERENCES dim_products(product_id),
-            status VARCHAR(50),
-            qty_produced INTEGER,
-            new_qty_on_hand INTEGER,
-            event_timestamp TIMESTAMPTZ NOT NULL,
-            source_event_id BIGINT NOT NULL REFERENCES fact_events(event_id),
-            PRIMARY KEY (source_event_id)
-        );
-        """,
-        """
-            CREATE TABLE IF NOT EXISTS stg_sop_snapshots (
-            plan_date DATE NOT NULL,
-            scenario VARCHAR(100),
-            product_id VARCHAR(100) REFERENCES dim_products(product_id),
-            demand_forecast_qty DECIMAL(12,2),
-            supply_plan_qty DECIMAL(12,2),
-            inventory_plan_qty DECIMAL(12,2),
-            event_timestamp TIMESTAMPTZ NOT NULL,
-            source_event_id BIGINT NOT NULL REFERENCES fact_events(event_id),
-            PRIMARY KEY (source_event_id)
-        );
-        """,
-        """
-            CREATE TABLE IF NOT EXISTS stg_payments (
-            invoice_id UUID NOT NULL REFERENCES stg_invoices(invoice_id),
-            order_id UUID REFERENCES stg_orders(order_id),
-            amount DECIMAL(12,2),
-            paid_at TIMESTAMPTZ,
-            on_time BOOLEAN,
-            source_event_id BIGINT NOT NULL REFERENCES fact_events(event_id),
-            event_timestamp TIMESTAMPTZ NOT NULL,
-            PRIMARY KEY (source_event_id)
-        );
-        """,
-        """
-            CREATE TABLE IF NOT EXISTS stg_reorders (
-            part_id VARCHAR(50) NOT NULL REFERENCES dim_parts(part_id),
-            qty_on_hand INTEGER NOT NULL,
-            reorder_point INTEGER NOT NULL,
-            net_position INTEGER NOT NULL,
-            order_qty INTEGER NOT NULL,
-            source_event_id BIGINT NOT NULL REFERENCES fact_events(event_id),
-            event_timestamp TIMESTAMPTZ NOT NULL,
-            PRIMARY KEY (source_event_id)
-        );
-        """,
-        # STATE
-        """
-            CREATE TABLE IF NOT EXISTS system_state (
-            id INTEGER PRIMARY KEY DEFAULT 1,
-            current_simulation_time TIMESTAMPTZ,
-            tick_count BIGINT DEFAULT 0,
-            status VARCHAR(20) DEFAULT 'stopped',
-            CONSTRAINT single_row_const CHECK (id = 1)
-        );
-        """
-    ]
-
     try:
         with engine.connect() as conn:
             trans = conn.begin()
-            for sql in ddl_statements:
+            for sql in table_ddl():
                 conn.execute(text(sql))
             trans.commit()
             print("SUCCESS: Tables initialized successfully")
@@ -399,3 +593,4 @@ def init_tables():
 if __name__ == "__main__":
     init_schema()
     init_tables()
+    apply_indexes(get_engine(DB_CONFIG['database']))
@@ -3,30 +3,38 @@ Create and refresh BI/data mart tables from staging and dimensions.
 Run after init_db and after staging is populated.
 """
 import os
-from urllib.parse import quote_plus
+import re
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
 
 from dotenv import load_dotenv
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
 
-load_dotenv()
-
-DB_CONFIG = {
-    "host": os.getenv("DB_HOST"),
-    "user": os.getenv("DB_USER"),
-    "password": os.getenv("DB_PASSWORD"),
-    "port": os.getenv("DB_PORT"),
-    "database": os.getenv("DB_NAME"),
-}
-encoded_password = quote_plus(DB_CONFIG["password"])
-SSL_ARGS = {"sslmode": os.getenv("DB_SSL", "require")}
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from utils.db import get_engine
+from utils.rollups import (
+    INSERT_ROLLUP_DELIVERY_OUTCOMES,
+    UPSERT_ROLLUP_DELIVERY_OUTCOMES,
+    period_rollup_sql,
+    touched_periods_sql,
+)
 
+load_dotenv()
 
-def get_engine():
-    conn_str = (
-        f"postgresql://{DB_CONFIG['user']}:{encoded_password}@"
-        f"{DB_CONFIG['host']}:{DB_CONFIG['port']}/{DB_CONFIG['database']}"
-    )
-    return create_engine(conn_str, connect_args=SSL_ARGS)
+# 'incremental' upserts only keys touched since each mart's watermark; 'full' rebuilds
+# in place under TRUNCATE; 'swap' rebuilds into shadow tables and renames them in
+MART_REFRESH_MODE = os.getenv("MART_REFRESH_MODE", "incremental")
+# How long a swap may wait for readers' locks before backing off and retrying
+SWAP_LOCK_TIMEOUT = os.getenv("MART_SWAP_LOCK_TIMEOUT", "2s")
+SWAP_RETRIES = int(os.getenv("MART_SWAP_RETRIES", "5"))
+# 'table' keeps marts as tables refreshed per MART_REFRESH_MODE; 'matview' defines
+# them as materialized views refreshed with REFRESH MATERIALIZED VIEW CONCURRENTLY
+MART_BACKEND = os.getenv("MART_BACKEND", "table")
+# Marts refreshed concurrently, each on its own pooled connection
+MART_REFRESH_WORKERS = int(os.getenv("MART_REFRESH_WORKERS", "4"))
 
 
 # ---------------------------------------------------------------------------
@@ -233,17 +241,12 @@ SELECT
     l.scheduled_pickup,
     l.scheduled_delivery,
     l.actual_delivery,
-    de.on_time_flag AS delivery_on_time,
+    d.on_time_flag AS delivery_on_time,
     l.created_at
 FROM stg_loads l
 LEFT JOIN dim_routes r ON r.route_id = l.route_id
 LEFT JOIN dim_products p ON p.product_id = l.product_id
-LEFT JOIN LATERAL (
-    SELECT on_time_flag
-    FROM stg_delivery_events
-    WHERE load_id = l.load_id AND event_type = 'D'
-    LIMIT 1
-) de ON true
+LEFT JOIN rollup_delivery_outcomes d ON d.load_id = l.load_id
 """
 
 # ---------------------------------------------------------------------------
@@ -452,8 +455,8 @@ SELECT
     o.customer_id,
     c.company_name AS customer_name,
     c.region AS customer_region,
-    EXTRACT(YEAR FROM o.order_date)::INTEGER AS year,
-    EXTRACT(MONTH FROM o.order_date)::INTEGER AS month,
+    EXTRACT(YEAR FROM o.order_date AT TIME ZONE 'UTC')::INTEGER AS year,
+    EXTRACT(MONTH FROM o.order_date AT TIME ZONE 'UTC')::INTEGER AS month,
     DATE_TRUNC('month', o.order_date AT TIME ZONE 'UTC')::DATE AS month_start,
     COUNT(*)::INTEGER AS order_count,
     COALESCE(SUM(o.qty), 0)::INTEGER AS total_qty,
@@ -462,14 +465,19 @@ FROM stg_orders o
 LEFT JOIN dim_customers c ON c.customer_id = o.customer_id
 WHERE o.order_date IS NOT NULL
 GROUP BY o.customer_id, c.company_name, c.region,
-         EXTRACT(YEAR FROM o.order_date),
-         EXTRACT(MONTH FROM o.order_date),
+         EXTRACT(YEAR FROM o.order_date AT TIME ZONE 'UTC'),
+         EXTRACT(MONTH FROM o.order_date AT TIME ZONE 'UTC'),
          DATE_TRUNC('month', o.order_date AT TIME ZONE 'UTC')
 """
 
 # ---------------------------------------------------------------------------
 # Forecast vs actual orders (weekly and monthly, for Excel comparison)
 # ---------------------------------------------------------------------------
+# Period grains (see utils.rollups.PERIOD_GRAINS: week, month, quarter, isoyear).
+# After changing them run one MART_REFRESH_MODE=full refresh to backfill.
+FORECAST_VS_ACTUAL_GRAINS = [
+    g.strip() for g in os.getenv("MART_FORECAST_GRAINS", "week,month").split(",") if g.strip()
+]
 DDL_MART_FORECAST_VS_ACTUAL = """
 CREATE TABLE IF NOT EXISTS mart_forecast_vs_actual (
     product_id VARCHAR(100) NOT NULL,
@@ -489,68 +497,42 @@ CREATE INDEX IF NOT EXISTS ix_mart_forecast_vs_actual_period
     ON mart_forecast_vs_actual (period_type, period_start)
 """
 
-INSERT_MART_FORECAST_VS_ACTUAL = """
+FORECAST_VS_ACTUAL_COLUMNS = (
+    "product_id, product_name, period_type, period_start, forecast_qty, actual_qty, "
+    "variance_qty, variance_pct, actual_amount"
+)
+
+
+def _forecast_vs_actual_select(forecast_where="TRUE", actual_where="TRUE"):
+    """Forecast and actual qty per product and period, each source scanned once
+    for all FORECAST_VS_ACTUAL_GRAINS."""
+    forecast = period_rollup_sql(
+        "stg_demand_forecasts", "product_id", "s.forecast_date::timestamp",
+        {"forecast_qty": "SUM(forecast_qty)"}, FORECAST_VS_ACTUAL_GRAINS, forecast_where,
+    )
+    actual = period_rollup_sql(
+        "stg_orders", "product_id", "s.order_date AT TIME ZONE 'UTC'",
+        {"actual_qty": "SUM(qty)", "actual_amount": "SUM(line_total)"}, FORECAST_VS_ACTUAL_GRAINS, actual_where,
+    )
+    return f"""
 WITH
-forecast_week AS (
-    SELECT product_id,
-           (DATE_TRUNC('week', (forecast_date::timestamp AT TIME ZONE 'UTC')))::date AS period_start,
-           SUM(forecast_qty) AS forecast_qty
-    FROM stg_demand_forecasts
-    WHERE forecast_date IS NOT NULL
-    GROUP BY product_id, DATE_TRUNC('week', (forecast_date::timestamp AT TIME ZONE 'UTC'))
-),
-forecast_month AS (
-    SELECT product_id,
-           (DATE_TRUNC('month', (forecast_date::timestamp AT TIME ZONE 'UTC')))::date AS period_start,
-           SUM(forecast_qty) AS forecast_qty
-    FROM stg_demand_forecasts
-    WHERE forecast_date IS NOT NULL
-    GROUP BY product_id, DATE_TRUNC('month', (forecast_date::timestamp AT TIME ZONE 'UTC'))
-),
-actual_week AS (
-    SELECT product_id,
-           (DATE_TRUNC('week', order_date AT TIME ZONE 'UTC'))::date AS period_start,
-           SUM(qty) AS actual_qty,
-           SUM(line_total) AS actual_amount
-    FROM stg_orders
-    WHERE order_date IS NOT NULL
-    GROUP BY product_id, DATE_TRUNC('week', order_date AT TIME ZONE 'UTC')
+forecast AS (
+{forecast}
 ),
-actual_month AS (
-    SELECT product_id,
-           (DATE_TRUNC('month', order_date AT TIME ZONE 'UTC'))::date AS period_start,
-           SUM(qty) AS actual_qty,
-           SUM(line_total) AS actual_amount
-    FROM stg_orders
-    WHERE order_date IS NOT NULL
-    GROUP BY product_id, DATE_TRUNC('month', order_date AT TIME ZONE 'UTC')
+actual AS (
+{actual}
 ),
-combined_week AS (
-    SELECT 'week'::varchar(10) AS period_type,
-           COALESCE(f.product_id, a.product_id) AS product_id,
-           COALESCE(f.period_start, a.period_start) AS period_start,
-           COALESCE(f.forecast_qty, 0) AS forecast_qty,
-           COALESCE(a.actual_qty, 0) AS actual_qty,
-           COALESCE(a.actual_amount, 0) AS actual_amount
-    FROM forecast_week f
-    FULL OUTER JOIN actual_week a ON f.product_id = a.product_id AND f.period_start = a.period_start
-),
-combined_month AS (
-    SELECT 'month'::varchar(10) AS period_type,
-           COALESCE(f.product_id, a.product_id) AS product_id,
+all_periods AS (
+    SELECT COALESCE(f.product_id, a.product_id) AS product_id,
+           COALESCE(f.period_type, a.period_type) AS period_type,
            COALESCE(f.period_start, a.period_start) AS period_start,
            COALESCE(f.forecast_qty, 0) AS forecast_qty,
            COALESCE(a.actual_qty, 0) AS actual_qty,
            COALESCE(a.actual_amount, 0) AS actual_amount
-    FROM forecast_month f
-    FULL OUTER JOIN actual_month a ON f.product_id = a.product_id AND f.period_start = a.period_start
-),
-all_periods AS (
-    SELECT period_type, product_id, period_start, forecast_qty, actual_qty, actual_amount FROM combined_week
-    UNION ALL
-    SELECT period_type, product_id, period_start, forecast_qty, actual_qty, actual_amount FROM combined_month
+    FROM forecast f
+    FULL OUTER JOIN actual a
+        ON f.product_id = a.product_id AND f.period_type = a.period_type AND f.period_start = a.period_start
 )
-INSERT INTO mart_forecast_vs_actual (product_id, product_name, period_type, period_start, forecast_qty, actual_qty, variance_qty, variance_pct, actual_amount)
 SELECT
     a.product_id,
     p.name AS product_name,
@@ -565,8 +547,386 @@ FROM all_periods a
 LEFT JOIN dim_products p ON p.product_id = a.product_id
 """
 
+
+INSERT_MART_FORECAST_VS_ACTUAL = (
+    f"INSERT INTO mart_forecast_vs_actual ({FORECAST_VS_ACTUAL_COLUMNS})\n{_forecast_vs_actual_select()}"
+)
+
+# ---------------------------------------------------------------------------
+# Incremental refresh: per-mart source_event_id watermark + keyed upserts
+# ---------------------------------------------------------------------------
+DDL_MART_REFRESH_STATE = """
+CREATE TABLE IF NOT EXISTS mart_refresh_state (
+    mart_name VARCHAR(100) PRIMARY KEY,
+    last_source_event_id BIGINT NOT NULL DEFAULT 0,
+    last_replay_seq BIGINT NOT NULL DEFAULT 0,
+    refresh_mode VARCHAR(20),
+    rows_affected BIGINT,
+    duration_ms BIGINT,
+    input_signature TEXT,
+    refreshed_at TIMESTAMPTZ NOT NULL DEFAULT now()
+)
+"""
+
+# Keys of staging rows staged since the last refresh: new events up to the unpack
+# watermark (a source_event_id range scan), plus retried events with older ids
+# logged in unpack_replayed. Materialised into mart_delta (key) before the upsert.
+def _delta_keys(sources):
+    return _delta_rows([(table, f"t.{key_col} AS key") for table, key_col in sources])
+
+
+def _delta_rows(sources, union="UNION"):
+    """The staging rows behind _delta_keys, selecting columns (SQL over alias t) from each table."""
+    selects = []
+    for table, columns in sources:
+        selects.append(
+            f"SELECT {columns} FROM {table} t\n"
+            f"WHERE t.source_event_id > :since AND t.source_event_id <= :upper"
+        )
+        selects.append(
+            f"SELECT {columns} FROM {table} t\n"
+            f"JOIN unpack_replayed r ON r.event_id = t.source_event_id\n"
+            f"WHERE r.seq > :since_seq AND r.seq <= :upper_seq"
+        )
+    return f"\n{union}\n".join(selects)
+
+
+DELTA_KEYS_SALES_REVENUE = _delta_keys([("stg_invoices", "invoice_id"), ("stg_payments", "invoice_id")])
+
+UPSERT_MART_SALES_REVENUE = """
+INSERT INTO mart_sales_revenue (
+    invoice_id, order_id, customer_id, customer_name, customer_segment, customer_region,
+    product_id, product_name, product_type, order_date, invoice_date, due_date, paid_at,
+    qty, unit_price, amount, amount_paid, currency, on_time_payment, source_event_id
+)
+SELECT
+    i.invoice_id, i.order_id, i.customer_id,
+    c.company_name, c.segment, c.region,
+    i.product_id, p.name, p.type,
+    o.order_date, i.invoice_timestamp, i.due_date, pay.paid_at,
+    i.qty, o.unit_price, i.amount, COALESCE(pay.amount_paid, 0), i.currency, pay.on_time_payment,
+    i.source_event_id
+FROM stg_invoices i
+JOIN stg_orders o ON o.order_id = i.order_id
+LEFT JOIN dim_customers c ON c.customer_id = i.customer_id
+LEFT JOIN dim_products p ON p.product_id = i.product_id
+LEFT JOIN (
+    SELECT invoice_id, SUM(amount) AS amount_paid, MAX(paid_at) AS paid_at, BOOL_AND(on_time) AS on_time_payment
+    FROM stg_payments
+    WHERE invoice_id IN (SELECT key FROM mart_delta)
+    GROUP BY invoice_id
+) pay ON pay.invoice_id = i.invoice_id
+WHERE i.invoice_id IN (SELECT key FROM mart_delta)
+ON CONFLICT (invoice_id) DO UPDATE SET
+    order_id = EXCLUDED.order_id,
+    customer_id = EXCLUDED.customer_id,
+    customer_name = EXCLUDED.customer_name,
+    customer_segment = EXCLUDED.customer_segment,
+    customer_region = EXCLUDED.customer_region,
+    product_id = EXCLUDED.product_id,
+    product_name = EXCLUDED.product_name,
+    product_type = EXCLUDED.product_type,
+    order_date = EXCLUDED.order_date,
+    invoice_date = EXCLUDED.invoice_date,
+    due_date = EXCLUDED.due_date,
+    paid_at = EXCLUDED.paid_at,
+    qty = EXCLUDED.qty,
+    unit_price = EXCLUDED.unit_price,
+    amount = EXCLUDED.amount,
+    amount_paid = EXCLUDED.amount_paid,
+    currency = EXCLUDED.currency,
+    on_time_payment = EXCLUDED.on_time_payment,
+    source_event_id = EXCLUDED.source_event_id
+"""
+
+DELTA_KEYS_ORDERS_FULFILLMENT = _delta_keys([
+    ("stg_orders", "order_id"), ("stg_backorders", "order_id"), ("stg_shipments", "order_id"),
+])
+
+UPSERT_MART_ORDERS_FULFILLMENT = """
+INSERT INTO mart_orders_fulfillment (
+    order_id, customer_id, customer_name, customer_region, product_id, product_name,
+    order_date, order_qty, unit_price, line_total, backorder_qty, backorder_timestamp,
+    shipped_qty, ship_date, fulfillment_amount
+)
+SELECT
+    o.order_id, o.customer_id, c.company_name, c.region, o.product_id, p.name,
+    o.order_date, o.qty, o.unit_price, o.line_total, bo.qty_backordered, bo.backorder_timestamp,
+    COALESCE(sh.shipped_qty, 0), sh.ship_date, COALESCE(sh.fulfillment_amount, 0)
+FROM stg_orders o
+LEFT JOIN dim_customers c ON c.customer_id = o.customer_id
+LEFT JOIN dim_products p ON p.product_id = o.product_id
+LEFT JOIN stg_backorders bo ON bo.order_id = o.order_id
+LEFT JOIN (
+    SELECT order_id, SUM(qty) AS shipped_qty, MIN(event_timestamp) AS ship_date, SUM(amount) AS fulfillment_amount
+    FROM stg_shipments
+    WHERE order_id IN (SELECT key FROM mart_delta)
+    GROUP BY order_id
+) sh ON sh.order_id = o.order_id
+WHERE o.order_id IN (SELECT key FROM mart_delta)
+ON CONFLICT (order_id) DO UPDATE SET
+    customer_id = EXCLUDED.customer_id,
+    customer_name = EXCLUDED.customer_name,
+    customer_region = EXCLUDED.customer_region,
+    product_id = EXCLUDED.product_id,
+    product_name = EXCLUDED.product_name,
+    order_date = EXCLUDED.order_date,
+    order_qty = EXCLUDED.order_qty,
+    unit_price = EXCLUDED.unit_price,
+    line_total = EXCLUDED.line_total,
+    backorder_qty = EXCLUDED.backorder_qty,
+    backorder_timestamp = EXCLUDED.backorder_timestamp,
+    shipped_qty = EXCLUDED.shipped_qty,
+    ship_date = EXCLUDED.ship_date,
+    fulfillment_amount = EXCLUDED.fulfillment_amount
+"""
+
+DELTA_KEYS_ROLLUP_DELIVERY_OUTCOMES = _delta_keys([("stg_delivery_events", "load_id")])
+
+DELTA_KEYS_LOGISTICS = _delta_keys([("stg_loads", "load_id"), ("stg_delivery_events", "load_id")])
+
+UPSERT_MART_LOGISTICS = """
+INSERT INTO mart_logistics (
+    load_id, order_id, route_id, origin_facility_id, destination_facility_id,
+    customer_id, product_id, product_name, qty, distance_miles, load_status,
+    scheduled_pickup, scheduled_delivery, actual_delivery, delivery_on_time, created_at
+)
+SELECT
+    l.load_id, l.order_id, l.route_id, r.origin_facility_id, r.destination_facility_id,
+    l.customer_id, l.product_id, p.name, l.qty, l.distance_miles, l.load_status,
+    l.scheduled_pickup, l.scheduled_delivery, l.actual_delivery, d.on_time_flag, l.created_at
+FROM stg_loads l
+LEFT JOIN dim_routes r ON r.route_id = l.route_id
+LEFT JOIN dim_products p ON p.product_id = l.product_id
+LEFT JOIN rollup_delivery_outcomes d ON d.load_id = l.load_id
+WHERE l.load_id IN (SELECT key FROM mart_delta)
+ON CONFLICT (load_id) DO UPDATE SET
+    order_id = EXCLUDED.order_id,
+    route_id = EXCLUDED.route_id,
+    origin_facility_id = EXCLUDED.origin_facility_id,
+    destination_facility_id = EXCLUDED.destination_facility_id,
+    customer_id = EXCLUDED.customer_id,
+    product_id = EXCLUDED.product_id,
+    product_name = EXCLUDED.product_name,
+    qty = EXCLUDED.qty,
+    distance_miles = EXCLUDED.distance_miles,
+    load_status = EXCLUDED.load_status,
+    scheduled_pickup = EXCLUDED.scheduled_pickup,
+    scheduled_delivery = EXCLUDED.scheduled_delivery,
+    actual_delivery = EXCLUDED.actual_delivery,
+    delivery_on_time = EXCLUDED.delivery_on_time,
+    created_at = EXCLUDED.created_at
+"""
+
+DELTA_KEYS_PROCUREMENT = _delta_keys([("stg_purchase_orders", "purchase_order_id"), ("stg_po_receipts", "purchase_order_id")])
+
+UPSERT_MART_PROCUREMENT = """
+INSERT INTO mart_procurement (
+    purchase_order_id, part_id, part_name, supplier_id, supplier_name, supplier_country,
+    order_date, qty, unit_cost, total_cost, lead_time_hours, eta, is_reorder,
+    qty_received, qty_rejected, actual_receipt_time
+)
+SELECT
+    po.purchase_order_id, po.part_id, pt.name, po.supplier_id, s.name, COALESCE(po.supplier_country, s.country),
+    po.event_timestamp, po.qty, po.unit_cost, po.total_cost, po.lead_time_hours, po.eta, po.is_reorder,
+    COALESCE(rcpt.qty_received, 0), COALESCE(rcpt.qty_rejected, 0), rcpt.actual_receipt_time
+FROM stg_purchase_orders po
+LEFT JOIN dim_parts pt ON pt.part_id = po.part_id
+LEFT JOIN dim_suppliers s ON s.supplier_id = po.supplier_id
+LEFT JOIN (
+    SELECT purchase_order_id, SUM(qty_received) AS qty_received, SUM(qty_rejected) AS qty_rejected,
+           MAX(received_timestamp) AS actual_receipt_time
+    FROM stg_po_receipts
+    WHERE purchase_order_id IN (SELECT key FROM mart_delta)
+    GROUP BY purchase_order_id
+) rcpt ON rcpt.purchase_order_id = po.purchase_order_id
+WHERE po.purchase_order_id IN (SELECT key FROM mart_delta)
+ON CONFLICT (purchase_order_id) DO UPDATE SET
+    part_id = EXCLUDED.part_id,
+    part_name = EXCLUDED.part_name,
+    supplier_id = EXCLUDED.supplier_id,
+    supplier_name = EXCLUDED.supplier_name,
+    supplier_country = EXCLUDED.supplier_country,
+    order_date = EXCLUDED.order_date,
+    qty = EXCLUDED.qty,
+    unit_cost = EXCLUDED.unit_cost,
+    total_cost = EXCLUDED.total_cost,
+    lead_time_hours = EXCLUDED.lead_time_hours,
+    eta = EXCLUDED.eta,
+    is_reorder = EXCLUDED.is_reorder,
+    qty_received = EXCLUDED.qty_received,
+    qty_rejected = EXCLUDED.qty_rejected,
+    actual_receipt_time = EXCLUDED.actual_receipt_time
+"""
+
+DELTA_KEYS_PRODUCTION = _delta_keys([
+    ("stg_production_jobs", "job_id"), ("stg_production_starts", "job_id"), ("stg_production_completions", "job_id"),
+])
+
+UPSERT_MART_PRODUCTION = """
+INSERT INTO mart_production (
+    job_id, product_id, product_name, status, qty_per_job, qty_produced,
+    start_timestamp, completion_timestamp, production_duration_hours, new_qty_on_hand
+)
+SELECT
+    j.job_id, j.product_id, p.name, COALESCE(pc.status, ps.status, j.status), j.qty_per_job, pc.qty_produced,
+    ps.event_timestamp, pc.event_timestamp, j.production_duration_hours, pc.new_qty_on_hand
+FROM stg_production_jobs j
+LEFT JOIN dim_products p ON p.product_id = j.product_id
+LEFT JOIN stg_production_starts ps ON ps.job_id = j.job_id
+LEFT JOIN stg_production_completions pc ON pc.job_id = j.job_id
+WHERE j.job_id IN (SELECT key FROM mart_delta)
+ON CONFLICT (job_id) DO UPDATE SET
+    product_id = EXCLUDED.product_id,
+    product_name = EXCLUDED.product_name,
+    status = EXCLUDED.status,
+    qty_per_job = EXCLUDED.qty_per_job,
+    qty_produced = EXCLUDED.qty_produced,
+    start_timestamp = EXCLUDED.start_timestamp,
+    completion_timestamp = EXCLUDED.completion_timestamp,
+    production_duration_hours = EXCLUDED.production_duration_hours,
+    new_qty_on_hand = EXCLUDED.new_qty_on_hand
+"""
+
+DELTA_KEYS_DEMAND_FORECASTS = _delta_keys([("stg_demand_forecasts", "source_event_id")])
+
+UPSERT_MART_DEMAND_FORECASTS = """
+INSERT INTO mart_demand_forecasts (
+    source_event_id, product_id, product_name, snapshot_date, forecast_date,
+    horizon_days, forecast_qty, event_timestamp
+)
+SELECT
+    df.source_event_id, df.product_id, p.name, df.snapshot_date, df.forecast_date,
+    df.horizon_days, df.forecast_qty, df.event_timestamp
+FROM stg_demand_forecasts df
+LEFT JOIN dim_products p ON p.product_id = df.product_id
+WHERE df.source_event_id IN (SELECT key FROM mart_delta)
+ON CONFLICT (source_event_id) DO UPDATE SET
+    product_id = EXCLUDED.product_id,
+    product_name = EXCLUDED.product_name,
+    snapshot_date = EXCLUDED.snapshot_date,
+    forecast_date = EXCLUDED.forecast_date,
+    horizon_days = EXCLUDED.horizon_days,
+    forecast_qty = EXCLUDED.forecast_qty,
+    event_timestamp = EXCLUDED.event_timestamp
+"""
+
+DELTA_KEYS_SOP_SNAPSHOTS = _delta_keys([("stg_sop_snapshots", "source_event_id")])
+
+UPSERT_MART_SOP_SNAPSHOTS = """
+INSERT INTO mart_sop_snapshots (
+    source_event_id, plan_date, scenario, product_id, product_name,
+    demand_forecast_qty, supply_plan_qty, inventory_plan_qty, event_timestamp
+)
+SELECT
+    ss.source_event_id, ss.plan_date, ss.scenario, ss.product_id, p.name,
+    ss.demand_forecast_qty, ss.supply_plan_qty, ss.inventory_plan_qty, ss.event_timestamp
+FROM stg_sop_snapshots ss
+LEFT JOIN dim_products p ON p.product_id = ss.product_id
+WHERE ss.source_event_id IN (SELECT key FROM mart_delta)
+ON CONFLICT (source_event_id) DO UPDATE SET
+    plan_date = EXCLUDED.plan_date,
+    scenario = EXCLUDED.scenario,
+    product_id = EXCLUDED.product_id,
+    product_name = EXCLUDED.product_name,
+    demand_forecast_qty = EXCLUDED.demand_forecast_qty,
+    supply_plan_qty = EXCLUDED.supply_plan_qty,
+    inventory_plan_qty = EXCLUDED.inventory_plan_qty,
+    event_timestamp = EXCLUDED.event_timestamp
+"""
+
+# (customer, month) buckets that new or replayed orders fall in; each is
+# re-aggregated from its own orders through the (customer_id, order_date) index.
+DELTA_KEYS_ORDERS_BY_CUSTOMER_MONTH = touched_periods_sql(
+    _delta_rows([("stg_orders", "t.customer_id, t.order_date AT TIME ZONE 'UTC' AS ts")], union="UNION ALL"),
+    "customer_id",
+    ["month"],
+)
+
+UPSERT_MART_ORDERS_BY_CUSTOMER_MONTH = """
+INSERT INTO mart_orders_by_customer_month (
+    customer_id, customer_name, customer_region, year, month, month_start,
+    order_count, total_qty, total_amount
+)
+SELECT
+    d.customer_id,
+    c.company_name,
+    c.region,
+    EXTRACT(YEAR FROM d.period_start)::INTEGER,
+    EXTRACT(MONTH FROM d.period_start)::INTEGER,
+    d.period_start,
+    COUNT(*)::INTEGER,
+    COALESCE(SUM(o.qty), 0)::INTEGER,
+    COALESCE(SUM(o.line_total), 0)
+FROM mart_delta d
+JOIN stg_orders o
+    ON o.customer_id = d.customer_id
+    AND o.order_date >= d.period_start::timestamp AT TIME ZONE 'UTC'
+    AND o.order_date < d.period_end::timestamp AT TIME ZONE 'UTC'
+LEFT JOIN dim_customers c ON c.customer_id = d.customer_id
+GROUP BY d.customer_id, c.company_name, c.region, d.period_start
+ON CONFLICT (customer_id, year, month) DO UPDATE SET
+    customer_name = EXCLUDED.customer_name,
+    customer_region = EXCLUDED.customer_region,
+    month_start = EXCLUDED.month_start,
+    order_count = EXCLUDED.order_count,
+    total_qty = EXCLUDED.total_qty,
+    total_amount = EXCLUDED.total_amount
+"""
+
+# Periods (product, grain, period) that new forecasts or orders fall in; each is
+# recomputed in full from the source rows inside it. Rows selected for one grain
+# can form partial groups of another, so only touched groups are kept.
+DELTA_KEYS_FORECAST_VS_ACTUAL = touched_periods_sql(
+    _delta_rows(
+        [
+            ("stg_demand_forecasts", "t.product_id, t.forecast_date::timestamp AS ts"),
+            ("stg_orders", "t.product_id, t.order_date AT TIME ZONE 'UTC' AS ts"),
+        ],
+        union="UNION ALL",
+    ),
+    "product_id",
+    FORECAST_VS_ACTUAL_GRAINS,
+)
+
+UPSERT_MART_FORECAST_VS_ACTUAL = f"""
+INSERT INTO mart_forecast_vs_actual ({FORECAST_VS_ACTUAL_COLUMNS})
+SELECT x.*
+FROM ({_forecast_vs_actual_select(
+    "EXISTS (SELECT 1 FROM mart_delta d WHERE d.product_id = s.product_id "
+    "AND s.forecast_date >= d.period_start AND s.forecast_date < d.period_end)",
+    "EXISTS (SELECT 1 FROM mart_delta d WHERE d.product_id = s.product_id "
+    "AND s.order_date >= d.period_start::timestamp AT TIME ZONE 'UTC' "
+    "AND s.order_date < d.period_end::timestamp AT TIME ZONE 'UTC')",
+)}) x
+JOIN mart_delta d
+    ON d.product_id = x.product_id AND d.period_type = x.period_type AND d.period_start = x.period_start
+ON CONFLICT (product_id, period_type, period_start) DO UPDATE SET
+    product_name = EXCLUDED.product_name,
+    forecast_qty = EXCLUDED.forecast_qty,
+    actual_qty = EXCLUDED.actual_qty,
+    variance_qty = EXCLUDED.variance_qty,
+    variance_pct = EXCLUDED.variance_pct,
+    actual_amount = EXCLUDED.actual_amount
+"""
+
+# Table name -> (delta keys SQL, upsert SQL); marts not listed are always fully rebuilt
+_INCREMENTAL = {
+    "rollup_delivery_outcomes": (DELTA_KEYS_ROLLUP_DELIVERY_OUTCOMES, UPSERT_ROLLUP_DELIVERY_OUTCOMES),
+    "mart_sales_revenue": (DELTA_KEYS_SALES_REVENUE, UPSERT_MART_SALES_REVENUE),
+    "mart_orders_fulfillment": (DELTA_KEYS_ORDERS_FULFILLMENT, UPSERT_MART_ORDERS_FULFILLMENT),
+    "mart_logistics": (DELTA_KEYS_LOGISTICS, UPSERT_MART_LOGISTICS),
+    "mart_procurement": (DELTA_KEYS_PROCUREMENT, UPSERT_MART_PROCUREMENT),
+    "mart_production": (DELTA_KEYS_PRODUCTION, UPSERT_MART_PRODUCTION),
+    "mart_demand_forecasts": (DELTA_KEYS_DEMAND_FORECASTS, UPSERT_MART_DEMAND_FORECASTS),
+    "mart_sop_snapshots": (DELTA_KEYS_SOP_SNAPSHOTS, UPSERT_MART_SOP_SNAPSHOTS),
+    "mart_orders_by_customer_month": (DELTA_KEYS_ORDERS_BY_CUSTOMER_MONTH, UPSERT_MART_ORDERS_BY_CUSTOMER_MONTH),
+    "mart_forecast_vs_actual": (DELTA_KEYS_FORECAST_VS_ACTUAL, UPSERT_MART_FORECAST_VS_ACTUAL),
+}
+
 # Table name + INSERT SQL for refresh (TRUNCATE run separately so both execute)
 _REFRESH_LIST = [
+    ("rollup_delivery_outcomes", INSERT_ROLLUP_DELIVERY_OUTCOMES),
     ("mart_sales_revenue", INSERT_MART_SALES_REVENUE),
     ("mart_orders_fulfillment", INSERT_MART_ORDERS_FULFILLMENT),
     ("mart_logistics", INSERT_MART_LOGISTICS),
@@ -578,57 +938,478 @@ _REFRESH_LIST = [
     ("mart_forecast_vs_actual", INSERT_MART_FORECAST_VS_ACTUAL),
 ]
 
+# Refresh DAG: the tables each mart reads ("sources") and the refresh nodes that
+# must finish before it starts ("after"). Marts with no path between them run
+# concurrently; a mart whose sources are unchanged since its last refresh is skipped.
+MART_DEPENDENCIES = {
+    "mart_sales_revenue": {
+        "sources": ["stg_invoices", "stg_orders", "stg_payments", "dim_customers", "dim_products"],
+    },
+    "mart_orders_fulfillment": {
+        "sources": ["stg_orders", "stg_backorders", "stg_shipments", "dim_customers", "dim_products"],
+    },
+    # Normally kept current by the staging writer; refreshed here to catch up or rebuild it
+    "rollup_delivery_outcomes": {"sources": ["stg_delivery_events"]},
+    "mart_logistics": {
+        "sources": ["stg_loads", "stg_delivery_events", "dim_routes", "dim_products"],
+        "after": ["rollup_delivery_outcomes"],
+    },
+    "mart_procurement": {
+        "sources": ["stg_purchase_orders", "stg_po_receipts", "dim_parts", "dim_suppliers"],
+    },
+    "mart_production": {
+        "sources": ["stg_production_jobs", "stg_production_starts", "stg_production_completions", "dim_products"],
+    },
+    "mart_demand_forecasts": {"sources": ["stg_demand_forecasts", "dim_products"]},
+    "mart_sop_snapshots": {"sources": ["stg_sop_snapshots", "dim_products"]},
+    "mart_orders_by_customer_month": {"sources": ["stg_orders", "dim_customers"]},
+    "mart_forecast_vs_actual": {"sources": ["stg_demand_forecasts", "stg_orders", "dim_products"]},
+}
+
+
+# Unique index each materialized view needs for REFRESH ... CONCURRENTLY (the
+# mart table's primary key), and the secondary indexes recreated on the views
+MART_UNIQUE_KEYS = {
+    "mart_sales_revenue": ["invoice_id"],
+    "mart_orders_fulfillment": ["order_id"],
+    "mart_logistics": ["load_id"],
+    "mart_procurement": ["purchase_order_id"],
+    "mart_production": ["job_id"],
+    "mart_demand_forecasts": ["source_event_id"],
+    "mart_sop_snapshots": ["source_event_id"],
+    "mart_orders_by_customer_month": ["customer_id", "year", "month"],
+    "mart_forecast_vs_actual": ["product_id", "period_type", "period_start"],
+}
+MART_INDEXES = [
+    DDL_MART_ORDERS_BY_CUSTOMER_MONTH_IX,
+    DDL_MART_ORDERS_BY_CUSTOMER_MONTH_IX2,
+    DDL_MART_FORECAST_VS_ACTUAL_IX,
+]
+
+_INSERT_RE = re.compile(r"^\s*INSERT INTO (\w+)\s*\(([^)]*)\)\s*(.*)$", re.S)
+
+
+def matview_ddl(table_name, insert_sql):
+    """CREATE MATERIALIZED VIEW for a mart from its INSERT ... SELECT. The view
+    is created empty; its first refresh populates it."""
+    match = _INSERT_RE.match(insert_sql)
+    columns = ", ".join(col.strip() for col in match.group(2).split(","))
+    return f"CREATE MATERIALIZED VIEW IF NOT EXISTS {table_name} ({columns}) AS\n{match.group(3)}\nWITH NO DATA"
+
+
+def matview_unique_index_ddl(table_name):
+    return (
+        f"CREATE UNIQUE INDEX IF NOT EXISTS ux_{table_name} "
+        f"ON {table_name} ({', '.join(MART_UNIQUE_KEYS[table_name])})"
+    )
 
-def init_marts():
-    """Create mart tables if they do not exist."""
+
+def _backend_conflicts(conn, backend):
+    """Marts that already exist as the other kind of relation (table vs view)."""
+    relkind = "m" if backend == "matview" else "r"
+    rows = conn.execute(
+        text("SELECT relname FROM pg_class WHERE relname = ANY(:names) AND relkind IN ('r', 'm') AND relkind <> :k"),
+        {"names": list(MART_UNIQUE_KEYS), "k": relkind},
+    )
+    return [row[0] for row in rows]
+
+
+def init_marts(backend=MART_BACKEND):
+    """Create mart tables (or materialized views for backend='matview') if they do not exist."""
+    if backend not in ("table", "matview"):
+        raise ValueError(f"Unknown mart backend {backend!r}; expected 'table' or 'matview'")
     engine = get_engine()
-    ddl_list = [
-        DDL_MART_SALES_REVENUE,
-        DDL_MART_ORDERS_FULFILLMENT,
-        DDL_MART_LOGISTICS,
-        DDL_MART_PROCUREMENT,
-        DDL_MART_PRODUCTION,
-        DDL_MART_DEMAND_FORECASTS,
-        DDL_MART_SOP_SNAPSHOTS,
-        DDL_MART_ORDERS_BY_CUSTOMER_MONTH,
-        DDL_MART_ORDERS_BY_CUSTOMER_MONTH_IX,
-        DDL_MART_ORDERS_BY_CUSTOMER_MONTH_IX2,
-        DDL_MART_FORECAST_VS_ACTUAL,
-        DDL_MART_FORECAST_VS_ACTUAL_IX,
-    ]
+    if backend == "matview":
+        insert_sql = dict(_REFRESH_LIST)
+        ddl_list = [matview_ddl(name, insert_sql[name]) for name in MART_UNIQUE_KEYS]
+        ddl_list += [matview_unique_index_ddl(name) for name in MART_UNIQUE_KEYS]
+        ddl_list += MART_INDEXES + [DDL_MART_REFRESH_STATE]
+    else:
+        ddl_list = [
+            DDL_MART_SALES_REVENUE,
+            DDL_MART_ORDERS_FULFILLMENT,
+            DDL_MART_LOGISTICS,
+            DDL_MART_PROCUREMENT,
+            DDL_MART_PRODUCTION,
+            DDL_MART_DEMAND_FORECASTS,
+            DDL_MART_SOP_SNAPSHOTS,
+            DDL_MART_ORDERS_BY_CUSTOMER_MONTH,
+            DDL_MART_FORECAST_VS_ACTUAL,
+            *MART_INDEXES,
+            DDL_MART_REFRESH_STATE,
+        ]
     with engine.connect() as conn:
         trans = conn.begin()
         try:
+            conflicts = _backend_conflicts(conn, backend)
+            if conflicts:
+                raise RuntimeError(
+                    f"{', '.join(conflicts)} already exist with the other mart backend; drop them to switch to {backend!r}"
+                )
             for ddl in ddl_list:
                 conn.execute(text(ddl))
             trans.commit()
-            print("SUCCESS: Mart tables created.")
+            print(f"SUCCESS: Mart {'materialized views' if backend == 'matview' else 'tables'} created.")
         except Exception as e:
             trans.rollback()
             raise RuntimeError(f"Error creating mart tables: {e}") from e
-        finally:
-            engine.dispose()
 
 
-def refresh_marts():
-    """Full refresh: truncate and repopulate all marts from staging/dims.
-    TRUNCATE and INSERT are run as separate statements so both execute (some drivers
-    only run the first statement in a multi-statement string).
-    """
-    engine = get_engine()
+def _source_bounds(conn):
+    """Return (upper, upper_seq): the unpack watermark (every event up to it is
+    staged or parked) and the unpack_replayed position committed with it. Both
+    come from unpack_state, not MAX() over the tables: staging writers commit
+    concurrently, so rows above them may still have gaps that fill in later."""
+    row = conn.execute(text("SELECT last_event_id, last_replay_seq FROM unpack_state WHERE id = 1")).first()
+    return (row[0], row[1]) if row else (0, 0)
+
+
+def _load_refresh_state(conn):
+    rows = conn.execute(text(
+        "SELECT mart_name, last_source_event_id, last_replay_seq, input_signature FROM mart_refresh_state"
+    ))
+    return {row[0]: {"since": row[1], "since_seq": row[2], "signature": row[3]} for row in rows}
+
+
+def _save_refresh_state(conn, table_name, upper, upper_seq, mode, rows_affected, duration_ms, signature):
+    conn.execute(
+        text(
+            """
+            INSERT INTO mart_refresh_state (
+                mart_name, last_source_event_id, last_replay_seq, refresh_mode,
+                rows_affected, duration_ms, input_signature, refreshed_at
+            )
+            VALUES (:mart_name, :upper, :upper_seq, :mode, :rows_affected, :duration_ms, :signature, now())
+            ON CONFLICT (mart_name) DO UPDATE SET
+                last_source_event_id = EXCLUDED.last_source_event_id,
+                last_replay_seq = EXCLUDED.last_replay_seq,
+                refresh_mode = EXCLUDED.refresh_mode,
+                rows_affected = EXCLUDED.rows_affected,
+                duration_ms = EXCLUDED.duration_ms,
+                input_signature = EXCLUDED.input_signature,
+                refreshed_at = EXCLUDED.refreshed_at
+            """
+        ),
+        {
+            "mart_name": table_name, "upper": upper, "upper_seq": upper_seq, "mode": mode,
+            "rows_affected": rows_affected, "duration_ms": duration_ms, "signature": signature,
+        },
+    )
+
+
+def input_signature(conn, sources, upper, upper_seq):
+    """Cheap fingerprint of a mart's inputs. Staging tables are append-only and
+    keyed by source_event_id, so MAX(source_event_id) (an index lookup) plus the
+    unpack_replayed position captures new rows. Both are capped at the bounds
+    from _source_bounds, the same ones the incremental delta reads up to, so rows
+    an in-flight unpack has committed past the watermark are left for the next
+    refresh instead of being marked as seen. Other tables use their cumulative
+    insert/update/delete counters from pg_stat_user_tables; the incremental
+    delta only follows staging rows, so a change there forces a full rebuild
+    (see _non_staging_changed)."""
+    parts = []
+    for table in sources:
+        if table.startswith("stg_"):
+            value = conn.execute(text(
+                f"SELECT COALESCE(MAX(source_event_id), 0) FROM {table} WHERE source_event_id <= :upper"
+            ), {"upper": upper}).scalar()
+        else:
+            value = conn.execute(text(
+                "SELECT COALESCE(SUM(n_tup_ins + n_tup_upd + n_tup_del), 0) FROM pg_stat_user_tables WHERE relname = :t"
+            ), {"t": table}).scalar()
+        parts.append(f"{table}={value}")
+    if any(table.startswith("stg_") for table in sources):
+        parts.append(f"unpack_replayed={upper_seq}")
+    return ";".join(parts)
+
+
+def _non_staging_changed(previous_signature, signature):
+    """True if a non-staging input (a dim) differs between two input_signature values."""
+    def parts(sig):
+        return dict(part.split("=", 1) for part in (sig or "").split(";") if "=" in part)
+
+    before, after = parts(previous_signature), parts(signature)
+    return any(
+        before.get(table) != value
+        for table, value in after.items()
+        if not table.startswith("stg_") and table != "unpack_replayed"
+    )
+
+
+def refresh_mart_incremental(conn, table_name, since, since_seq, upper, upper_seq):
+    """Recompute only the mart rows whose keys have staging rows newer than the
+    watermark, and upsert them. Returns the number of rows upserted."""
+    delta_keys_sql, upsert_sql = _INCREMENTAL[table_name]
+    params = {"since": since, "since_seq": since_seq, "upper": upper, "upper_seq": upper_seq}
+    conn.execute(text(f"CREATE TEMP TABLE mart_delta ON COMMIT DROP AS {delta_keys_sql}"), params)
+    conn.execute(text("ANALYZE mart_delta"))
+    n_rows = conn.execute(text(upsert_sql)).rowcount
+    # On failure the transaction is aborted and ON COMMIT DROP cleans up on rollback
+    conn.execute(text("DROP TABLE mart_delta"))
+    return n_rows
+
+
+def refresh_matview(conn, table_name):
+    """REFRESH a mart materialized view. Once populated it is refreshed
+    CONCURRENTLY: Postgres diffs the new result against the view through its
+    unique index and applies only the changed rows, and readers are never
+    blocked. Returns how it was refreshed."""
+    populated = conn.execute(
+        text("SELECT relispopulated FROM pg_class WHERE oid = to_regclass(:t)"), {"t": table_name}
+    ).scalar()
+    if populated:
+        conn.execute(text(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {table_name}"))
+        return "matview_concurrent"
+    conn.execute(text(f"REFRESH MATERIALIZED VIEW {table_name}"))
+    return "matview"
+
+
+def refresh_mart(engine, table_name, insert_sql, mode, state, force=False, backend="table"):
+    """Refresh one mart on its own connection. Returns (how, rows, seconds) where
+    how is 'skipped' when its inputs are unchanged since the last refresh (rows
+    is None for materialized views, whose refresh reports no row count)."""
+    started = time.perf_counter()
+    with engine.connect() as conn:
+        upper, upper_seq = _source_bounds(conn)
+        signature = input_signature(conn, MART_DEPENDENCIES[table_name]["sources"], upper, upper_seq)
+    previous = state.get(table_name)
+    if not force and previous and previous["signature"] == signature:
+        return "skipped", 0, time.perf_counter() - started
+
+    if backend == "matview" and table_name in MART_UNIQUE_KEYS:
+        with engine.begin() as conn:
+            how = refresh_matview(conn, table_name)
+            seconds = time.perf_counter() - started
+            _save_refresh_state(conn, table_name, upper, upper_seq, how, None, int(seconds * 1000), signature)
+        return how, None, seconds
+
+    if mode == "swap":
+        n_rows = rebuild_mart_swap(engine, table_name, insert_sql)
+        seconds = time.perf_counter() - started
+        with engine.begin() as conn:
+            _save_refresh_state(conn, table_name, upper, upper_seq, "swap", n_rows, int(seconds * 1000), signature)
+        return "swap", n_rows, seconds
+
     with engine.connect() as conn:
         trans = conn.begin()
         try:
-            for table_name, insert_sql in _REFRESH_LIST:
+            # Changed dim attributes (customer region, product name) belong to rows the
+            # delta does not touch, so only a rebuild writes them back
+            if (
+                mode == "incremental"
+                and table_name in _INCREMENTAL
+                and previous
+                and not _non_staging_changed(previous["signature"], signature)
+            ):
+                n_rows = refresh_mart_incremental(
+                    conn, table_name, previous["since"], previous["since_seq"], upper, upper_seq
+                )
+                how = "incremental"
+            else:
                 conn.execute(text(f"TRUNCATE {table_name}"))
-                conn.execute(text(insert_sql))
+                n_rows = conn.execute(text(insert_sql)).rowcount
+                how = "full"
+            seconds = time.perf_counter() - started
+            _save_refresh_state(conn, table_name, upper, upper_seq, how, n_rows, int(seconds * 1000), signature)
             trans.commit()
-            print("SUCCESS: Marts refreshed.")
-        except Exception as e:
+        except Exception:
             trans.rollback()
-            raise RuntimeError(f"Error refreshing marts: {e}") from e
-        finally:
-            engine.dispose()
+            raise
+    return how, n_rows, seconds
+
+
+def _shadow_name(name):
+    return f"{name}__shadow"
+
+
+def build_shadow(conn, table_name, insert_sql):
+    """Fill a shadow copy of table_name, then add its keys and indexes and
+    ANALYZE it. The live table is only read from pg_catalog, so readers of it
+    are never blocked. Returns the number of rows loaded."""
+    shadow = _shadow_name(table_name)
+    conn.execute(text(f"DROP TABLE IF EXISTS {shadow}"))
+    conn.execute(text(f"CREATE TABLE {shadow} (LIKE {table_name} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"))
+    n_rows = conn.execute(text(insert_sql.replace(f"INSERT INTO {table_name}", f"INSERT INTO {shadow}", 1))).rowcount
+    # Keys and indexes are built after the load: one sorted build instead of per-row maintenance
+    constraints = conn.execute(text(
+        """
+        SELECT conname, pg_get_constraintdef(oid)
+        FROM pg_constraint
+        WHERE conrelid = to_regclass(:table_name) AND contype IN ('p', 'u')
+        """
+    ), {"table_name": table_name}).fetchall()
+    for conname, definition in constraints:
+        conn.execute(text(f"ALTER TABLE {shadow} ADD CONSTRAINT {_shadow_name(conname)} {definition}"))
+    for indexname, indexdef in _plain_indexes(conn, table_name):
+        indexdef = re.sub(
+            r"INDEX (\S+) ON (\S+) USING", f"INDEX {_shadow_name(indexname)} ON {shadow} USING", indexdef, count=1
+        )
+        conn.execute(text(indexdef))
+    conn.execute(text(f"ANALYZE {shadow}"))
+    return n_rows
+
+
+def _plain_indexes(conn, table_name):
+    """(name, definition) of table_name's indexes that do not back a constraint."""
+    return conn.execute(text(
+        """
+        SELECT c.relname, pg_get_indexdef(i.indexrelid)
+        FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE i.indrelid = to_regclass(:table_name)
+        AND NOT EXISTS (SELECT 1 FROM pg_constraint k WHERE k.conindid = i.indexrelid)
+        """
+    ), {"table_name": table_name}).fetchall()
+
+
+def _dependent_views(conn, table_name):
+    """Views and materialized views that select from table_name."""
+    return [row[0] for row in conn.execute(text(
+        """
+        SELECT DISTINCT v.oid::regclass::text
+        FROM pg_depend d
+        JOIN pg_rewrite w ON w.oid = d.objid
+        JOIN pg_class v ON v.oid = w.ev_class
+        WHERE d.classid = 'pg_rewrite'::regclass
+        AND d.refobjid = to_regclass(:t)
+        AND v.oid <> d.refobjid
+        """
+    ), {"t": table_name})]
+
+
+def _refuse_dependent_views(conn, table_name):
+    views = _dependent_views(conn, table_name)
+    if views:
+        raise RuntimeError(
+            f"{table_name}: cannot swap while views depend on it ({', '.join(views)}); "
+            "use mode='full' or 'incremental', or drop the views"
+        )
+
+
+def _copy_grants(conn, table_name, target):
+    """Grant on target every privilege granted on table_name."""
+    grants = conn.execute(text(
+        """
+        SELECT CASE WHEN a.grantee = 0 THEN 'PUBLIC' ELSE quote_ident(r.rolname) END,
+               a.privilege_type, a.is_grantable
+        FROM pg_class c
+        CROSS JOIN LATERAL aclexplode(c.relacl) a
+        LEFT JOIN pg_roles r ON r.oid = a.grantee
+        WHERE c.oid = to_regclass(:t)
+        """
+    ), {"t": table_name}).fetchall()
+    for grantee, privilege, grantable in grants:
+        option = " WITH GRANT OPTION" if grantable else ""
+        conn.execute(text(f"GRANT {privilege} ON {target} TO {grantee}{option}"))
+
+
+def swap_shadow(engine, table_name):
+    """Atomically replace table_name with its shadow: copy the live table's
+    grants onto the shadow, rename, drop the old table and give the shadow's
+    keys and indexes their usual names. The ACCESS EXCLUSIVE lock is held only
+    for these catalog updates; if readers hold the table longer than
+    SWAP_LOCK_TIMEOUT, back off and retry. Refuses to run (RuntimeError) when
+    views depend on the table, since the rename would leave them reading the
+    old table and the drop would fail."""
+    shadow = _shadow_name(table_name)
+    old = f"{table_name}__old"
+    for attempt in range(1, SWAP_RETRIES + 1):
+        with engine.connect() as conn:
+            trans = conn.begin()
+            try:
+                conn.execute(text(f"SET LOCAL lock_timeout = '{SWAP_LOCK_TIMEOUT}'"))
+                _refuse_dependent_views(conn, table_name)
+                _copy_grants(conn, table_name, shadow)
+                constraints = [row[0] for row in conn.execute(text(
+                    "SELECT conname FROM pg_constraint WHERE conrelid = to_regclass(:t) AND contype IN ('p', 'u')"
+                ), {"t": table_name})]
+                indexes = [name for name, _ in _plain_indexes(conn, table_name)]
+                conn.execute(text(f"ALTER TABLE {table_name} RENAME TO {old}"))
+                conn.execute(text(f"ALTER TABLE {shadow} RENAME TO {table_name}"))
+                conn.execute(text(f"DROP TABLE {old}"))
+                for conname in constraints:
+                    conn.execute(text(f"ALTER TABLE {table_name} RENAME CONSTRAINT {_shadow_name(conname)} TO {conname}"))
+                for indexname in indexes:
+                    conn.execute(text(f"ALTER INDEX {_shadow_name(indexname)} RENAME TO {indexname}"))
+                trans.commit()
+                return
+            except OperationalError as e:
+                trans.rollback()
+                if "lock timeout" not in str(e) or attempt == SWAP_RETRIES:
+                    raise
+                print(f"{table_name}: swap waiting for readers (attempt {attempt}/{SWAP_RETRIES})")
+                time.sleep(attempt)
+
+
+def rebuild_mart_swap(engine, table_name, insert_sql):
+    """Zero-downtime full rebuild of one mart. Returns the number of rows loaded."""
+    with engine.begin() as conn:
+        # Checked before the build too, so a mart with dependent views fails fast
+        _refuse_dependent_views(conn, table_name)
+        n_rows = build_shadow(conn, table_name, insert_sql)
+    swap_shadow(engine, table_name)
+    return n_rows
+
+
+def refresh_marts(mode=MART_REFRESH_MODE, workers=MART_REFRESH_WORKERS, force=False, backend=MART_BACKEND):
+    """Refresh all marts from staging/dims, running independent marts concurrently
+    in MART_DEPENDENCIES order and skipping marts whose inputs are unchanged
+    (force=True refreshes them anyway). Each mart commits on its own.
+    mode='full' truncates and repopulates every mart. mode='swap' rebuilds each
+    mart into a shadow table and renames it in, so readers never wait on the
+    rebuild (see rebuild_mart_swap). mode='incremental' upserts
+    only the keys touched since each mart's watermark in mart_refresh_state;
+    marts without a watermark or without an incremental definition, and marts
+    whose dimension tables changed since their last refresh, are rebuilt.
+    With backend='matview' the marts are materialized views refreshed CONCURRENTLY
+    (see refresh_matview) and mode only applies to the rollup tables; 'swap' is
+    refreshed as 'incremental' there, since the views depend on those tables and
+    a rename cannot replace a table that views read.
+    TRUNCATE and INSERT are run as separate statements so both execute (some drivers
+    only run the first statement in a multi-statement string).
+    Returns {mart: (how, rows, seconds)}.
+    """
+    if mode not in ("full", "incremental", "swap"):
+        raise ValueError(f"Unknown mart refresh mode {mode!r}; expected 'full', 'incremental' or 'swap'")
+    if backend not in ("table", "matview"):
+        raise ValueError(f"Unknown mart backend {backend!r}; expected 'table' or 'matview'")
+    engine = get_engine()
+    insert_sql = dict(_REFRESH_LIST)
+    deps = {name: MART_DEPENDENCIES[name].get("after", []) for name in insert_sql}
+    table_mode = "incremental" if backend == "matview" and mode == "swap" else mode
+    results, failed = {}, {}
+    running = {}
+    with engine.connect() as conn:
+        state = _load_refresh_state(conn)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = list(deps)
+        while pending or running:
+            for name in list(pending):
+                if any(d in failed for d in deps[name]):
+                    pending.remove(name)
+                    failed[name] = RuntimeError(f"skipped: an upstream of {name} failed")
+                elif all(d in results for d in deps[name]):
+                    pending.remove(name)
+                    running[executor.submit(refresh_mart, engine, name, insert_sql[name], table_mode, state, force, backend)] = name
+            if not running:
+                break
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                try:
+                    results[name] = future.result()
+                    how, n_rows, seconds = results[name]
+                    rows = "" if n_rows is None else f", {n_rows} rows"
+                    print(f"{name}: {how}{rows} in {seconds:.2f}s")
+                except Exception as e:
+                    failed[name] = e
+
+    if failed:
+        summary = "; ".join(f"{name}: {e}" for name, e in failed.items())
+        raise RuntimeError(f"Error refreshing marts: {summary}")
+    total = sum(seconds for _, _, seconds in results.values())
+    print(f"SUCCESS: Marts refreshed ({total:.2f}s of mart work).")
+    return results
 
 
 if __name__ == "__main__":
@@ -0,0 +1,101 @@
+"""
+In-memory cache of parent keys used to pre-validate staging batches.
+
+Only keys that batches actually reference are cached: a batch's distinct
+values are checked against the keys already known to exist, and the rest are
+looked up in the parent table with one indexed = ANY(...) query. The cache is
+kept current by adding the keys of every staging batch that commits. Missing
+keys are not cached (the parent may arrive later), so an orphan row is parked
+for retry instead of aborting the insert, and memory grows with the keys a run
+touches rather than with the parent tables' history.
+"""
+import threading
+
+from sqlalchemy import text
+
+from utils.event_registry import EVENT_REGISTRY
+
+
+def _referenced_columns():
+    """{table: [columns]} that some registry entry has a foreign key to."""
+    referenced = {}
+    for spec in EVENT_REGISTRY.values():
+        for parent_table, parent_col in spec.get("parents", {}).values():
+            referenced.setdefault(parent_table, set()).add(parent_col)
+    return {table: sorted(cols) for table, cols in referenced.items()}
+
+
+REFERENCED_COLUMNS = _referenced_columns()
+
+
+class KeyCache:
+    def __init__(self):
+        self._keys = {}
+        self._types = {}
+        self._lock = threading.Lock()
+
+    def _column_type(self, conn, table, column):
+        with self._lock:
+            pg_type = self._types.get((table, column))
+        if pg_type is None:
+            pg_type = conn.execute(text(
+                """
+                SELECT format_type(atttypid, atttypmod) FROM pg_attribute
+                WHERE attrelid = to_regclass(:table) AND attname = :column
+                """
+            ), {"table": table, "column": column}).scalar()
+            with self._lock:
+                self._types[(table, column)] = pg_type
+        return pg_type
+
+    def existing(self, conn, table, column, values):
+        """Return the subset of values (text) present in table.column. Values not
+        cached yet are looked up in one query and cached if found."""
+        with self._lock:
+            known = self._keys.setdefault((table, column), set())
+            unknown = [v for v in values if v not in known]
+        if unknown:
+            # Cast the array, not the column, so the lookup uses the column's index
+            rows = conn.execute(
+                text(
+                    f"SELECT DISTINCT {column}::text FROM {table} "
+                    f"WHERE {column} = ANY(CAST(:keys AS {self._column_type(conn, table, column)}[]))"
+                ),
+                {"keys": unknown},
+            )
+            found = {row[0] for row in rows}
+            with self._lock:
+                known.update(found)
+        with self._lock:
+            return {v for v in values if v in known}
+
+    def add_committed(self, table, df):
+        """Record the keys of a batch committed to table, for cached columns only."""
+        for column in REFERENCED_COLUMNS.get(table, []):
+            with self._lock:
+                keys = self._keys.get((table, column))
+                if keys is not None and column in df.columns:
+                    keys.update(df[column].dropna().astype(str))
+
+    def split_orphans(self, conn, spec, df):
+        """Return (rows whose parents all exist, {reason: [source_event_id]} for the rest)."""
+        orphans = {}
+        for col, (parent_table, parent_col) in spec.get("parents", {}).items():
+            if col not in df.columns or df.empty:
+                continue
+            values = df[col].astype(str).where(df[col].notna())
+            distinct = set(values.dropna().unique())
+            missing = distinct - self.existing(conn, parent_table, parent_col, distinct)
+            if not missing:
+                continue
+            is_orphan = values.isin(missing)
+            orphans[f"missing {parent_table}.{parent_col}"] = df.loc[is_orphan, "source_event_id"].tolist()
+            df = df[~is_orphan]
+        return df, orphans
+
+    def invalidate(self, table=None):
+        """Drop cached keys for table (all tables when None) so they are looked up again."""
+        with self._lock:
+            for key in list(self._keys):
+                if table is None or key[0] == table:
+                    del self._keys[key]
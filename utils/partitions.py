@@ -0,0 +1,106 @@
+"""
+Monthly range partitions for fact_events.
+
+With FACT_EVENTS_PARTITIONED=1, init_db creates fact_events partitioned by
+RANGE (timestamp). Loaders call ensure_partitions_for before each COPY so the
+months a batch touches, plus PARTITION_AHEAD_MONTHS after the newest one,
+exist before rows arrive. Old months leave the table in one metadata-only step
+with archive_partitions (detach, then move to the archive schema or drop).
+On an unpartitioned fact_events every function here is a no-op.
+"""
+import os
+from datetime import date
+
+import pandas as pd
+from sqlalchemy import text
+
+PARTITION_AHEAD_MONTHS = int(os.getenv("PARTITION_AHEAD_MONTHS", "2"))
+ARCHIVE_SCHEMA = os.getenv("PARTITION_ARCHIVE_SCHEMA", "archive")
+
+
+def add_months(month, n):
+    index = month.year * 12 + month.month - 1 + n
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month, parent="fact_events"):
+    return f"{parent}_y{month.year}m{month.month:02d}"
+
+
+def is_partitioned(conn, parent="fact_events"):
+    return conn.execute(
+        text("SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(:parent))"),
+        {"parent": parent},
+    ).scalar()
+
+
+def list_partitions(conn, parent="fact_events"):
+    """Return the names of parent's attached partitions."""
+    rows = conn.execute(
+        text(
+            """
+            SELECT c.relname
+            FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = to_regclass(:parent)
+            ORDER BY c.relname
+            """
+        ),
+        {"parent": parent},
+    )
+    return [row[0] for row in rows]
+
+
+def ensure_partitions(conn, first_month, last_month, parent="fact_events"):
+    """Create the monthly partitions from first_month through last_month that do
+    not exist yet. Bounds are written as UTC instants, so they do not depend on
+    the session TimeZone. Returns the names created."""
+    existing = set(list_partitions(conn, parent))
+    created = []
+    month = date(first_month.year, first_month.month, 1)
+    while month <= last_month:
+        name = partition_name(month, parent)
+        if name not in existing:
+            conn.execute(text(
+                f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {parent} "
+                f"FOR VALUES FROM ('{month.isoformat()} 00:00:00+00') "
+                f"TO ('{add_months(month, 1).isoformat()} 00:00:00+00')"
+            ))
+            created.append(name)
+        month = add_months(month, 1)
+    return created
+
+
+def ensure_partitions_for(conn, timestamps, ahead_months=PARTITION_AHEAD_MONTHS, parent="fact_events"):
+    """Make sure every month in timestamps (plus ahead_months after the newest)
+    has a partition. Partition bounds are UTC months."""
+    if not is_partitioned(conn, parent):
+        return []
+    timestamps = pd.to_datetime(pd.Series(timestamps), utc=True, errors="coerce", format="ISO8601").dropna()
+    if timestamps.empty:
+        return []
+    first, last = timestamps.min(), timestamps.max()
+    return ensure_partitions(
+        conn, date(first.year, first.month, 1), add_months(date(last.year, last.month, 1), ahead_months), parent
+    )
+
+
+def archive_partitions(conn, before_month, drop=False, schema=ARCHIVE_SCHEMA, parent="fact_events"):
+    """Detach every partition that ends on or before before_month and move it to
+    schema (or drop it). Returns the names archived."""
+    if not is_partitioned(conn, parent):
+        return []
+    if not drop:
+        conn.execute(text(f"CREATE SCHEMA IF NOT EXISTS {schema}"))
+    archived = []
+    prefix = f"{parent}_y"
+    for name in list_partitions(conn, parent):
+        if not name.startswith(prefix):
+            continue
+        year, month = name[len(prefix):].split("m")
+        if add_months(date(int(year), int(month), 1), 1) > before_month:
+            continue
+        conn.execute(text(f"ALTER TABLE {parent} DETACH PARTITION {name}"))
+        conn.execute(text(f"DROP TABLE {name}" if drop else f"ALTER TABLE {name} SET SCHEMA {schema}"))
+        archived.append(name)
+    return archived
@@ -0,0 +1,232 @@
+"""
+Two-level result cache for eda_utils.run_query.
+
+Results are kept in an in-process LRU (bounded by entry count and memory) and,
+when pyarrow is installed, as Parquet files on disk (bounded by total size), so
+they survive a kernel restart. Entries are keyed by the whitespace-normalised
+SQL, its params and the database, and expire after QUERY_CACHE_TTL seconds.
+Every entry also records the refresh state (mart_refresh_state.refreshed_at and
+watermark) of each mart_* table the SQL mentions; a lookup re-reads that state
+in one small query and treats the entry as stale once any of those marts has
+been refreshed since, so cached results never lag the latest refresh. Only
+that state is checked, so queries that read no mart, or that also read a table
+outside the marts (staging, facts, dims, state), are not cacheable.
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+import pandas as pd
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+
+from utils.schema import TABLE_SCHEMAS
+
+try:
+    import pyarrow  # noqa: F401
+
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+QUERY_CACHE_ENABLED = os.getenv("QUERY_CACHE", "1") == "1"
+QUERY_CACHE_TTL = int(os.getenv("QUERY_CACHE_TTL", "3600"))
+QUERY_CACHE_MAX_ITEMS = int(os.getenv("QUERY_CACHE_MAX_ITEMS", "128"))
+QUERY_CACHE_MAX_MB = int(os.getenv("QUERY_CACHE_MAX_MB", "256"))
+QUERY_CACHE_DISK_MB = int(os.getenv("QUERY_CACHE_DISK_MB", "1024"))
+QUERY_CACHE_DIR = Path(os.getenv("QUERY_CACHE_DIR", Path.home() / ".cache" / "supply-chain-pipeline" / "queries"))
+
+_MART_RE = re.compile(r"\b(mart_\w+)\b", re.I)
+# Every table init_db creates; none of them is covered by mart_refresh_state
+_SOURCE_TABLE_RE = re.compile(r"\b(" + "|".join(sorted(TABLE_SCHEMAS)) + r")\b", re.I)
+
+
+def normalise_sql(sql):
+    """Collapse whitespace and drop a trailing semicolon so formatting does not change the key."""
+    return re.sub(r"\s+", " ", sql).strip().rstrip(";").strip()
+
+
+def cache_key(sql, params=None, database=None, variant=""):
+    """Key for sql + params; variant separates results read different ways (e.g. dtypes)."""
+    payload = json.dumps(
+        {
+            "sql": normalise_sql(sql),
+            "params": params or {},
+            "database": database or os.getenv("DB_NAME"),
+            "variant": variant,
+        },
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def referenced_marts(sql):
+    return sorted({name.lower() for name in _MART_RE.findall(sql)} - {"mart_refresh_state"})
+
+
+def cacheable(sql):
+    """True if sql reads mart_* tables and none of the tables init_db creates,
+    so its freshness is fully described by refresh_token."""
+    return bool(referenced_marts(sql)) and not _SOURCE_TABLE_RE.search(sql)
+
+
+def refresh_token(conn, marts):
+    """Refresh state of marts as a string; changes whenever one of them is refreshed."""
+    if not marts:
+        return ""
+    try:
+        rows = conn.execute(
+            text(
+                "SELECT mart_name, last_source_event_id, refreshed_at FROM mart_refresh_state "
+                "WHERE mart_name = ANY(:marts) ORDER BY mart_name"
+            ),
+            {"marts": marts},
+        ).fetchall()
+    except DBAPIError:
+        # No mart_refresh_state yet (marts never refreshed): rely on the TTL
+        conn.rollback()
+        return ""
+    return ";".join(f"{name}={watermark}@{refreshed_at.isoformat()}" for name, watermark, refreshed_at in rows)
+
+
+class QueryCache:
+    def __init__(
+        self,
+        ttl=QUERY_CACHE_TTL,
+        max_items=QUERY_CACHE_MAX_ITEMS,
+        max_bytes=QUERY_CACHE_MAX_MB * 2**20,
+        disk_dir=QUERY_CACHE_DIR,
+        disk_max_bytes=QUERY_CACHE_DISK_MB * 2**20,
+    ):
+        self.ttl = ttl
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.disk_dir = Path(disk_dir) if HAS_PYARROW and disk_max_bytes > 0 else None
+        self.disk_max_bytes = disk_max_bytes
+        self._memory = OrderedDict()  # key -> (df, token, created_at, n_bytes)
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    def get(self, key, token):
+        """Return a copy of the cached frame for key, or None if absent, expired or stale."""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                df, entry_token, created_at, _ = entry
+                if entry_token == token and now - created_at < self.ttl:
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    return df.copy()
+                self._drop_memory(key)
+        df = self._read_disk(key, token, now)
+        with self._lock:
+            if df is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        self._put_memory(key, df, token, now)
+        return df.copy()
+
+    def put(self, key, token, df):
+        now = time.time()
+        self._put_memory(key, df.copy(), token, now)
+        self._write_disk(key, token, df, now)
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+        if self.disk_dir is not None and self.disk_dir.exists():
+            for path in self.disk_dir.glob("*.parquet"):
+                self._unlink(path)
+
+    # In-process LRU -------------------------------------------------------
+
+    def _put_memory(self, key, df, token, created_at):
+        n_bytes = int(df.memory_usage(deep=True).sum())
+        if n_bytes > self.max_bytes:
+            return
+        with self._lock:
+            self._drop_memory(key)
+            self._memory[key] = (df, token, created_at, n_bytes)
+            self._memory_bytes += n_bytes
+            while len(self._memory) > self.max_items or self._memory_bytes > self.max_bytes:
+                self._drop_memory(next(iter(self._memory)))
+
+    def _drop_memory(self, key):
+        entry = self._memory.pop(key, None)
+        if entry is not None:
+            self._memory_bytes -= entry[3]
+
+    # Parquet on disk --------------------------------------------------------
+
+    def _paths(self, key):
+        return self.disk_dir / f"{key}.parquet", self.disk_dir / f"{key}.json"
+
+    def _read_disk(self, key, token, now):
+        if self.disk_dir is None:
+            return None
+        data_path, meta_path = self._paths(key)
+        try:
+            meta = json.loads(meta_path.read_text())
+        except (OSError, ValueError):
+            return None
+        if meta.get("token") != token or now - meta.get("created_at", 0) >= self.ttl:
+            self._unlink(data_path)
+            return None
+        try:
+            df = pd.read_parquet(data_path)
+        except Exception:
+            self._unlink(data_path)
+            return None
+        os.utime(data_path)  # eviction is least-recently-used by mtime
+        return df
+
+    def _write_disk(self, key, token, df, created_at):
+        if self.disk_dir is None:
+            return
+        data_path, meta_path = self._paths(key)
+        tmp_path = data_path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            self.disk_dir.mkdir(parents=True, exist_ok=True)
+            df.to_parquet(tmp_path, index=False)
+            os.replace(tmp_path, data_path)
+            meta_path.write_text(json.dumps({"token": token, "created_at": created_at}))
+        except Exception as e:
+            # Frames Arrow cannot represent (mixed-type object columns) stay memory-only
+            print(f"query cache: not written to disk ({e})")
+            for path in (tmp_path, data_path, meta_path):
+                path.unlink(missing_ok=True)
+            return
+        self._evict_disk()
+
+    def _evict_disk(self):
+        files = []
+        for path in self.disk_dir.glob("*.parquet"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.disk_max_bytes:
+                break
+            self._unlink(path)
+            total -= size
+
+    @staticmethod
+    def _unlink(data_path):
+        for path in (data_path, data_path.with_suffix(".json")):
+            try:
+                path.unlink()
+            except OSError:
+                pass
@@ -0,0 +1,132 @@
+"""
+Rollup tables maintained as staging rows arrive, and period-grain rollup SQL.
+
+rollup_delivery_outcomes holds one row per load summarising its delivery events:
+first pickup and last delivery time and facility, total detention and the
+on-time flag of the latest delivery event (ties broken by source_event_id, so
+the result is deterministic). The staging writer upserts the loads of every
+committed stg_delivery_events batch in the same transaction; the mart refresh
+also treats it as a node so it can be caught up or rebuilt.
+
+period_rollup_sql aggregates a table to every period grain in PERIOD_GRAINS
+(week, month, quarter, isoyear) in a single scan using GROUPING SETS, and
+touched_periods_sql lists the periods a set of new rows falls in, so a mart can
+recompute just those periods.
+"""
+from sqlalchemy import text
+
+_DELIVERY_OUTCOMES_SELECT = """SELECT
+    de.load_id,
+    MIN(de.actual_datetime) FILTER (WHERE de.event_type = 'P') AS pickup_at,
+    MAX(de.actual_datetime) FILTER (WHERE de.event_type = 'D') AS delivered_at,
+    (ARRAY_AGG(de.facility_id ORDER BY de.actual_datetime, de.source_event_id)
+        FILTER (WHERE de.event_type = 'P'))[1] AS pickup_facility_id,
+    (ARRAY_AGG(de.facility_id ORDER BY de.actual_datetime DESC NULLS LAST, de.source_event_id DESC)
+        FILTER (WHERE de.event_type = 'D'))[1] AS delivery_facility_id,
+    COALESCE(SUM(de.detention_minutes), 0)::INTEGER AS detention_minutes,
+    (ARRAY_AGG(de.on_time_flag ORDER BY de.actual_datetime DESC NULLS LAST, de.source_event_id DESC)
+        FILTER (WHERE de.event_type = 'D'))[1] AS on_time_flag,
+    COUNT(*)::INTEGER AS event_count,
+    MAX(de.source_event_id) AS last_source_event_id
+FROM stg_delivery_events de
+WHERE {where}
+GROUP BY de.load_id"""
+
+_DELIVERY_OUTCOMES_COLUMNS = (
+    "load_id, pickup_at, delivered_at, pickup_facility_id, delivery_facility_id, "
+    "detention_minutes, on_time_flag, event_count, last_source_event_id"
+)
+
+
+def delivery_outcomes_upsert_sql(where):
+    """Recompute and upsert the outcome of every load matched by where (over stg_delivery_events de)."""
+    return f"""
+INSERT INTO rollup_delivery_outcomes ({_DELIVERY_OUTCOMES_COLUMNS})
+{_DELIVERY_OUTCOMES_SELECT.format(where=where)}
+ON CONFLICT (load_id) DO UPDATE SET
+    pickup_at = EXCLUDED.pickup_at,
+    delivered_at = EXCLUDED.delivered_at,
+    pickup_facility_id = EXCLUDED.pickup_facility_id,
+    delivery_facility_id = EXCLUDED.delivery_facility_id,
+    detention_minutes = EXCLUDED.detention_minutes,
+    on_time_flag = EXCLUDED.on_time_flag,
+    event_count = EXCLUDED.event_count,
+    last_source_event_id = EXCLUDED.last_source_event_id,
+    updated_at = now()
+"""
+
+
+# Full rebuild (run after TRUNCATE) and keyed upsert for the mart refresh
+INSERT_ROLLUP_DELIVERY_OUTCOMES = f"""
+INSERT INTO rollup_delivery_outcomes ({_DELIVERY_OUTCOMES_COLUMNS})
+{_DELIVERY_OUTCOMES_SELECT.format(where="de.load_id IS NOT NULL")}
+"""
+UPSERT_ROLLUP_DELIVERY_OUTCOMES = delivery_outcomes_upsert_sql("de.load_id IN (SELECT key FROM mart_delta)")
+
+
+def update_delivery_outcomes(conn, df):
+    """Upsert the outcomes of the loads in a just-written stg_delivery_events batch."""
+    if "load_id" not in df.columns:
+        return
+    load_ids = [str(load_id) for load_id in df["load_id"].dropna().unique()]
+    if load_ids:
+        conn.execute(
+            text(delivery_outcomes_upsert_sql("de.load_id = ANY(CAST(:load_ids AS uuid[]))")),
+            {"load_ids": load_ids},
+        )
+
+
+# Staging table -> function(conn, written batch) run in the batch's transaction
+STAGING_ROLLUPS = {"stg_delivery_events": update_delivery_outcomes}
+
+
+# Period grains for time rollups: (period start from a UTC timestamp {ts}, end of
+# the period starting at {start}). isoyear periods start on the Monday of ISO week 1.
+PERIOD_GRAINS = {
+    "week": ("DATE_TRUNC('week', {ts})::date", "({start} + 7)"),
+    "month": ("DATE_TRUNC('month', {ts})::date", "({start} + INTERVAL '1 month')::date"),
+    "quarter": ("DATE_TRUNC('quarter', {ts})::date", "({start} + INTERVAL '3 months')::date"),
+    "isoyear": (
+        "DATE_TRUNC('week', MAKE_DATE(EXTRACT(ISOYEAR FROM {ts})::INTEGER, 1, 4))::date",
+        "DATE_TRUNC('week', MAKE_DATE(EXTRACT(ISOYEAR FROM {start})::INTEGER + 1, 1, 4))::date",
+    ),
+}
+
+
+def period_rollup_sql(table, key, ts, measures, grains, where="TRUE"):
+    """SELECT key, period_type, period_start and measures ({name: aggregate}) for
+    every grain, in one scan of table (alias s) with GROUPING SETS. ts is a UTC
+    timestamp expression over s; rows where it is NULL are left out."""
+    periods = ",\n        ".join(f"{PERIOD_GRAINS[g][0].format(ts=ts)} AS p_{g}" for g in grains)
+    period_type = " ".join(f"WHEN GROUPING(p_{g}) = 0 THEN '{g}'" for g in grains)
+    period_start = ", ".join(f"p_{g}" for g in grains)
+    aggregates = ",\n    ".join(f"{expr} AS {name}" for name, expr in measures.items())
+    grouping_sets = ", ".join(f"({key}, p_{g})" for g in grains)
+    return f"""SELECT
+    {key},
+    (CASE {period_type} END)::varchar(10) AS period_type,
+    COALESCE({period_start}) AS period_start,
+    {aggregates}
+FROM (
+    SELECT s.*,
+        {periods}
+    FROM {table} s
+    WHERE ({ts}) IS NOT NULL AND ({where})
+) s
+GROUP BY GROUPING SETS ({grouping_sets})"""
+
+
+def touched_periods_sql(rows_sql, key, grains):
+    """Distinct (key, period_type, period_start, period_end) of every grain that
+    the rows of rows_sql (columns key and ts) fall in."""
+    values = ",\n        ".join(
+        f"('{g}'::varchar(10), {start.format(ts='r.ts')}, {end.format(start=start.format(ts='r.ts'))})"
+        for g, (start, end) in ((g, PERIOD_GRAINS[g]) for g in grains)
+    )
+    return f"""SELECT DISTINCT r.{key}, g.period_type, g.period_start, g.period_end
+FROM ({rows_sql}) r
+CROSS JOIN LATERAL (
+    VALUES
+        {values}
+) g (period_type, period_start, period_end)
+WHERE r.{key} IS NOT NULL AND r.ts IS NOT NULL"""
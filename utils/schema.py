@@ -0,0 +1,188 @@
+"""
+Table schemas parsed from the init_db DDL, and vectorized coercion of staging
+frames to them.
+
+Payload columns arrive as object dtype. coerce_frame converts each column to
+the dtype of its target column in one pass (nullable Int64/Float64/boolean,
+UTC datetimes, and string columns backed by Arrow when pyarrow is installed),
+drops payload keys the table has no column for, and reports drift before any
+row is sent: unknown keys, missing columns and values that failed to convert.
+DECIMAL/NUMERIC values stay decimal text (checked to be numeric) so Postgres
+parses them exactly. Rows holding a value that failed to convert are flagged
+in a mask for the caller to park, never written as NULL.
+"""
+import re
+
+import pandas as pd
+
+from utils.init_db import DDL_STATEMENTS
+
+try:
+    import pyarrow  # noqa: F401
+
+    STRING_DTYPE = pd.StringDtype("pyarrow")
+except ImportError:
+    STRING_DTYPE = pd.StringDtype("python")
+
+_TABLE_RE = re.compile(r"CREATE TABLE IF NOT EXISTS (\w+)\s*\((.*)\)\s*;", re.S)
+_COLUMN_RE = re.compile(r"(\w+)\s+([A-Za-z]+(?:\s+PRECISION)?(?:\(\d+(?:,\s*\d+)?\))?(?:\[\])?)(.*)", re.S)
+_CONSTRAINT_WORDS = {"PRIMARY", "CONSTRAINT", "UNIQUE", "FOREIGN", "CHECK"}
+_UUID_RE = r"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}"
+
+
+def _split_definitions(body):
+    """Split a CREATE TABLE body on top-level commas."""
+    parts, depth, current = [], 0, []
+    for ch in body:
+        if ch == "(":
+            depth += 1
+        elif ch == ")":
+            depth -= 1
+        if ch == "," and depth == 0:
+            parts.append("".join(current))
+            current = []
+        else:
+            current.append(ch)
+    parts.append("".join(current))
+    return [p.strip() for p in parts if p.strip()]
+
+
+def parse_ddl(statements):
+    """Return {table: {column: {"type", "not_null", "has_default"}}} in column order."""
+    schemas = {}
+    for sql in statements:
+        match = _TABLE_RE.search(sql)
+        if not match:
+            continue
+        columns = {}
+        for definition in _split_definitions(match.group(2)):
+            if definition.split()[0].upper() in _CONSTRAINT_WORDS:
+                continue
+            col = _COLUMN_RE.match(definition)
+            name, pg_type, rest = col.group(1), col.group(2).upper(), col.group(3).upper()
+            columns[name] = {
+                "type": pg_type,
+                "not_null": "NOT NULL" in rest or "PRIMARY KEY" in rest,
+                "has_default": "DEFAULT" in rest or pg_type in ("SERIAL", "BIGSERIAL"),
+            }
+        schemas[match.group(1)] = columns
+    return schemas
+
+
+TABLE_SCHEMAS = parse_ddl(DDL_STATEMENTS)
+
+
+def _base_type(pg_type):
+    return re.sub(r"\(.*\)", "", pg_type)
+
+
+def _to_integer(series):
+    values = pd.to_numeric(series, errors="coerce")
+    values = values.where(values == values.round())
+    return values.astype("Int64")
+
+
+def _to_uuid(series):
+    text = series.astype(STRING_DTYPE).str.strip().str.lower()
+    return text.where(text.str.fullmatch(_UUID_RE).fillna(False).astype(bool))
+
+
+def _to_boolean(series):
+    if pd.api.types.is_bool_dtype(series):
+        return series.astype("boolean")
+    lowered = series.astype(STRING_DTYPE).str.lower()
+    return lowered.map({"true": True, "t": True, "1": True, "false": False, "f": False, "0": False}).astype("boolean")
+
+
+def _to_timestamptz(series):
+    if isinstance(series.dtype, pd.DatetimeTZDtype):
+        return series.dt.tz_convert("UTC")
+    return pd.to_datetime(series, utc=True, errors="coerce", format="ISO8601")
+
+
+def _to_date(series):
+    return pd.to_datetime(series, errors="coerce", format="ISO8601").dt.normalize()
+
+
+def _to_decimal(series):
+    # Kept as text rather than binary floats so money columns stay exact
+    text = series.astype(STRING_DTYPE).str.strip()
+    return text.where(pd.to_numeric(text, errors="coerce").notna())
+
+
+_CONVERTERS = {
+    "SMALLINT": _to_integer,
+    "INTEGER": _to_integer,
+    "BIGINT": _to_integer,
+    "SERIAL": _to_integer,
+    "BIGSERIAL": _to_integer,
+    "DECIMAL": _to_decimal,
+    "NUMERIC": _to_decimal,
+    "DOUBLE PRECISION": lambda s: pd.to_numeric(s, errors="coerce").astype("Float64"),
+    "BOOLEAN": _to_boolean,
+    "TIMESTAMPTZ": _to_timestamptz,
+    "DATE": _to_date,
+    "UUID": _to_uuid,
+    "VARCHAR": lambda s: s.astype(STRING_DTYPE),
+    "CHAR": lambda s: s.astype(STRING_DTYPE),
+    "TEXT": lambda s: s.astype(STRING_DTYPE),
+}
+
+
+def coerce_frame(df, table):
+    """Coerce df to the column types of table and order it like the table.
+    Payload keys without a column are dropped; array and JSONB columns are
+    passed through. Returns (frame, report, invalid) where report has "unknown"
+    keys, "missing" columns, "missing_required" (NOT NULL, no default) and
+    "invalid" {column: number of values that could not be converted}, and
+    invalid is a boolean mask of the rows holding any such value.
+    """
+    schema = TABLE_SCHEMAS[table]
+    unknown = [col for col in df.columns if col not in schema]
+    missing = [col for col in schema if col not in df.columns]
+    report = {
+        "unknown": unknown,
+        "missing": missing,
+        "missing_required": [c for c in missing if schema[c]["not_null"] and not schema[c]["has_default"]],
+        "invalid": {},
+    }
+    coerced = {}
+    invalid = pd.Series(False, index=df.index)
+    for col in df.columns:
+        if col in unknown:
+            continue
+        series = df[col]
+        converter = _CONVERTERS.get(_base_type(schema[col]["type"])) if col in schema else None
+        if converter is None:
+            coerced[col] = series
+            continue
+        converted = converter(series)
+        failed = (series.notna() & converted.isna()).fillna(False).astype(bool)
+        if failed.any():
+            report["invalid"][col] = int(failed.sum())
+            invalid |= failed
+        coerced[col] = converted
+    ordered = [col for col in schema if col in coerced]
+    return pd.DataFrame(coerced, index=df.index)[ordered], report, invalid
+
+
+def missing_required_values(df, table):
+    """Boolean mask of rows with a NULL in a NOT NULL column that has no default."""
+    schema = TABLE_SCHEMAS[table]
+    required = [c for c in df.columns if schema[c]["not_null"] and not schema[c]["has_default"]]
+    return df[required].isna().any(axis=1) if required else pd.Series(False, index=df.index)
+
+
+def format_report(table, report):
+    """One line per kind of drift, or an empty list when the frame matched."""
+    lines = []
+    if report["unknown"]:
+        lines.append(f"{table}: dropped unknown payload key(s) {', '.join(report['unknown'])}")
+    optional = [c for c in report["missing"] if c not in report["missing_required"]]
+    if optional:
+        lines.append(f"{table}: payload has no key for column(s) {', '.join(optional)}")
+    if report["missing_required"]:
+        lines.append(f"{table}: required column(s) missing from payload: {', '.join(report['missing_required'])}")
+    for col, n in report["invalid"].items():
+        lines.append(f"{table}: {n} value(s) in {col} could not be converted to {TABLE_SCHEMAS[table][col]['type']}")
+    return lines
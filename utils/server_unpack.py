@@ -0,0 +1,143 @@
+"""
+Server-side unpack engine: stage events with set-based INSERT ... SELECT inside
+Postgres instead of pulling payloads into pandas.
+
+The selected events are materialised once into a temp table, then each event
+type in utils.event_registry is projected onto its stg_* table with
+jsonb_populate_record against the table's own row type. Payload keys without a matching column (the invoice
+timestamp, the dropped purchase-order metrics) are ignored by construction. jsonb_populate_record
+leaves absent keys NULL, so columns with a DEFAULT (stg_loads.order_ids) get it when the key is absent.
+"""
+from sqlalchemy import text
+
+from utils.event_registry import EVENT_REGISTRY
+from utils.rollups import delivery_outcomes_upsert_sql
+
+
+def _sql_literal(value):
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def table_columns(conn, tables):
+    """{table: [(column, default expression or None), ...]} in column order."""
+    rows = conn.execute(text(
+        """
+        SELECT a.attrelid::regclass::text, a.attname, pg_get_expr(d.adbin, d.adrelid)
+        FROM pg_attribute a
+        LEFT JOIN pg_attrdef d ON d.adrelid = a.attrelid AND d.adnum = a.attnum
+        WHERE a.attrelid = ANY(CAST(:tables AS regclass[]))
+        AND a.attnum > 0 AND NOT a.attisdropped AND a.attgenerated = ''
+        ORDER BY a.attrelid, a.attnum
+        """
+    ), {"tables": list(tables)})
+    columns = {}
+    for table, column, default in rows:
+        columns.setdefault(table, []).append((column, default))
+    return columns
+
+
+def _event_doc(spec):
+    """JSONB expression for an unpack_batch event e as stored: its payload with
+    source_event_id, the timestamp column and value_maps applied."""
+    fields = ["'source_event_id', e.event_id"]
+    if spec.get("timestamp_column"):
+        fields.append(f"'{spec['timestamp_column']}', e.timestamp")
+    for col, mapping in spec.get("value_maps", {}).items():
+        cases = " ".join(f"WHEN {_sql_literal(k)} THEN {_sql_literal(v)}" for k, v in mapping.items())
+        fields.append(f"'{col}', CASE e.payload->>'{col}' {cases} END")
+    return f"e.payload || jsonb_build_object({', '.join(fields)})"
+
+
+def build_insert_sql(event_type, spec, columns):
+    """INSERT ... SELECT projecting unpack_batch events of one type onto spec['table'].
+    columns is the table's [(column, default)] from table_columns."""
+    table = spec["table"]
+    where = [f"e.event_type = {_sql_literal(event_type)}"]
+    for col, prefix in spec.get("exclude_prefixes", {}).items():
+        where.append(f"NOT COALESCE(e.payload->>'{col}' LIKE {_sql_literal(prefix + '%')}, false)")
+    if spec.get("parents"):
+        where.append("e.event_id NOT IN (SELECT event_id FROM unpack_parked)")
+    values = ",\n    ".join(
+        f"r.{col}" if default is None else f"CASE WHEN p.doc ? {_sql_literal(col)} THEN r.{col} ELSE {default} END"
+        for col, default in columns
+    )
+    # The record is built once per event in a LATERAL join; (f(...)).* would call f once per column
+    return f"""
+INSERT INTO {table} ({', '.join(col for col, _ in columns)})
+SELECT
+    {values}
+FROM unpack_batch e
+CROSS JOIN LATERAL (SELECT {_event_doc(spec)} AS doc) p
+CROSS JOIN LATERAL jsonb_populate_record(NULL::{table}, p.doc) r
+WHERE {' AND '.join(where)}
+ORDER BY e.event_id
+"""
+
+
+def build_parked_sql(event_type, spec):
+    """Collect events of one type whose parent row is not staged yet into unpack_parked.
+    The event is cast through the child's row type so keys compare with the parent's type.
+    It is built exactly as build_insert_sql builds it: raw payload values such as
+    DeliveryEvent's 'Pickup' do not fit the row type until value_maps are applied.
+    """
+    missing = " OR ".join(
+        f"""(r.{col} IS NOT NULL AND NOT EXISTS (
+        SELECT 1 FROM {parent_table} p WHERE p.{parent_col} = r.{col}
+    ))"""
+        for col, (parent_table, parent_col) in spec["parents"].items()
+    )
+    return f"""
+INSERT INTO unpack_parked (event_id, event_type)
+SELECT e.event_id, e.event_type
+FROM unpack_batch e
+CROSS JOIN LATERAL jsonb_populate_record(NULL::{spec['table']}, {_event_doc(spec)}) r
+WHERE e.event_type = {_sql_literal(event_type)}
+AND ({missing})
+"""
+
+
+def unpack_in_database(conn, selection_sql, params, park_reason="missing parent row"):
+    """Stage every event returned by selection_sql without moving rows to the client.
+    Runs in the connection's current transaction. Returns ({table: rows inserted},
+    number of events read, number of events parked for retry).
+    """
+    n_events = conn.execute(text(f"CREATE TEMP TABLE unpack_batch ON COMMIT DROP AS {selection_sql}"), params).rowcount
+    conn.execute(text("CREATE TEMP TABLE unpack_parked (event_id BIGINT, event_type VARCHAR(100)) ON COMMIT DROP"))
+    columns = table_columns(conn, {spec["table"] for spec in EVENT_REGISTRY.values()})
+    inserted = {}
+    for event_type, spec in EVENT_REGISTRY.items():
+        if spec.get("parents"):
+            # Checked in registry order so parents staged earlier in this batch count
+            conn.execute(text(build_parked_sql(event_type, spec)))
+        insert_sql = build_insert_sql(event_type, spec, columns[spec["table"]])
+        inserted[spec["table"]] = conn.execute(text(insert_sql)).rowcount
+
+    if inserted.get("stg_delivery_events"):
+        conn.execute(text(delivery_outcomes_upsert_sql(
+            "de.load_id IN (SELECT load_id FROM stg_delivery_events "
+            "WHERE source_event_id IN (SELECT event_id FROM unpack_batch))"
+        )))
+
+    conn.execute(text(
+        """
+        WITH cleared AS (
+            DELETE FROM unpack_retry r
+            USING unpack_batch b
+            WHERE r.event_id = b.event_id
+            AND r.event_id NOT IN (SELECT event_id FROM unpack_parked)
+            RETURNING r.event_id
+        )
+        INSERT INTO unpack_replayed (event_id) SELECT event_id FROM cleared
+        """
+    ))
+    n_parked = conn.execute(text(
+        """
+        INSERT INTO unpack_retry (event_id, event_type, reason)
+        SELECT event_id, event_type, :reason FROM unpack_parked
+        ON CONFLICT (event_id) DO UPDATE SET
+            reason = EXCLUDED.reason,
+            attempts = unpack_retry.attempts + 1,
+            last_failed_at = now()
+        """
+    ), {"reason": park_reason}).rowcount
+    return inserted, n_events, n_parked
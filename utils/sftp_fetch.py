@@ -0,0 +1,201 @@
+"""
+Parallel, resumable SFTP fetch of simulator event files from one or more hosts.
+
+Hosts come from REMOTE_HOSTS (comma-separated, each "host", "user@host" or
+"user@host:/events/dir") and fall back to REMOTE_HOST. Each host gets one SSH
+transport with a small pool of SFTP channels; files are downloaded by a shared
+thread pool. A file is resumed from its current local size, skipped when its
+local size and mtime already match the remote, and every downloaded byte range
+is verified against a sha256 computed on the remote host.
+"""
+import hashlib
+import os
+import queue
+import re
+import shlex
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import paramiko
+
+DEFAULT_EVENTS_DIR = "/home/azureuser/supply-chain-simulator/data/events"
+DATE_PATTERN = re.compile(r"^\d{4}-\d{2}-\d{2}\.jsonl$")
+FETCH_WORKERS = int(os.getenv("SFTP_FETCH_WORKERS", "8"))
+CHANNELS_PER_HOST = int(os.getenv("SFTP_CHANNELS_PER_HOST", "4"))
+READ_SIZE = 1024 * 1024
+
+
+def remote_hosts_from_env():
+    """Return a list of host config dicts: host, port, user, key_path, events_dir."""
+    return _parse_hosts(os.getenv("REMOTE_HOSTS") or os.getenv("REMOTE_HOST") or "")
+
+
+def legacy_host_from_env():
+    """Host name of REMOTE_HOST, the single host loaded before the ingest manifest
+    existed, or None when it is not set."""
+    hosts = _parse_hosts(os.getenv("REMOTE_HOST") or "")
+    return hosts[0]["host"] if hosts else None
+
+
+def _parse_hosts(specs):
+    hosts = []
+    for spec in (s.strip() for s in specs.split(",")):
+        if not spec:
+            continue
+        user = os.getenv("REMOTE_USER")
+        events_dir = os.getenv("REMOTE_EVENTS_DIR", DEFAULT_EVENTS_DIR)
+        if "@" in spec:
+            user, spec = spec.split("@", 1)
+        if ":/" in spec:
+            spec, events_dir = spec.split(":", 1)
+        hosts.append({
+            "host": spec,
+            "port": int(os.getenv("REMOTE_PORT", "22")),
+            "user": user,
+            "key_path": os.path.expanduser(os.getenv("SSH_KEY_PATH", "~/.ssh/id_rsa")),
+            "events_dir": events_dir.rstrip("/"),
+        })
+    return hosts
+
+
+class SFTPPool:
+    """One SSH transport per host with up to `channels` SFTP channels shared by threads."""
+
+    def __init__(self, host_cfg, channels=CHANNELS_PER_HOST):
+        self.cfg = host_cfg
+        self.client = paramiko.SSHClient()
+        self.client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        self.client.connect(
+            hostname=host_cfg["host"],
+            port=host_cfg["port"],
+            username=host_cfg["user"],
+            pkey=paramiko.RSAKey.from_private_key_file(host_cfg["key_path"]),
+        )
+        self._idle = queue.Queue()
+        for _ in range(channels):
+            self._idle.put(self.client.open_sftp())
+
+    def acquire(self):
+        return self._idle.get()
+
+    def release(self, sftp):
+        self._idle.put(sftp)
+
+    def listdir_attr(self):
+        sftp = self.acquire()
+        try:
+            return sftp.listdir_attr(self.cfg["events_dir"])
+        finally:
+            self.release(sftp)
+
+    def remote_sha256(self, remote_path, start, end):
+        """sha256 of remote bytes [start, end), or None when the host has no shell."""
+        cmd = f"tail -c +{start + 1} {shlex.quote(remote_path)} | head -c {end - start} | sha256sum"
+        try:
+            _, stdout, _ = self.client.exec_command(cmd, timeout=300)
+            out = stdout.read().decode().strip()
+            if stdout.channel.recv_exit_status() != 0 or not out:
+                return None
+        except (paramiko.SSHException, OSError):
+            return None
+        return out.split()[0]
+
+    def close(self):
+        while not self._idle.empty():
+            self._idle.get().close()
+        self.client.close()
+
+
+def _local_sha256(local_path, start, end):
+    digest = hashlib.sha256()
+    with open(local_path, "rb") as f:
+        f.seek(start)
+        remaining = end - start
+        while remaining > 0:
+            data = f.read(min(remaining, READ_SIZE))
+            if not data:
+                break
+            digest.update(data)
+            remaining -= len(data)
+    return digest.hexdigest()
+
+
+def _download_range(sftp, remote_path, local_path, start, end):
+    local_path.parent.mkdir(parents=True, exist_ok=True)
+    mode = "r+b" if local_path.exists() else "wb"
+    with sftp.open(remote_path, "rb") as rf, open(local_path, mode) as lf:
+        rf.seek(start)
+        rf.prefetch(end)
+        lf.seek(start)
+        remaining = end - start
+        while remaining > 0:
+            data = rf.read(min(remaining, READ_SIZE))
+            if not data:
+                break
+            lf.write(data)
+            remaining -= len(data)
+        lf.truncate(end)
+    if remaining > 0:
+        raise RuntimeError(f"Short read fetching {remote_path}: {remaining} bytes missing")
+
+
+def fetch_file(pool, attr, local_path, min_offset=0, verify=True):
+    """Bring local_path up to the remote file described by attr.
+    Bytes below min_offset (already ingested) are never fetched. Returns
+    (status, bytes_fetched) with status one of skipped/resumed/downloaded.
+    """
+    size, mtime = attr.st_size, attr.st_mtime
+    local_size = local_path.stat().st_size if local_path.exists() else 0
+    if local_size == size and local_path.exists() and int(local_path.stat().st_mtime) == int(mtime):
+        return "skipped", 0
+    start = local_size if local_size <= size else 0
+    start = max(start, min(min_offset, size))
+    if start >= size:
+        return "skipped", 0
+    status = "resumed" if start else "downloaded"
+    remote_path = f"{pool.cfg['events_dir']}/{attr.filename}"
+
+    for attempt in range(2):
+        sftp = pool.acquire()
+        try:
+            _download_range(sftp, remote_path, local_path, start, size)
+        finally:
+            pool.release(sftp)
+        if not verify:
+            break
+        remote_digest = pool.remote_sha256(remote_path, start, size)
+        if remote_digest is None or remote_digest == _local_sha256(local_path, start, size):
+            break
+        if attempt:
+            raise RuntimeError(f"Checksum mismatch fetching {pool.cfg['host']}:{remote_path} [{start}, {size})")
+    os.utime(local_path, (mtime, mtime))
+    return status, size - start
+
+
+def fetch_all(pools, local_root, min_offsets=None, workers=FETCH_WORKERS, verify=True):
+    """Fetch every dated event file from every pool concurrently.
+    min_offsets maps host -> {file_name: ingested byte offset}. Returns
+    {host: [(attr, local_path, status, bytes_fetched), ...]} sorted by file name.
+    """
+    min_offsets = min_offsets or {}
+    tasks = []
+    for pool in pools:
+        host = pool.cfg["host"]
+        for attr in pool.listdir_attr():
+            if DATE_PATTERN.match(attr.filename):
+                offset = min_offsets.get(host, {}).get(attr.filename, 0)
+                tasks.append((pool, attr, Path(local_root) / host / attr.filename, offset))
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(fetch_file, pool, attr, local_path, offset, verify)
+            for pool, attr, local_path, offset in tasks
+        ]
+        results = {pool.cfg["host"]: [] for pool in pools}
+        for (pool, attr, local_path, _), future in zip(tasks, futures):
+            status, n_bytes = future.result()
+            results[pool.cfg["host"]].append((attr, local_path, status, n_bytes))
+
+    for host_results in results.values():
+        host_results.sort(key=lambda r: r[0].filename)
+    return results
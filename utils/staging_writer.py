@@ -0,0 +1,120 @@
+"""
+Concurrent staging writer with bounded, resumable transactions.
+
+Each staging table is loaded on its own pooled connection, in batches of
+STAGING_BATCH_ROWS rows that commit individually. A table starts only once the
+staging tables it references (registry parents) have finished, so foreign keys
+hold: orders before backorders/loads/invoices, invoices before payments, jobs
+before starts and completions. Every batch commit also records the table's
+progress, updates the rollups fed by the table (utils.rollups), clears the
+retry entries it staged and parks rows whose parent keys are not in the run's
+KeyCache, so a failure costs the batch in flight and the next run resumes after
+the last committed batch.
+"""
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from utils.bulk_load import copy_dataframe
+from utils.event_registry import EVENT_REGISTRY, TABLE_EVENT_TYPES, staging_parents
+from utils.key_cache import KeyCache
+from utils.rollups import STAGING_ROLLUPS
+from utils.schema import coerce_frame, format_report, missing_required_values
+from utils.unpack_ledger import clear_retries, load_table_progress, park_events, save_table_progress
+
+STAGING_WORKERS = int(os.getenv("STAGING_WORKERS", "4"))
+STAGING_BATCH_ROWS = int(os.getenv("STAGING_BATCH_ROWS", "50000"))
+
+
+def write_table(engine, table, df, watermark, progress, retry_ids, key_cache, batch_rows=STAGING_BATCH_ROWS):
+    """Load one staging frame in committed batches. Rows above the watermark that
+    a previous run already committed (source_event_id <= progress, not parked
+    for retry) are skipped.
+    Returns (rows inserted, source_event_ids parked).
+    """
+    event_type = TABLE_EVENT_TYPES[table]
+    spec = EVENT_REGISTRY[event_type]
+    ids = df["source_event_id"]
+    df = df[(ids <= watermark) | (ids > progress) | ids.isin(retry_ids)].sort_values("source_event_id")
+    df, report, unconvertible = coerce_frame(df, table)
+    for line in format_report(table, report):
+        print(line)
+    # Rows with a value that failed to convert or a NULL in a required column are
+    # parked rather than written with a NULL or failing the batch
+    invalid = unconvertible | missing_required_values(df, table)
+    n_inserted, parked_ids = 0, []
+    if invalid.any():
+        parked_ids = df.loc[invalid, "source_event_id"].tolist()
+        with engine.begin() as conn:
+            park_events(conn, [(event_id, event_type) for event_id in parked_ids], "invalid or missing required value")
+        df = df[~invalid]
+    for start in range(0, len(df), batch_rows):
+        batch = df.iloc[start:start + batch_rows]
+        with engine.begin() as conn:
+            batch, orphans = key_cache.split_orphans(conn, spec, batch)
+            n_inserted += copy_dataframe(conn, batch, table, json_columns=spec.get("json_columns", ()))
+            if table in STAGING_ROLLUPS:
+                STAGING_ROLLUPS[table](conn, batch)
+            clear_retries(conn, retry_ids.intersection(batch["source_event_id"]))
+            for reason, orphan_ids in orphans.items():
+                park_events(conn, [(event_id, event_type) for event_id in orphan_ids], reason)
+                parked_ids.extend(orphan_ids)
+            batch_max = int(df["source_event_id"].iloc[min(start + batch_rows, len(df)) - 1])
+            if batch_max > watermark:
+                save_table_progress(conn, table, batch_max)
+        key_cache.add_committed(table, batch)
+    return n_inserted, parked_ids
+
+
+def write_staging(
+    engine, frames, watermark, retry_ids, key_cache=None, workers=STAGING_WORKERS, batch_rows=STAGING_BATCH_ROWS
+):
+    """Load every staging frame concurrently in dependency order, parking rows
+    whose foreign keys are not in key_cache (a fresh KeyCache when None).
+    Returns {table: (rows inserted, source_event_ids parked, seconds)}. Raises after all
+    runnable tables finish if any table failed; its dependents are not started.
+    """
+    key_cache = key_cache or KeyCache()
+    with engine.connect() as conn:
+        progress = load_table_progress(conn)
+    deps = {
+        spec["table"]: [d for d in staging_parents(spec) if d in frames]
+        for spec in EVENT_REGISTRY.values()
+        if spec["table"] in frames
+    }
+    results, failed = {}, {}
+    done = set()
+    running = {}
+
+    def run(table):
+        started = time.perf_counter()
+        n_inserted, parked_ids = write_table(
+            engine, table, frames[table], watermark, progress.get(table, 0), retry_ids, key_cache, batch_rows
+        )
+        return n_inserted, parked_ids, time.perf_counter() - started
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = list(deps)
+        while pending or running:
+            for table in list(pending):
+                if any(d in failed for d in deps[table]):
+                    pending.remove(table)
+                    failed[table] = RuntimeError(f"skipped: a parent of {table} failed")
+                elif all(d in done for d in deps[table]):
+                    pending.remove(table)
+                    running[executor.submit(run, table)] = table
+            if not running:
+                break
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                table = running.pop(future)
+                try:
+                    results[table] = future.result()
+                    done.add(table)
+                except Exception as e:
+                    failed[table] = e
+
+    if failed:
+        summary = "; ".join(f"{table}: {e}" for table, e in failed.items())
+        raise RuntimeError(f"Error writing staging tables: {summary}")
+    return results
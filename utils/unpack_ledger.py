@@ -0,0 +1,146 @@
+"""
+Processed-event ledger for the unpack stage.
+unpack_state holds the highest fact_events.event_id that has been staged and
+the unpack_replayed position committed with it (a prefix every writer of the
+run has committed, which mart refreshes use as their replay bound);
+unpack_retry holds the few events at or below it that could not be staged yet
+(e.g. a payment whose invoice has not arrived) and must be read again.
+unpack_table_progress holds, per staging table, the highest source_event_id
+committed above the watermark, so a run that failed part-way resumes each table
+after its last committed batch instead of re-inserting it.
+unpack_replayed logs retried events as they leave unpack_retry.
+unpack_pending holds a lower bound on the timestamps of events loaded since the
+last complete unpack, so the unpack read can prune fact_events partitions.
+
+The unpack reads up to MAX(fact_events.event_id) and moves the watermark there.
+That is only safe if no lower event_id can commit afterwards, so every loader
+takes lock_fact_events_loads before inserting: loads run one at a time, and the
+ids of a load in flight are all above every committed id.
+"""
+from sqlalchemy import text
+
+# pg_advisory_xact_lock key serialising fact_events loaders
+FACT_EVENTS_LOAD_LOCK = 7_301_001
+
+
+def lock_fact_events_loads(conn):
+    """Wait for other fact_events loaders, holding the lock until this transaction
+    ends. Call before the transaction's first insert into fact_events."""
+    conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": FACT_EVENTS_LOAD_LOCK})
+
+
+def get_watermark(conn):
+    """Return the last staged event_id, or None before the first ledger run."""
+    return conn.execute(text("SELECT last_event_id FROM unpack_state WHERE id = 1")).scalar()
+
+
+def set_watermark(conn, event_id):
+    """Advance the watermark to event_id and the replay position to the current
+    end of unpack_replayed. Call only once every staging transaction of the
+    chunk has committed: concurrent writers commit unpack_replayed rows out of
+    seq order, so its MAX is a committed prefix only at that point."""
+    conn.execute(
+        text(
+            """
+            INSERT INTO unpack_state (id, last_event_id, last_replay_seq, updated_at)
+            VALUES (1, :event_id, (SELECT COALESCE(MAX(seq), 0) FROM unpack_replayed), now())
+            ON CONFLICT (id) DO UPDATE SET
+                last_event_id = GREATEST(unpack_state.last_event_id, EXCLUDED.last_event_id),
+                last_replay_seq = GREATEST(unpack_state.last_replay_seq, EXCLUDED.last_replay_seq),
+                updated_at = now()
+            """
+        ),
+        {"event_id": int(event_id)},
+    )
+
+
+def load_retry_ids(conn):
+    return {row[0] for row in conn.execute(text("SELECT event_id FROM unpack_retry"))}
+
+
+def park_events(conn, events, reason):
+    """Add (event_id, event_type) pairs to the retry set, bumping attempts for known ones."""
+    rows = [{"event_id": int(event_id), "event_type": event_type, "reason": reason} for event_id, event_type in events]
+    if not rows:
+        return
+    conn.execute(
+        text(
+            """
+            INSERT INTO unpack_retry (event_id, event_type, reason)
+            VALUES (:event_id, :event_type, :reason)
+            ON CONFLICT (event_id) DO UPDATE SET
+                reason = EXCLUDED.reason,
+                attempts = unpack_retry.attempts + 1,
+                last_failed_at = now()
+            """
+        ),
+        rows,
+    )
+
+
+def clear_retries(conn, event_ids):
+    """Remove staged events from the retry set, logging them in unpack_replayed so
+    incremental mart refreshes see rows staged below their watermark."""
+    event_ids = [int(event_id) for event_id in event_ids]
+    if event_ids:
+        conn.execute(
+            text(
+                """
+                WITH cleared AS (
+                    DELETE FROM unpack_retry WHERE event_id = ANY(:event_ids) RETURNING event_id
+                )
+                INSERT INTO unpack_replayed (event_id) SELECT event_id FROM cleared
+                """
+            ),
+            {"event_ids": event_ids},
+        )
+
+
+def load_table_progress(conn):
+    return {row[0]: row[1] for row in conn.execute(text("SELECT table_name, last_event_id FROM unpack_table_progress"))}
+
+
+def save_table_progress(conn, table, event_id):
+    conn.execute(
+        text(
+            """
+            INSERT INTO unpack_table_progress (table_name, last_event_id, updated_at)
+            VALUES (:table_name, :event_id, now())
+            ON CONFLICT (table_name) DO UPDATE SET
+                last_event_id = GREATEST(unpack_table_progress.last_event_id, EXCLUDED.last_event_id),
+                updated_at = now()
+            """
+        ),
+        {"table_name": table, "event_id": int(event_id)},
+    )
+
+
+def note_loaded(conn, min_timestamp):
+    """Record, in the loader's transaction, the oldest timestamp it inserted."""
+    conn.execute(
+        text(
+            """
+            INSERT INTO unpack_pending (id, min_timestamp, load_seq)
+            VALUES (1, :min_timestamp, 1)
+            ON CONFLICT (id) DO UPDATE SET
+                min_timestamp = LEAST(unpack_pending.min_timestamp, EXCLUDED.min_timestamp),
+                load_seq = unpack_pending.load_seq + 1
+            """
+        ),
+        {"min_timestamp": min_timestamp},
+    )
+
+
+def get_pending(conn):
+    """Return (min_timestamp, load_seq); min_timestamp is None when unknown."""
+    row = conn.execute(text("SELECT min_timestamp, load_seq FROM unpack_pending WHERE id = 1")).first()
+    return (row[0], row[1]) if row else (None, 0)
+
+
+def clear_pending(conn, load_seq):
+    """Forget the bound once everything loaded up to load_seq is staged.
+    A load that committed in the meantime bumped load_seq and keeps it."""
+    conn.execute(
+        text("UPDATE unpack_pending SET min_timestamp = NULL WHERE id = 1 AND load_seq = :load_seq"),
+        {"load_seq": load_seq},
+    )